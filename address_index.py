@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+收件地址索引：在内存中维护所有已发送、已退信屏蔽或已退订的邮箱地址，发送前无需逐个查询数据库
+"""
+
+import hashlib
+import logging
+import threading
+from datetime import timedelta
+
+from sql_tools.storage import Error, connect_db
+
+from bounce_processor import normalize_address
+
+logger = logging.getLogger('email_sender')
+
+# 增量加载屏蔽地址时向前重叠的时间：updated_at由数据库按秒写入，更新时间早于已读到的最大值、
+# 但提交较晚的记录也能读到（重复读到的地址不影响结果）
+SUPPRESSION_OVERLAP = timedelta(minutes=1)
+
+
+# 将规范化后的地址压缩为64位整数键，比直接保存字符串节省大部分内存
+def address_key(address):
+    digest = hashlib.blake2b(normalize_address(address).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+class AddressIndex:
+    """
+    已发送/已屏蔽地址索引。首次refresh()全量加载，之后只加载新增或变化的记录；
+    本进程发送或记录退信时通过add_sent()/add_suppressed()即时更新。
+    """
+
+    def __init__(self, db_config):
+        self.db_config = db_config
+        self.sent = set()
+        self.suppressed = set()
+        self.ready = False
+        self._last_tracking_id = 0
+        self._last_suppression_time = None
+        self._lock = threading.Lock()
+
+    def add_sent(self, address):
+        with self._lock:
+            self.sent.add(address_key(address))
+
+    def add_suppressed(self, address):
+        with self._lock:
+            self.suppressed.add(address_key(address))
+
+    # 返回跳过该地址的原因：'suppressed'、'sent'，可以发送时返回None
+    def skip_reason(self, address):
+        key = address_key(address)
+        if key in self.suppressed:
+            return 'suppressed'
+        if key in self.sent:
+            return 'sent'
+        return None
+
+    def refresh(self):
+        """从email_tracking和email_suppression增量加载地址"""
+        connection = None
+        try:
+            connection = connect_db(self.db_config)
+            cursor = connection.cursor()
+
+            cursor.execute(
+                "SELECT id, email FROM email_tracking WHERE id > %s AND sent_time IS NOT NULL ORDER BY id",
+                (self._last_tracking_id,)
+            )
+            sent_loaded = 0
+            while True:
+                rows = cursor.fetchmany(5000)
+                if not rows:
+                    break
+                keys = [address_key(address) for _, address in rows]
+                with self._lock:
+                    self.sent.update(keys)
+                self._last_tracking_id = rows[-1][0]
+                sent_loaded += len(rows)
+
+            # 进度取已读到的最大updated_at（数据库时钟），不用本机时间，避免时钟偏差和秒内更新被漏掉。
+            # 不按is_suppressed过滤：解除屏蔽的地址也要读到并移出集合，否则要等重启才会恢复发送
+            suppressed_loaded = 0
+            released = 0
+            try:
+                if self._last_suppression_time is None:
+                    cursor.execute("SELECT email, is_suppressed, updated_at FROM email_suppression ORDER BY updated_at")
+                else:
+                    cursor.execute(
+                        "SELECT email, is_suppressed, updated_at FROM email_suppression "
+                        "WHERE updated_at >= %s ORDER BY updated_at",
+                        (self._last_suppression_time - SUPPRESSION_OVERLAP,)
+                    )
+                rows = cursor.fetchall()
+                with self._lock:
+                    for address, is_suppressed, _ in rows:
+                        key = address_key(address)
+                        if is_suppressed:
+                            self.suppressed.add(key)
+                            suppressed_loaded += 1
+                        elif key in self.suppressed:
+                            self.suppressed.discard(key)
+                            released += 1
+                latest = max((updated_at for _, _, updated_at in rows if updated_at is not None), default=None)
+                if latest is not None and (self._last_suppression_time is None
+                                           or latest > self._last_suppression_time):
+                    self._last_suppression_time = latest
+            except Error as e:
+                # 屏蔽表可能尚未创建，此时只使用已发送地址
+                logger.warning(f"加载屏蔽地址失败: {e}")
+
+            cursor.close()
+            self.ready = True
+            if sent_loaded or suppressed_loaded or released:
+                logger.info(f"地址索引已加载: 已发送 {sent_loaded} 个, 已屏蔽 {suppressed_loaded} 个, "
+                            f"解除屏蔽 {released} 个, "
+                            f"共 {len(self.sent)} / {len(self.suppressed)} 个")
+        except Error as e:
+            logger.error(f"加载地址索引失败: {e}")
+        finally:
+            if connection is not None and connection.is_connected():
+                connection.close()
+        return self.ready
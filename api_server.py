@@ -8,25 +8,32 @@ FastAPI服务器：提供API接口管理邮件发送系统
 import os
 import json
 import datetime
-import threading
-import time
-import logging
-import logging.handlers
 import asyncio
+import functools
 from typing import List, Dict, Optional, Union
 from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse
-import uvicorn
+from starlette.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-import requests
-import schedule
-import mysql.connector
-from mysql.connector import Error
+from sql_tools.storage import Error, connect_db
+from lazy_import import lazy_module
 
 from email_sender import EMAIL_CONFIG, load_template, init_connections
-from email_sender import send_email, maintain_connections, check_replies
-from sql_tools.mysql_connection import load_task_from_db, save_task_to_db
+from email_sender import send_email, maintain_connections
+from email_sender import start_reply_listener, stop_reply_listener
+from email_sender import get_address_index, skip_recipient
+from sql_tools.mysql_connection import delete_task_from_db, load_tasks_from_db, save_task_to_db
+from event_scheduler import EventScheduler, daily_at, every, next_daily_run
+from campaign_scheduler import SendCapacity, run_campaign
+from jobs import FINISHED_STATES, JobRegistry, SendJob
+from log_setup import setup_logging
+from event_bus import EventBus, format_sse
+from metrics import CONTENT_TYPE, REGISTRY
+from send_timing import RECORDER as send_timing_recorder
+from profiling import MAX_PROFILE_SECONDS, PROFILER
+
+# 只在获取统计和上报发送数时使用
+requests = lazy_module('requests')
 
 # 定义IP白名单
 ALLOWED_IPS = ["47.122.61.247", "127.0.0.1", "localhost"]
@@ -63,22 +70,65 @@ from config_loader import get_db_config
 # 数据库配置
 DB_CONFIG = get_db_config()
 
-# 全局配置
-EMAIL_TASK_CONFIG = {
-    'daily_count': 50,          # 每天发送的邮件数量
-    'target_countries': [],     # 目标国家列表，为空表示所有国家
-    'target_regions': [],       # 目标区域列表，为空表示所有区域
-    'send_time': '09:00',       # 每天发送邮件的时间，24小时制
-    'workdays': [0, 1, 2, 3, 4, 5, 6],  # 发送邮件的工作日(0-6分别代表周一到周日)，默认每天发送
-    'template_name': 'C_template.html', # 使用的邮件模板
-    'is_running': False,        # 是否正在运行定时任务
-    'last_run_date': None,      # 上次运行日期
-    'last_sent_count': 0,       # 上次发送数量
-    'last_opened_count': 0,     # 上次打开数量
-}
-
-# 任务线程
-scheduler_thread = None
+DEFAULT_TASK_NAME = 'default_task'
+
+# 创建一个营销活动的默认配置
+def new_campaign_config(task_name: str = DEFAULT_TASK_NAME) -> Dict:
+    return {
+        'task_name': task_name,     # 活动名称，对应task_scheduler表中的task_name
+        'daily_count': 50,          # 每天发送的邮件数量
+        'target_countries': [],     # 目标国家列表，为空表示所有国家
+        'target_regions': [],       # 目标区域列表，为空表示所有区域
+        'send_time': '09:00',       # 每天发送邮件的时间，24小时制
+        'workdays': [0, 1, 2, 3, 4, 5, 6],  # 发送邮件的工作日(0-6分别代表周一到周日)，默认每天发送
+        'template_name': 'C_template.html', # 使用的邮件模板
+        'is_running': False,        # 是否正在运行定时任务
+        'last_run_date': None,      # 上次运行日期
+        'last_sent_count': 0,       # 上次发送数量
+        'last_opened_count': 0,     # 上次打开数量
+        'max_concurrency': 1,       # 该活动可同时占用的发送槽位数（同时也是公平调度的权重）
+    }
+
+# 所有营销活动的配置，按task_name索引，各活动互相独立
+CAMPAIGNS = {DEFAULT_TASK_NAME: new_campaign_config()}
+
+# 默认活动的配置（兼容只使用一个活动的旧接口）
+EMAIL_TASK_CONFIG = CAMPAIGNS[DEFAULT_TASK_NAME]
+
+# 所有活动共享的发送槽位
+SEND_CAPACITY = SendCapacity(EMAIL_CONFIG.get('max_concurrent_sends', 4))
+
+# 实时事件总线，/events以SSE推送发送结果、打开和回复事件
+EVENT_BUS = EventBus()
+
+# SSE连接空闲时发送心跳的间隔（秒）
+SSE_HEARTBEAT_SECONDS = 15
+
+# 后台发送任务（/send-temp、/send-now），接口立即返回任务ID
+JOBS = JobRegistry()
+
+# 事件驱动的定时调度器，在启动时绑定到服务器的事件循环
+scheduler = EventScheduler()
+
+# 发送槽位、事件流和后台任务的状态指标
+REGISTRY.gauge('mailbox_send_slots_total', '所有活动共享的发送槽位数').set_function(
+    lambda: SEND_CAPACITY.total)
+REGISTRY.gauge('mailbox_send_slots_active', '正在使用的发送槽位数').set_function(
+    lambda: SEND_CAPACITY.active)
+REGISTRY.gauge('mailbox_send_slots_waiting', '等待发送槽位的工作线程数').set_function(
+    lambda: sum(state['waiting'] for state in SEND_CAPACITY.snapshot()['campaigns'].values()))
+REGISTRY.gauge('mailbox_send_pacing_rate_per_minute', '当前活动在发送间隔限制下每分钟最多发送的邮件数').set_function(
+    SEND_CAPACITY.pacing_rate)
+REGISTRY.gauge('mailbox_event_subscribers', '实时事件流的订阅者数').set_function(
+    lambda: len(EVENT_BUS.subscribers))
+REGISTRY.gauge('mailbox_event_queue_depth', '所有订阅者队列中待推送的事件数').set_function(
+    lambda: EVENT_BUS.stats()['queued'])
+_jobs_gauge = REGISTRY.gauge('mailbox_jobs', '后台发送任务数', ['status'])
+for _status in ('queued', 'running'):
+    _jobs_gauge.labels(status=_status).set_function(
+        lambda status=_status: sum(1 for job in JOBS.list() if job.status == status))
+REGISTRY.gauge('mailbox_scheduled_jobs', '调度器中的定时任务数').set_function(
+    lambda: len(scheduler.jobs))
 
 # 加载区域和国家对应关系
 def load_regions():
@@ -91,43 +141,25 @@ def load_regions():
 # 区域到国家的映射关系
 REGION_COUNTRIES = load_regions()
 
-# 配置日志
-def setup_logging():
-    """配置日志系统"""
-    logger = logging.getLogger('email_tracker')
-    logger.setLevel(logging.INFO)
-    
-    # 添加系统日志处理器
-    syslog_handler = logging.handlers.SysLogHandler(address='/dev/log')
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    syslog_handler.setFormatter(formatter)
-    logger.addHandler(syslog_handler)
-    
-    # 添加控制台处理器
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-    
-    return logger
-
-# 创建日志记录器
-logger = setup_logging()
+# 创建日志记录器：与email_sender共用logs/sender.log，另外写入系统日志
+logger = setup_logging('email_tracker', 'logs/sender.log', syslog=True)
 
 # 添加数据库操作错误记录
 def log_db_error(operation: str, error: Exception):
     """记录数据库操作错误"""
     error_msg = f"数据库操作[{operation}]失败: {str(error)}"
     logger.error(error_msg)
-    print(error_msg)
 
 # API请求和响应模型
 class EmailTaskConfig(BaseModel):
+    task_name: str = DEFAULT_TASK_NAME  # 活动名称，不同名称的活动互相独立
     daily_count: int
     target_countries: List[str] = []
     target_regions: List[str] = []  # 新增区域字段
     send_time: str
     workdays: List[int] = [0, 1, 2, 3, 4, 5, 6]  # 发送邮件的工作日(0-6分别代表周一到周日)，默认每天发送
     template_name: str = "C_template.html"  # 默认使用C模板
+    max_concurrency: int = 1  # 该活动可同时占用的发送槽位数
 
 class TempSendConfig(BaseModel):
     count: int  # 要发送的邮件数量
@@ -136,6 +168,7 @@ class TempSendConfig(BaseModel):
     template_name: str = "C_template.html"  # 使用的邮件模板
 
 class EmailTaskStatus(BaseModel):
+    task_name: str = DEFAULT_TASK_NAME
     is_running: bool
     daily_count: int
     target_countries: List[str]
@@ -146,6 +179,14 @@ class EmailTaskStatus(BaseModel):
     last_run_date: Optional[str] = None
     last_sent_count: int = 0
     last_opened_count: int = 0
+    max_concurrency: int = 1
+
+class ProfileConfig(BaseModel):
+    mode: str = "sampling"      # sampling（采样，覆盖所有线程）或cprofile（发送线程的确定性分析）
+    target: str = "window"      # window（立即开始，持续duration秒）或next_send（分析下一次发送任务）
+    duration: float = 60        # 最长分析时间（秒），到时自动停止
+    interval: float = 0.005     # 采样间隔（秒），仅sampling模式
+    thread_prefix: Optional[str] = None  # 只采样名称以此开头的线程，例如"campaign-"
 
 class EmailStats(BaseModel):
     date: str  # 可以是单个日期或逗号分隔的多个日期
@@ -158,14 +199,10 @@ class EmailStats(BaseModel):
     dates: List[str] = []  # 新增字段，存储已处理的日期列表
 
 # 保存和加载配置
-def save_config():
-    """保存配置到JSON文件，处理datetime对象转换为字符串"""
-    config_dir = os.path.join(os.path.dirname(__file__), 'config')
-    os.makedirs(config_dir, exist_ok=True)
-    
-    # 创建配置的副本，处理datetime对象
+def _serialize_config(task_config: Dict) -> Dict:
+    """创建配置的副本，处理datetime对象"""
     config_copy = {}
-    for key, value in EMAIL_TASK_CONFIG.items():
+    for key, value in task_config.items():
         # 如果是datetime对象，转换为字符串
         if isinstance(value, datetime.datetime):
             config_copy[key] = value.strftime('%Y-%m-%d %H:%M:%S')
@@ -174,14 +211,26 @@ def save_config():
             config_copy[key] = value.strftime('%Y-%m-%d')
         else:
             config_copy[key] = value
+    return config_copy
+
+def save_config():
+    """保存配置到JSON文件：默认活动保存到api_config.json，所有活动保存到campaigns.json"""
+    config_dir = os.path.join(os.path.dirname(__file__), 'config')
+    os.makedirs(config_dir, exist_ok=True)
     
     config_path = os.path.join(config_dir, 'api_config.json')
     with open(config_path, 'w', encoding='utf-8') as f:
-        json.dump(config_copy, f, ensure_ascii=False, indent=2)
+        json.dump(_serialize_config(EMAIL_TASK_CONFIG), f, ensure_ascii=False, indent=2)
+    
+    campaigns_path = os.path.join(config_dir, 'campaigns.json')
+    with open(campaigns_path, 'w', encoding='utf-8') as f:
+        json.dump([_serialize_config(task_config) for task_config in list(CAMPAIGNS.values())],
+                  f, ensure_ascii=False, indent=2)
 
 def load_config():
     config_dir = os.path.join(os.path.dirname(__file__), 'config')
     config_path = os.path.join(config_dir, 'api_config.json')
+    campaigns_path = os.path.join(config_dir, 'campaigns.json')
     
     if os.path.exists(config_path):
         with open(config_path, 'r', encoding='utf-8') as f:
@@ -191,6 +240,28 @@ def load_config():
             for key, value in config.items():
                 if key in EMAIL_TASK_CONFIG:
                     EMAIL_TASK_CONFIG[key] = value
+    
+    if os.path.exists(campaigns_path):
+        with open(campaigns_path, 'r', encoding='utf-8') as f:
+            for config in json.load(f):
+                update_campaign(config)
+
+# 用加载到的配置更新（或创建）对应的活动
+def update_campaign(task_config: Dict) -> Dict:
+    task_name = task_config.get('task_name') or DEFAULT_TASK_NAME
+    campaign = CAMPAIGNS.setdefault(task_name, new_campaign_config(task_name))
+    for key, value in task_config.items():
+        if key in campaign:
+            campaign[key] = value
+    campaign['task_name'] = task_name
+    return campaign
+
+# 获取活动配置，不存在时返回404
+def get_campaign(task_name: str) -> Dict:
+    campaign = CAMPAIGNS.get(task_name)
+    if campaign is None:
+        raise HTTPException(status_code=404, detail=f"活动 {task_name} 不存在")
+    return campaign
 
 # 从数据库获取收件人列表
 def get_recipients_from_db(count: int, countries: List[str] = None) -> List[Dict]:
@@ -198,12 +269,7 @@ def get_recipients_from_db(count: int, countries: List[str] = None) -> List[Dict
     
     try:
         # 创建数据库连接
-        connection = mysql.connector.connect(
-            host=DB_CONFIG['host'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            database=DB_CONFIG['database']
-        )
+        connection = connect_db(DB_CONFIG)
         
         if connection.is_connected():
             cursor = connection.cursor(dictionary=True)
@@ -243,9 +309,9 @@ def get_recipients_from_db(count: int, countries: List[str] = None) -> List[Dict
             connection.close()
     
     except Error as e:
-        print(f"数据库操作失败: {e}")
+        logger.error(f"数据库操作失败: {e}")
     except Exception as e:
-        print(f"加载收件人列表失败: {e}")
+        logger.error(f"加载收件人列表失败: {e}")
     
     return recipients
 
@@ -288,12 +354,7 @@ def get_email_stats(date=None, get_all=False):
     
     # 首先尝试从数据库获取统计数据
     try:
-        connection = mysql.connector.connect(
-            host=DB_CONFIG['host'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            database=DB_CONFIG['database']
-        )
+        connection = connect_db(DB_CONFIG)
         
         if connection.is_connected():
             cursor = connection.cursor(dictionary=True)
@@ -332,7 +393,7 @@ def get_email_stats(date=None, get_all=False):
                 replied_result = cursor.fetchone()
                 stats['replied_count'] = replied_result['count'] if replied_result else 0
                 
-                print(f"从数据库获取到全部统计信息: 总共发送 {stats['sent_count']} 封，已打开 {stats['opened_count']} 封，已回复 {stats['replied_count']} 封")
+                logger.info(f"从数据库获取到全部统计信息: 总共发送 {stats['sent_count']} 封，已打开 {stats['opened_count']} 封，已回复 {stats['replied_count']} 封")
             else:
                 # 处理一个或多个日期的查询
                 for single_date in dates_to_query:
@@ -379,7 +440,7 @@ def get_email_stats(date=None, get_all=False):
                     daily_replied = replied_result['count'] if replied_result else 0
                     stats['replied_count'] += daily_replied
                     
-                    print(f"从数据库获取到指定日期({single_date})统计信息: 已发送 {daily_sent} 封，已打开 {daily_opened} 封，已回复 {daily_replied} 封")
+                    logger.info(f"从数据库获取到指定日期({single_date})统计信息: 已发送 {daily_sent} 封，已打开 {daily_opened} 封，已回复 {daily_replied} 封")
             
             # 计算打开率和回复率
             stats['open_rate'] = (stats['opened_count'] / stats['sent_count'] * 100) if stats['sent_count'] > 0 else 0
@@ -391,7 +452,7 @@ def get_email_stats(date=None, get_all=False):
             return stats
             
     except Error as e:
-        print(f"从数据库获取统计信息失败: {e}")
+        logger.error(f"从数据库获取统计信息失败: {e}")
     
     # 如果从数据库获取失败，则尝试从跟踪服务器获取
     try:
@@ -413,10 +474,10 @@ def get_email_stats(date=None, get_all=False):
                 'dates': dates_to_query if not get_all else []
             }
             
-            print(f"从跟踪服务器获取到统计信息: 已发送 {stats['sent_count']} 封，已打开 {stats['opened_count']} 封")
+            logger.info(f"从跟踪服务器获取到统计信息: 已发送 {stats['sent_count']} 封，已打开 {stats['opened_count']} 封")
             return stats
     except Exception as e:
-        print(f"从跟踪服务器获取统计信息失败: {e}")
+        logger.warning(f"从跟踪服务器获取统计信息失败: {e}")
     
     return stats
 
@@ -429,97 +490,116 @@ def expand_regions_to_countries(regions: List[str]) -> List[str]:
             countries.extend(REGION_COUNTRIES[region])
     return countries
 
+# 生成发送前的跳过检查：历史上已发送过或已屏蔽的地址直接跳过，不占用发送槽位和发送间隔
+def make_skip_func(address_index):
+    def skip(recipient):
+        return skip_recipient(recipient.get('email', '').strip(), recipient.get('id'), address_index)
+    return skip
+
+# 生成发送函数：使用活动自己的模板，并在cProfile分析会话运行时分析发送线程
+def make_send_func(template: str):
+    def send(recipient):
+        with PROFILER.thread_scope():
+            return send_email(recipient, template)
+    return send
+
+# 生成每个收件人处理完成后的回调：更新后台任务进度并发布发送事件
+def make_result_handler(campaign_name: str, job: Optional[SendJob] = None):
+    def on_result(recipient, outcome):
+        if job:
+            job.record(recipient, outcome)
+        EVENT_BUS.publish('send', {
+            'campaign': campaign_name,
+            'job_id': job.id if job else None,
+            'email': recipient.get('email'),
+            'company': recipient.get('company'),
+            'outcome': outcome
+        })
+    return on_result
+
 # 发送邮件任务
-async def email_sending_task():
-    """执行邮件发送任务"""
-    print(f"开始执行邮件发送任务...")
+def email_sending_task(task_name: str = DEFAULT_TASK_NAME, job: Optional[SendJob] = None):
+    """执行指定活动的邮件发送任务，多个活动可同时执行并公平共享发送槽位；job用于记录进度和取消"""
+    logger.info(f"开始执行活动 {task_name} 的邮件发送任务...")
     
-    if not EMAIL_TASK_CONFIG['is_running']:
-        print("任务未启动")
+    task_config = CAMPAIGNS.get(task_name)
+    if not task_config or not task_config['is_running']:
+        logger.info("任务未启动")
         return 0
         
     # 检查是否是今天已经运行过
     today = datetime.datetime.now().strftime('%Y-%m-%d')
-    if EMAIL_TASK_CONFIG['last_run_date'] == today:
-        print("今天已经运行过任务")
+    if task_config['last_run_date'] == today:
+        logger.info("今天已经运行过任务")
         return 0
 
     # 准备发送邮件的参数
     countries_to_send = []
     
     # 处理区域或国家（优先使用区域）
-    if EMAIL_TASK_CONFIG['target_regions'] and len(EMAIL_TASK_CONFIG['target_regions']) > 0:
+    if task_config['target_regions'] and len(task_config['target_regions']) > 0:
         # 如果指定了区域，将区域扩展为对应的国家列表
-        countries_to_send = expand_regions_to_countries(EMAIL_TASK_CONFIG['target_regions'])
-        print(f"按区域发送邮件: {', '.join(EMAIL_TASK_CONFIG['target_regions'])}")
-    elif EMAIL_TASK_CONFIG['target_countries'] and len(EMAIL_TASK_CONFIG['target_countries']) > 0:
+        countries_to_send = expand_regions_to_countries(task_config['target_regions'])
+        logger.info(f"按区域发送邮件: {', '.join(task_config['target_regions'])}")
+    elif task_config['target_countries'] and len(task_config['target_countries']) > 0:
         # 如果只指定了国家列表，则直接使用
-        countries_to_send = list(EMAIL_TASK_CONFIG['target_countries'])
-        print(f"按国家发送邮件: {', '.join(EMAIL_TASK_CONFIG['target_countries'])}")
+        countries_to_send = list(task_config['target_countries'])
+        logger.info(f"按国家发送邮件: {', '.join(task_config['target_countries'])}")
     else:
-        print(f"未指定目标区域或国家，将发送给所有国家")
+        logger.info(f"未指定目标区域或国家，将发送给所有国家")
     
-    print(f"目标国家列表：{countries_to_send}")
+    logger.info(f"目标国家列表：{countries_to_send}")
     
     # 获取收件人
-    recipients = get_recipients_from_db(EMAIL_TASK_CONFIG['daily_count'] * 3, countries_to_send)
+    recipients = get_recipients_from_db(task_config['daily_count'] * 3, countries_to_send)
     if not recipients:
-        print("没有符合条件的收件人")
+        logger.info("没有符合条件的收件人")
         return 0
     
-    print(f"找到 {len(recipients)} 个潜在收件人")
+    logger.info(f"找到 {len(recipients)} 个潜在收件人")
     
-    # 获取要使用的模板名称
-    template_name = EMAIL_TASK_CONFIG['template_name']
-    print(f"使用邮件模板: {template_name}")
-    
-    # 加载邮件模板
-    load_template(template_name)
+    # 获取要使用的模板名称，各活动使用自己的模板
+    template_name = task_config['template_name']
+    logger.info(f"使用邮件模板: {template_name}")
+    template = load_template(template_name)
     
     # 初始化连接
     init_connections()
     
-    # 发送邮件
-    success_count = 0
-    target_success_count = EMAIL_TASK_CONFIG['daily_count']  # 目标成功发送数量
-    processed_emails = set()  # 用于跟踪已处理的邮箱地址
+    # 增量刷新已发送/已屏蔽地址索引
+    address_index = get_address_index()
+    address_index.refresh()
+    
+    # 发送邮件，与其他正在执行的活动共享发送槽位
+    with PROFILER.run_scope():
+        success_count = run_campaign(
+            task_name,
+            recipients,
+            task_config['daily_count'],
+            make_send_func(template),
+            SEND_CAPACITY,
+            concurrency=task_config.get('max_concurrency', 1),
+            skip_func=make_skip_func(address_index),
+            stop_event=job.stop_event if job else None,
+            on_result=make_result_handler(task_name, job)
+        )
     
-    # 尝试发送邮件给获取的收件人
-    for recipient in recipients:
-        # 检查是否已达到目标数量
-        if success_count >= target_success_count:
-            break
-            
-        # 检查是否已处理过该邮箱
-        recipient_email = recipient.get('email', '').strip().upper()
-        if not recipient_email or recipient_email in processed_emails:
-            continue
-            
-        # 标记该邮箱已处理
-        processed_emails.add(recipient_email)
-        
-        # 尝试发送邮件
-        if send_email(recipient):
-            success_count += 1
-            print(f"成功发送至 {recipient_email}，当前进度: {success_count}/{target_success_count}")
+    # 更新任务状态
+    task_config['last_run_date'] = today
+    task_config['last_sent_count'] = success_count
+    
+    # 发送期间活动已被删除时不再保存，否则会重新写回数据库
+    if CAMPAIGNS.get(task_name) is task_config:
+        # 保存到数据库
+        if save_task_to_db(task_config):
+            logger.info("成功更新任务状态到数据库")
         else:
-            print(f"发送至 {recipient_email} 失败或已经发送过，跳过")
+            logger.error("保存任务状态到数据库失败")
             
-        # 短暂延迟，避免被识别为垃圾邮件发送者
-        await asyncio.sleep(5)
-    
-    # 更新任务状态
-    EMAIL_TASK_CONFIG['last_run_date'] = today
-    EMAIL_TASK_CONFIG['last_sent_count'] = success_count
-    
-    # 保存到数据库
-    if save_task_to_db(EMAIL_TASK_CONFIG):
-        print("成功更新任务状态到数据库")
+        # 保存到配置文件作为备份
+        save_config()
     else:
-        print("保存任务状态到数据库失败")
-        
-    # 保存到配置文件作为备份
-    save_config()
+        logger.info(f"活动 {task_name} 已删除，不保存任务状态")
     
     # 更新跟踪服务器的发送统计
     try:
@@ -528,15 +608,15 @@ async def email_sending_task():
             json={'sent': success_count}
         )
     except Exception as e:
-        print(f"更新跟踪服务器统计信息失败: {e}")
+        logger.warning(f"更新跟踪服务器统计信息失败: {e}")
     
-    print(f"邮件发送任务完成，成功发送: {success_count} 封邮件")
+    logger.info(f"活动 {task_name} 的邮件发送任务完成，成功发送: {success_count} 封邮件")
     return success_count
 
 # 临时发送邮件任务
-def temp_email_sending_task(count: int, target_countries: List[str] = None, target_regions: List[str] = None, template_name: str = "C_template.html"):
-    """临时发送指定数量的邮件到目标国家或区域"""
-    print(f"开始执行临时邮件发送任务 - {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+def temp_email_sending_task(count: int, target_countries: List[str] = None, target_regions: List[str] = None, template_name: str = "C_template.html", job: Optional[SendJob] = None):
+    """临时发送指定数量的邮件到目标国家或区域，job用于记录进度和取消"""
+    logger.info(f"开始执行临时邮件发送任务 - {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
     # 处理区域或国家
     countries_to_send = []
@@ -545,71 +625,63 @@ def temp_email_sending_task(count: int, target_countries: List[str] = None, targ
     if target_regions and len(target_regions) > 0:
         # 如果指定了区域，将区域扩展为对应的国家列表
         countries_to_send = expand_regions_to_countries(target_regions)
-        print(f"按区域发送邮件: {', '.join(target_regions)}")
+        logger.info(f"按区域发送邮件: {', '.join(target_regions)}")
     elif target_countries and len(target_countries) > 0:
         # 如果只指定了国家列表，则直接使用
         countries_to_send = list(target_countries)
-        print(f"按国家发送邮件: {', '.join(target_countries)}")
+        logger.info(f"按国家发送邮件: {', '.join(target_countries)}")
     else:
-        print(f"未指定目标区域或国家，将发送给所有国家")
+        logger.info(f"未指定目标区域或国家，将发送给所有国家")
     
-    print(f"目标国家列表：{countries_to_send}")
+    logger.info(f"目标国家列表：{countries_to_send}")
     
     # 获取所有可能满足条件的收件人（多获取一些以应对发送失败的情况）
     all_potential_recipients = get_recipients_from_db(count * 3, countries_to_send)
     
     if not all_potential_recipients:
-        print("没有符合条件的收件人")
+        logger.info("没有符合条件的收件人")
         return {"success": False, "sent_count": 0, "message": "没有符合条件的收件人"}
     
-    print(f"找到 {len(all_potential_recipients)} 个潜在收件人")
+    logger.info(f"找到 {len(all_potential_recipients)} 个潜在收件人")
     
     # 获取要使用的模板名称
-    print(f"使用邮件模板: {template_name}")
+    logger.info(f"使用邮件模板: {template_name}")
     
     # 加载邮件模板
-    load_template(template_name)
+    template = load_template(template_name)
     
     # 初始化连接
     init_connections()
     
-    # 发送邮件
-    success_count = 0
-    target_success_count = count  # 目标成功发送数量
-    processed_emails = set()  # 用于跟踪已处理的邮箱地址
+    # 增量刷新已发送/已屏蔽地址索引
+    address_index = get_address_index()
+    address_index.refresh()
     
-    # 尝试发送邮件给获取的收件人
-    for recipient in all_potential_recipients:
-        # 检查是否已达到目标数量
-        if success_count >= target_success_count:
-            break
-            
-        # 检查是否已处理过该邮箱
-        recipient_email = recipient.get('email', '').strip().upper()
-        if not recipient_email or recipient_email in processed_emails:
-            continue
-            
-        # 标记该邮箱已处理
-        processed_emails.add(recipient_email)
-        
-        # 尝试发送邮件
-        if send_email(recipient):
-            success_count += 1
-            print(f"成功发送至 {recipient_email}，当前进度: {success_count}/{target_success_count}")
-        else:
-            print(f"发送至 {recipient_email} 失败或已经发送过，跳过")
-            
-        # 短暂延迟，避免被识别为垃圾邮件发送者
-        time.sleep(5)
+    # 发送邮件，临时任务同样占用共享的发送槽位
+    target_success_count = count  # 目标成功发送数量
+    campaign_name = f"temp-{job.id[:8]}" if job else f"temp-{datetime.datetime.now().strftime('%H%M%S%f')}"
+    with PROFILER.run_scope():
+        success_count = run_campaign(
+            campaign_name,
+            all_potential_recipients,
+            target_success_count,
+            make_send_func(template),
+            SEND_CAPACITY,
+            skip_func=make_skip_func(address_index),
+            stop_event=job.stop_event if job else None,
+            on_result=make_result_handler(campaign_name, job)
+        )
     
     # 如果处理完所有收件人后仍未达到目标数量
-    if success_count < target_success_count:
-        print(f"已处理所有可用的收件人，但未达到目标数量。成功数量: {success_count}/{target_success_count}")
-        print(f"请检查数据库中是否有足够的未发送邮件的联系人")
+    if job and job.cancelled:
+        logger.info(f"临时发送任务已取消。成功数量: {success_count}/{target_success_count}")
+    elif success_count < target_success_count:
+        logger.warning(f"已处理所有可用的收件人，但未达到目标数量。成功数量: {success_count}/{target_success_count}")
+        logger.warning(f"请检查数据库中是否有足够的未发送邮件的联系人")
     else:
-        print(f"成功完成发送目标: {success_count}/{target_success_count}")
+        logger.info(f"成功完成发送目标: {success_count}/{target_success_count}")
     
-    print(f"邮件发送完成。成功: {success_count}/{target_success_count}")
+    logger.info(f"邮件发送完成。成功: {success_count}/{target_success_count}")
     
     # 更新跟踪服务器的发送统计
     try:
@@ -618,7 +690,7 @@ def temp_email_sending_task(count: int, target_countries: List[str] = None, targ
             json={'sent': success_count}
         )
     except Exception as e:
-        print(f"更新跟踪服务器统计信息失败: {e}")
+        logger.warning(f"更新跟踪服务器统计信息失败: {e}")
     
     return {
         "success": True, 
@@ -626,49 +698,22 @@ def temp_email_sending_task(count: int, target_countries: List[str] = None, targ
         "message": f"已发送 {success_count} 封邮件"
     }
 
-def get_next_run_time():
-    """获取下一次任务执行的时间"""
-    if not EMAIL_TASK_CONFIG['is_running']:
+# 活动在调度器中的任务名称
+def campaign_job_name(task_name: str) -> str:
+    return f"email_sending_task:{task_name}"
+
+def get_next_run_time(task_name: str = DEFAULT_TASK_NAME):
+    """获取指定活动下一次任务执行的时间"""
+    task_config = CAMPAIGNS.get(task_name)
+    if not task_config or not task_config['is_running']:
         return "未知"
 
     now = datetime.datetime.now()
     
-    # 获取当前小时和分钟
-    current_hour = now.hour
-    current_minute = now.minute
-    
-    # 解析设置的发送时间
-    send_time_parts = EMAIL_TASK_CONFIG['send_time'].split(':')
-    send_hour = int(send_time_parts[0])
-    send_minute = int(send_time_parts[1])
-    
-    # 获取今天的发送时间
-    today_send_time = now.replace(hour=send_hour, minute=send_minute, second=0, microsecond=0)
-    
-    # 检查今天是否是工作日
-    is_today_workday = now.weekday() in EMAIL_TASK_CONFIG['workdays']
-    
-    # 判断下一次发送时间
-    next_run = None
-    
-    # 如果今天是工作日且当前时间小于发送时间，则下一次发送时间是今天
-    if is_today_workday and now < today_send_time:
-        next_run = today_send_time
-    else:
-        # 否则寻找下一个工作日
-        next_day = now.date() + datetime.timedelta(days=1)
-        days_to_add = 1
-        
-        # 寻找下一个工作日
-        while days_to_add < 8:  # 最多循环7天，避免无限循环
-            if next_day.weekday() in EMAIL_TASK_CONFIG['workdays']:
-                next_run = datetime.datetime.combine(
-                    next_day,
-                    datetime.time(hour=send_hour, minute=send_minute)
-                )
-                break
-            next_day = next_day + datetime.timedelta(days=1)
-            days_to_add += 1
+    # 优先使用调度器中已计算好的执行时间
+    next_run = scheduler.next_run_time(campaign_job_name(task_name)) or next_daily_run(
+        task_config['send_time'], task_config['workdays'], now
+    )
     
     if not next_run:
         return "未知"
@@ -699,50 +744,40 @@ def get_next_run_time():
     
     return result
 
-# 创建一个包装函数来执行异步任务
-def run_async_task(coroutine_func):
-    """包装异步任务，使其可以在同步环境中运行"""
-    import asyncio
+# 根据任务配置设置定时任务
+def schedule_email_task(task_name: str = DEFAULT_TASK_NAME):
+    """按活动的工作日和发送时间添加发送任务（替换该活动之前的调度），并添加连接维护任务和回复监听"""
+    task_config = CAMPAIGNS[task_name]
+    scheduler.add_job(
+        campaign_job_name(task_name),
+        daily_at(task_config['send_time'], task_config['workdays']),
+        functools.partial(email_sending_task, task_name)
+    )
+    scheduler.add_job('maintain_connections', every(30 * 60), maintain_connections)
     
-    # 获取当前事件循环或创建新的事件循环
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    
-    # 运行异步任务直到完成
-    return loop.run_until_complete(coroutine_func())
-
-# 修改定时任务调度器
-def run_scheduler():
-    """运行定时任务调度器，并显示倒计时"""
-    last_print_time = 0
-    print_interval = 300  # 每5分钟打印一次倒计时
-
-    while EMAIL_TASK_CONFIG['is_running']:
-        current_time = time.time()
-        
-        # 每隔5分钟显示一次倒计时
-        if current_time - last_print_time >= print_interval:
-            next_run_time = get_next_run_time()
-            log_message = f"距离下次发送任务还有: {next_run_time}"
-            logger.info(log_message)
-            last_print_time = current_time
-            
-        schedule.run_pending()
-        time.sleep(1)  # 改为1秒检查一次，提高定时任务的准确性
+    # 回复由IMAP IDLE监听线程实时检查
+    start_reply_listener()
+    
+    logger.info(f"活动 {task_name} 距离下次发送任务还有: {get_next_run_time(task_name)}")
+
+# 取消活动的定时任务，没有运行中的活动时同时停止连接维护和回复监听
+def unschedule_email_task(task_name: str):
+    scheduler.cancel(campaign_job_name(task_name))
+    if not any(task_config['is_running'] for task_config in CAMPAIGNS.values()):
+        scheduler.cancel_all()
+        stop_reply_listener()
 
 # 修改邮件发送任务完成后的处理
-def update_task_status(success_count: int):
+def update_task_status(success_count: int, task_name: str = DEFAULT_TASK_NAME):
     """更新任务状态到数据库"""
-    EMAIL_TASK_CONFIG['last_sent_count'] = success_count
+    task_config = CAMPAIGNS[task_name]
+    task_config['last_sent_count'] = success_count
     stats = get_email_stats()
-    EMAIL_TASK_CONFIG['last_opened_count'] = stats['opened_count']
+    task_config['last_opened_count'] = stats['opened_count']
     
     # 保存到数据库
     try:
-        if not save_task_to_db(EMAIL_TASK_CONFIG):
+        if not save_task_to_db(task_config):
             log_db_error("更新任务状态", Exception("保存失败"))
     except Exception as e:
         log_db_error("更新任务状态", e)
@@ -752,131 +787,149 @@ def update_task_status(success_count: int):
 async def root():
     return {"message": "邮件发送系统API服务已启动"}
 
-@app.get("/status", response_model=EmailTaskStatus, tags=["任务状态"])
-async def get_status():
-    """获取当前邮件发送任务的状态"""
-    status = {
-        "is_running": EMAIL_TASK_CONFIG['is_running'],
-        "daily_count": EMAIL_TASK_CONFIG['daily_count'],
-        "target_countries": EMAIL_TASK_CONFIG['target_countries'],
-        "target_regions": EMAIL_TASK_CONFIG['target_regions'],
-        "send_time": EMAIL_TASK_CONFIG['send_time'],
-        "workdays": EMAIL_TASK_CONFIG['workdays'],
-        "template_name": EMAIL_TASK_CONFIG['template_name'],
-        "last_run_date": EMAIL_TASK_CONFIG['last_run_date'],
-        "last_sent_count": EMAIL_TASK_CONFIG['last_sent_count'],
-        "last_opened_count": EMAIL_TASK_CONFIG['last_opened_count']
+# 生成活动的状态信息
+def build_status(task_config: Dict) -> Dict:
+    return {
+        "task_name": task_config['task_name'],
+        "is_running": task_config['is_running'],
+        "daily_count": task_config['daily_count'],
+        "target_countries": task_config['target_countries'],
+        "target_regions": task_config['target_regions'],
+        "send_time": task_config['send_time'],
+        "workdays": task_config['workdays'],
+        "template_name": task_config['template_name'],
+        "last_run_date": task_config['last_run_date'],
+        "last_sent_count": task_config['last_sent_count'],
+        "last_opened_count": task_config['last_opened_count'],
+        "max_concurrency": task_config.get('max_concurrency', 1)
     }
+
+@app.get("/status", response_model=EmailTaskStatus, tags=["任务状态"])
+async def get_status(task_name: str = DEFAULT_TASK_NAME):
+    """获取邮件发送任务的状态，task_name为活动名称，默认为default_task"""
+    task_config = get_campaign(task_name)
+    status = build_status(task_config)
     
     # 添加状态描述
     weekdays_names = {0: "周一", 1: "周二", 2: "周三", 3: "周四", 4: "周五", 5: "周六", 6: "周日"}
-    workdays_str = ", ".join([weekdays_names[day] for day in EMAIL_TASK_CONFIG['workdays']])
-    countries_str = ", ".join(EMAIL_TASK_CONFIG['target_countries']) if EMAIL_TASK_CONFIG['target_countries'] else "所有国家"
-    regions_str = ", ".join(EMAIL_TASK_CONFIG['target_regions']) if EMAIL_TASK_CONFIG['target_regions'] else "无指定区域"
-    
-    status_description = f"任务状态：{'运行中' if EMAIL_TASK_CONFIG['is_running'] else '已停止'}\n"
-    status_description += f"每日发送数量：{EMAIL_TASK_CONFIG['daily_count']}\n"
-    status_description += f"发送时间：{workdays_str} {EMAIL_TASK_CONFIG['send_time']}\n"
+    workdays_str = ", ".join([weekdays_names[day] for day in task_config['workdays']])
+    countries_str = ", ".join(task_config['target_countries']) if task_config['target_countries'] else "所有国家"
+    regions_str = ", ".join(task_config['target_regions']) if task_config['target_regions'] else "无指定区域"
+    
+    status_description = f"活动名称：{task_name}\n"
+    status_description += f"任务状态：{'运行中' if task_config['is_running'] else '已停止'}\n"
+    status_description += f"每日发送数量：{task_config['daily_count']}\n"
+    status_description += f"发送时间：{workdays_str} {task_config['send_time']}\n"
     status_description += f"目标国家：{countries_str}\n"
     status_description += f"目标区域：{regions_str}\n"
-    status_description += f"使用模板：{EMAIL_TASK_CONFIG['template_name']}\n"
+    status_description += f"使用模板：{task_config['template_name']}\n"
+    status_description += f"并发配额：{task_config.get('max_concurrency', 1)}\n"
     
-    if EMAIL_TASK_CONFIG['last_run_date']:
-        status_description += f"上次运行日期：{EMAIL_TASK_CONFIG['last_run_date']}\n"
-        status_description += f"上次发送数量：{EMAIL_TASK_CONFIG['last_sent_count']}\n"
-        status_description += f"上次打开数量：{EMAIL_TASK_CONFIG['last_opened_count']}"
+    if task_config['last_run_date']:
+        status_description += f"上次运行日期：{task_config['last_run_date']}\n"
+        status_description += f"上次发送数量：{task_config['last_sent_count']}\n"
+        status_description += f"上次打开数量：{task_config['last_opened_count']}"
     
-    if EMAIL_TASK_CONFIG['is_running']:
-        next_run = get_next_run_time()
+    if task_config['is_running']:
+        next_run = get_next_run_time(task_name)
         status_description += f"\n{next_run}"
     
-    print(f"状态详情:\n{status_description}")
+    logger.info(f"状态详情:\n{status_description}")
     return status
 
+@app.get("/campaigns", tags=["任务状态"])
+async def list_campaigns():
+    """列出所有营销活动的状态以及共享发送槽位的使用情况"""
+    return {
+        "campaigns": [build_status(task_config) for task_config in list(CAMPAIGNS.values())],
+        "capacity": SEND_CAPACITY.snapshot()
+    }
+
 @app.post("/start", response_model=EmailTaskStatus, tags=["任务控制"])
 async def start_task(config: EmailTaskConfig, background_tasks: BackgroundTasks):
-    """启动邮件发送任务"""
-    global scheduler_thread
-    
-    if EMAIL_TASK_CONFIG['is_running']:
-        raise HTTPException(status_code=400, detail="任务已在运行中")
+    """启动邮件发送任务，不同task_name的活动可以同时运行"""
+    task_config = CAMPAIGNS.get(config.task_name)
+    if task_config and task_config['is_running']:
+        raise HTTPException(status_code=400, detail=f"活动 {config.task_name} 已在运行中")
+    if config.max_concurrency < 1:
+        raise HTTPException(status_code=400, detail="max_concurrency必须大于0")
     
     # 更新配置
-    EMAIL_TASK_CONFIG['daily_count'] = config.daily_count
-    EMAIL_TASK_CONFIG['target_countries'] = config.target_countries
-    EMAIL_TASK_CONFIG['target_regions'] = config.target_regions
-    EMAIL_TASK_CONFIG['send_time'] = config.send_time
-    EMAIL_TASK_CONFIG['workdays'] = config.workdays
-    EMAIL_TASK_CONFIG['template_name'] = config.template_name
-    EMAIL_TASK_CONFIG['is_running'] = True
+    task_config = CAMPAIGNS.setdefault(config.task_name, new_campaign_config(config.task_name))
+    task_config['daily_count'] = config.daily_count
+    task_config['target_countries'] = config.target_countries
+    task_config['target_regions'] = config.target_regions
+    task_config['send_time'] = config.send_time
+    task_config['workdays'] = config.workdays
+    task_config['template_name'] = config.template_name
+    task_config['max_concurrency'] = config.max_concurrency
+    task_config['is_running'] = True
     
     # 保存配置到数据库
-    if not save_task_to_db(EMAIL_TASK_CONFIG):
+    if not save_task_to_db(task_config):
+        task_config['is_running'] = False
         raise HTTPException(status_code=500, detail="保存任务配置到数据库失败")
     
     # 保存配置到文件（作为备份）
     save_config()
     
-    # 清除之前的调度
-    schedule.clear()
-    
-    # 设置定时任务，只在指定工作日运行
-    workday_map = {
-        0: schedule.every().monday,
-        1: schedule.every().tuesday,
-        2: schedule.every().wednesday,
-        3: schedule.every().thursday,
-        4: schedule.every().friday,
-        5: schedule.every().saturday,
-        6: schedule.every().sunday
-    }
-    
-    # 添加邮件发送任务，使用包装函数执行异步任务
-    for workday in config.workdays:
-        if workday in workday_map:
-            workday_map[workday].at(config.send_time).do(lambda: run_async_task(email_sending_task))
-    
-    # 设置其他定时任务
-    schedule.every(1).hours.do(check_replies)
-    schedule.every(30).minutes.do(maintain_connections)
-    
-    # 启动调度器线程
-    scheduler_thread = threading.Thread(target=run_scheduler)
-    scheduler_thread.daemon = True
-    scheduler_thread.start()
-    
-    # 立即显示第一次倒计时信息
-    next_run_time = get_next_run_time()
-    logger.info(f"距离下次发送任务还有: {next_run_time}")
+    # 设置定时任务，只在指定工作日运行（替换该活动之前的调度）
+    schedule_email_task(config.task_name)
     
     # 计算并显示距离下次执行的时间
-    next_run_time = get_next_run_time()
+    next_run_time = get_next_run_time(config.task_name)
     countries_info = f"目标国家: {', '.join(config.target_countries)}" if config.target_countries else "所有国家"
     workdays_names = {0: "周一", 1: "周二", 2: "周三", 3: "周四", 4: "周五", 5: "周六", 6: "周日"}
     workdays_info = ", ".join([workdays_names[day] for day in config.workdays])
-    print(f"已启动邮件发送任务，使用模板 {config.template_name}，在 {workdays_info} {config.send_time} 发送 {config.daily_count} 封邮件，{countries_info}")
-    print(f"距离下次任务执行还有: {next_run_time}")
+    logger.info(f"已启动活动 {config.task_name}，使用模板 {config.template_name}，在 {workdays_info} {config.send_time} 发送 {config.daily_count} 封邮件，{countries_info}")
+    logger.info(f"距离下次任务执行还有: {next_run_time}")
     
-    return await get_status()
+    return await get_status(config.task_name)
 
 @app.post("/stop", response_model=EmailTaskStatus, tags=["任务控制"])
-async def stop_task():
-    """停止邮件发送任务"""
-    EMAIL_TASK_CONFIG['is_running'] = False
+async def stop_task(task_name: str = DEFAULT_TASK_NAME):
+    """停止指定活动的邮件发送任务，其他活动不受影响"""
+    task_config = get_campaign(task_name)
+    task_config['is_running'] = False
     
     # 保存配置到数据库
-    if not save_task_to_db(EMAIL_TASK_CONFIG):
+    if not save_task_to_db(task_config):
         raise HTTPException(status_code=500, detail="保存任务配置到数据库失败")
     
     # 保存配置到文件（作为备份）
     save_config()
     
-    # 清除调度
-    schedule.clear()
+    # 取消该活动的定时任务
+    unschedule_email_task(task_name)
     
-    print("已停止邮件发送任务")
+    logger.info(f"已停止活动 {task_name} 的邮件发送任务")
     
-    return await get_status()
+    return await get_status(task_name)
+
+@app.delete("/campaigns/{task_name}", tags=["任务控制"])
+async def delete_campaign(task_name: str):
+    """删除活动：取消其定时任务和正在执行的发送，并从数据库和配置文件中移除。默认活动只能停止，不能删除"""
+    if task_name == DEFAULT_TASK_NAME:
+        raise HTTPException(status_code=400, detail="默认活动不能删除，请使用/stop停止")
+    task_config = get_campaign(task_name)
+    
+    if not delete_task_from_db(task_name):
+        raise HTTPException(status_code=500, detail="从数据库删除任务失败")
+    
+    task_config['is_running'] = False
+    del CAMPAIGNS[task_name]
+    save_config()
+    unschedule_email_task(task_name)
+    
+    # 取消该活动正在执行的立即发送任务，已在发送的邮件完成后停止
+    cancelled = [job.id for job in JOBS.list()
+                 if job.kind == 'send-now' and job.params.get('task_name') == task_name
+                 and job.status not in FINISHED_STATES]
+    for job_id in cancelled:
+        JOBS.cancel(job_id)
+    
+    logger.info(f"已删除活动 {task_name}，取消后台任务 {len(cancelled)} 个")
+    return {"success": True, "task_name": task_name, "cancelled_jobs": cancelled}
 
 @app.get("/stats", response_model=EmailStats, tags=["统计数据"])
 async def get_stats(date: Optional[str] = None, all_data: bool = False):
@@ -897,17 +950,32 @@ async def get_stats(date: Optional[str] = None, all_data: bool = False):
         "is_all_data": all_data
     }
 
+@app.get("/scheduler", tags=["任务状态"])
+async def get_scheduler():
+    """查看调度器中即将执行的定时任务"""
+    return {"jobs": scheduler.upcoming()}
+
 @app.post("/send-now", tags=["任务控制"])
-async def send_now(background_tasks: BackgroundTasks):
-    """立即执行一次邮件发送任务，不影响原有的定时任务"""
-    # 直接在异步上下文中调用异步函数
-    background_tasks.add_task(email_sending_task)
-    return {"message": "邮件发送任务已在后台启动，请稍后查看统计数据"}
+async def send_now(task_name: str = DEFAULT_TASK_NAME):
+    """立即执行一次指定活动的邮件发送任务，不影响原有的定时任务。返回后台任务ID，可通过/jobs/{job_id}查看进度"""
+    task_config = get_campaign(task_name)
+    
+    def run(job):
+        success_count = email_sending_task(task_name, job)
+        return f"活动 {task_name} 已发送 {success_count} 封邮件"
+    
+    job = JOBS.submit('send-now', task_config['daily_count'], run, {'task_name': task_name})
+    return {
+        "message": f"活动 {task_name} 的邮件发送任务已在后台启动，请稍后查看统计数据",
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}"
+    }
 
 @app.post("/send-temp", tags=["任务控制"])
 async def send_temp(config: TempSendConfig):
     """
-    临时发送指定数量的邮件到指定国家或区域
+    临时发送指定数量的邮件到指定国家或区域。任务在后台执行，立即返回任务ID，
+    可通过GET /jobs/{job_id}查看进度，通过POST /jobs/{job_id}/cancel取消
     
     - count: 要发送的邮件数量
     - target_countries: 目标国家列表，为空表示所有国家。请使用中文国家名称，例如["中国", "美国", "日本"]
@@ -916,79 +984,185 @@ async def send_temp(config: TempSendConfig):
     
     注意: 请只使用target_regions或target_countries中的一个，不要同时使用。如果两者都提供，系统将优先使用target_regions并忽略target_countries。
     """
-    result = temp_email_sending_task(
-        count=config.count,
-        target_countries=config.target_countries,
-        target_regions=config.target_regions,
-        template_name=config.template_name
-    )
+    if config.count <= 0:
+        raise HTTPException(status_code=400, detail="count必须大于0")
+    
+    def run(job):
+        result = temp_email_sending_task(
+            count=config.count,
+            target_countries=config.target_countries,
+            target_regions=config.target_regions,
+            template_name=config.template_name,
+            job=job
+        )
+        if not result["success"]:
+            raise Exception(result["message"])
+        return result["message"]
     
-    if result["success"]:
-        return {"message": result["message"], "sent_count": result["sent_count"]}
-    else:
-        raise HTTPException(status_code=400, detail=result["message"])
+    job = JOBS.submit('send-temp', config.count, run, config.dict())
+    return {
+        "message": "临时发送任务已在后台启动",
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}"
+    }
+
+@app.get("/jobs", tags=["后台任务"])
+async def list_jobs():
+    """列出最近的后台发送任务"""
+    return {"jobs": [job.to_dict() for job in JOBS.list()]}
+
+@app.get("/jobs/{job_id}", tags=["后台任务"])
+async def get_job(job_id: str):
+    """查看后台发送任务的进度：已发送、失败、剩余数量，吞吐量和预计剩余时间"""
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务 {job_id} 不存在")
+    return job.to_dict()
+
+@app.post("/jobs/{job_id}/cancel", tags=["后台任务"])
+async def cancel_job(job_id: str):
+    """取消后台发送任务，正在发送的邮件完成后停止"""
+    job = JOBS.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务 {job_id} 不存在")
+    return job.to_dict()
 
 # 修改启动事件处理函数
 @app.on_event("startup")
 async def startup_event():
     """启动事件处理函数"""
-    global scheduler_thread
-    
-    # 只从数据库加载配置
-    task_config = load_task_from_db()
-    if task_config:
-        # 更新全局配置
-        EMAIL_TASK_CONFIG.update(task_config)
-        logger.info("从数据库加载任务配置成功")
-        
-        # 如果任务正在运行，则启动调度器
-        if EMAIL_TASK_CONFIG['is_running']:
-            # 设置定时任务
-            workday_map = {
-                0: schedule.every().monday,
-                1: schedule.every().tuesday,
-                2: schedule.every().wednesday,
-                3: schedule.every().thursday,
-                4: schedule.every().friday,
-                5: schedule.every().saturday,
-                6: schedule.every().sunday
-            }
-            
-            # 添加邮件发送任务，使用包装函数执行异步任务
-            for workday in EMAIL_TASK_CONFIG['workdays']:
-                if workday in workday_map:
-                    workday_map[workday].at(EMAIL_TASK_CONFIG['send_time']).do(lambda: run_async_task(email_sending_task))
-            
-            # 设置其他定时任务
-            schedule.every(1).hours.do(check_replies)
-            schedule.every(30).minutes.do(maintain_connections)
-            
-            # 启动调度器线程
-            scheduler_thread = threading.Thread(target=run_scheduler)
-            scheduler_thread.daemon = True
-            scheduler_thread.start()
-            
-            # 显示下次执行时间
-            next_run_time = get_next_run_time()
-            logger.info(f"距离下次发送任务还有: {next_run_time}")
-    else:
-        # 如果没有运行中的任务，初始化一个空配置
-        EMAIL_TASK_CONFIG.update({
-            'is_running': False,
-            'daily_count': 50,
-            'target_countries': [],
-            'target_regions': [],
-            'send_time': '09:00',
-            'workdays': [0, 1, 2, 3, 4, 5, 6],
-            'template_name': 'C_template.html',
-            'last_run_date': None,
-            'last_sent_count': 0,
-            'last_opened_count': 0
-        })
+    # 将调度器绑定到服务器的事件循环
+    scheduler.attach(asyncio.get_running_loop())
+    
+    # 只从数据库加载所有活动的配置
+    task_configs = load_tasks_from_db()
+    for task_config in task_configs:
+        update_campaign(task_config)
+    
+    if task_configs:
+        logger.info(f"从数据库加载 {len(task_configs)} 个活动配置成功")
+    
+    # 为所有运行中的活动设置定时任务
+    running = [task_name for task_name, task_config in CAMPAIGNS.items() if task_config['is_running']]
+    for task_name in running:
+        schedule_email_task(task_name)
+    
+    if not running:
         logger.info("没有运行中的任务")
     
     logger.info("邮件发送系统启动")
 
+@app.get("/metrics", tags=["监控"])
+async def get_metrics():
+    """Prometheus格式的指标：发送/打开/回复计数，SMTP、数据库和跟踪注册延迟，池大小和队列深度"""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/timing", tags=["监控"])
+async def get_send_timing(last: int = 500):
+    """
+    统计最近last次发送中send_email各阶段的耗时分位数（毫秒）及其在总耗时中的占比：
+    template_render、mime_build、smtp_connect_check、smtp_data、tracker_register、db_connect、db_insert、companies_update
+    """
+    if last <= 0:
+        raise HTTPException(status_code=400, detail="last必须大于0")
+    return send_timing_recorder.summarize(last)
+
+@app.post("/profile/start", tags=["监控"])
+async def start_profile(config: ProfileConfig):
+    """
+    开始性能分析。target=next_send时在下一次发送任务（定时任务、/send-now或/send-temp）开始时启动，任务结束时停止。
+    任何会话最长运行MAX_PROFILE_SECONDS秒后自动停止。
+    """
+    try:
+        session = PROFILER.start(
+            mode=config.mode,
+            target=config.target,
+            duration=config.duration,
+            interval=config.interval,
+            thread_prefix=config.thread_prefix
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return dict(session.to_dict(), max_duration=MAX_PROFILE_SECONDS)
+
+@app.post("/profile/stop", tags=["监控"])
+async def stop_profile():
+    """停止当前性能分析会话并保存结果"""
+    session = await asyncio.to_thread(PROFILER.stop)
+    if session is None:
+        raise HTTPException(status_code=404, detail="没有正在进行的分析会话")
+    return dict(session.to_dict(), summary=session.summary)
+
+@app.get("/profile", tags=["监控"])
+async def get_profile():
+    """查看当前分析会话和上一次分析的结果摘要"""
+    return PROFILER.status()
+
+@app.get("/profile/{session_id}/download", tags=["监控"])
+async def download_profile(session_id: str, format: str = "pstats"):
+    """下载分析结果：format=pstats（cProfile）或collapsed（采样，可直接用于生成火焰图）"""
+    session = PROFILER.last_session
+    if session is None or session.id != session_id or format not in session.files:
+        raise HTTPException(status_code=404, detail=f"分析结果 {session_id} ({format}) 不存在")
+    path = session.files[format]
+    return FileResponse(path, filename=os.path.basename(path), media_type="application/octet-stream")
+
+@app.get("/events", tags=["实时事件"])
+async def stream_events(request: Request, types: Optional[str] = None):
+    """
+    以Server-Sent Events推送实时事件：send（每封邮件的发送结果）、open（邮件打开）、reply（邮件回复）
+    - types: 只订阅指定类型，逗号分隔，例如"open,reply"
+    客户端读取过慢时会丢弃最旧的事件并推送一条dropped事件；断线重连时根据Last-Event-ID补发最近的事件
+    """
+    last_event_id = request.headers.get('last-event-id')
+    subscription = EVENT_BUS.subscribe(
+        types=[t.strip() for t in types.split(',') if t.strip()] if types else None,
+        last_event_id=int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    )
+    
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                events = await EVENT_BUS.next_batch(subscription, SSE_HEARTBEAT_SECONDS)
+                if not events:
+                    # 心跳注释，保持连接并及时发现断开的客户端
+                    yield ": keep-alive\n\n"
+                    continue
+                yield "".join(format_sse(event) for event in events)
+        finally:
+            EVENT_BUS.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/events/publish", tags=["实时事件"])
+async def publish_events(request: Request):
+    """
+    供跟踪/反馈服务器转发打开和回复事件，请求体为{"type": ..., "data": ...}
+    或{"events": [{"type": ..., "data": ...}, ...]}
+    """
+    body = await request.json()
+    events = body.get('events') if isinstance(body, dict) and 'events' in body else [body]
+    published = 0
+    for event in events:
+        if isinstance(event, dict) and event.get('type'):
+            EVENT_BUS.publish(event['type'], event.get('data'))
+            published += 1
+    return {"published": published, **EVENT_BUS.stats()}
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """关闭时取消所有未完成的后台发送任务，并停止正在进行的性能分析"""
+    JOBS.shutdown()
+    PROFILER.stop(reason='shutdown')
+
 # 主函数
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run("api_server:app", host="0.0.0.0", port=8000, reload=True)
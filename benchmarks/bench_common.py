@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+基准测试公共工具：一次性测试数据库、延迟分位数、资源占用统计，以及结果保存和基线对比
+"""
+
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_DIR)
+from send_timing import percentile
+from lazy_import import lazy_module
+from sql_tools.storage import Error, backend, connect_db, create_tables
+
+# 只有MySQL后端连接服务器（不指定数据库）时使用
+mysql_connector = lazy_module('mysql.connector')
+
+# 基准测试结果和基线保存目录
+RESULTS_DIR = os.path.join(REPO_DIR, 'logs', 'benchmarks')
+
+# 与基线相比变差超过该比例时视为性能回退
+REGRESSION_THRESHOLD = 0.10
+
+# 连接到db_config指定的数据库，database为None时只连接MySQL服务器；SQLite后端直接打开数据库文件
+def connect(db_config, database=None):
+    if backend(db_config) == 'sqlite':
+        return connect_db(db_config)
+    return mysql_connector.connect(
+        host=db_config['host'],
+        user=db_config['user'],
+        password=db_config['password'],
+        database=database
+    )
+
+
+class ThrowawayDatabase:
+    """
+    在配置的MySQL服务器上创建一个临时数据库并建表，退出时删除；SQLite后端则在logs/benchmarks下创建临时数据库文件。
+    表结构与生产表一致（storage.MYSQL_SCHEMA除主键外没有索引），测得的是实际部署的性能。
+    keep=True时保留数据库，便于用同一个name重复运行（如大数据量的查询基准）。
+    """
+
+    def __init__(self, db_config, name=None, keep=False):
+        self.db_config = db_config
+        self.name = name or f"mailbox_bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+        self.keep = keep
+
+    def __enter__(self):
+        if backend(self.db_config) == 'sqlite':
+            os.makedirs(RESULTS_DIR, exist_ok=True)
+            self.sqlite_path = os.path.join(RESULTS_DIR, f'{self.name}.db')
+            config = dict(self.db_config, database=self.name, sqlite_path=self.sqlite_path)
+            create_tables(config)
+            print(f"已创建基准测试数据库 {self.sqlite_path}")
+            return config
+
+        connection = connect(self.db_config)
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{self.name}` CHARACTER SET utf8mb4")
+            cursor.close()
+        finally:
+            connection.close()
+        config = dict(self.db_config, database=self.name)
+        create_tables(config)
+        print(f"已创建基准测试数据库 {self.name}")
+        return config
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.keep:
+            print(f"保留基准测试数据库 {self.name}")
+            return
+        if backend(self.db_config) == 'sqlite':
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(self.sqlite_path + suffix):
+                    os.remove(self.sqlite_path + suffix)
+            print(f"已删除基准测试数据库 {self.sqlite_path}")
+            return
+        try:
+            connection = connect(self.db_config)
+            cursor = connection.cursor()
+            cursor.execute(f"DROP DATABASE IF EXISTS `{self.name}`")
+            cursor.close()
+            connection.close()
+            print(f"已删除基准测试数据库 {self.name}")
+        except Error as e:
+            print(f"删除基准测试数据库 {self.name} 失败: {e}")
+
+
+# 统计一组耗时（秒）的分位数，单位毫秒
+def latency_summary(seconds):
+    values = sorted(seconds)
+    if not values:
+        return {'count': 0, 'mean_ms': 0, 'p50_ms': 0, 'p99_ms': 0, 'max_ms': 0}
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values) * 1000, 3),
+        'p50_ms': round(percentile(values, 50) * 1000, 3),
+        'p99_ms': round(percentile(values, 99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3)
+    }
+
+
+class ResourceMonitor:
+    """记录一段运行期间本进程的CPU时间、峰值常驻内存和峰值线程数"""
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.peak_threads = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._start_usage = resource.getrusage(resource.RUSAGE_SELF)
+        self._start_time = time.perf_counter()
+        self.peak_threads = threading.active_count()
+        self._thread = threading.Thread(target=self._sample, name='bench-resource-monitor', daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_threads = max(self.peak_threads, threading.active_count() - 1)
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        end_usage = resource.getrusage(resource.RUSAGE_SELF)
+        elapsed = time.perf_counter() - self._start_time
+        user = end_usage.ru_utime - self._start_usage.ru_utime
+        system = end_usage.ru_stime - self._start_usage.ru_stime
+        self.result = {
+            'cpu_user_s': round(user, 3),
+            'cpu_system_s': round(system, 3),
+            'cpu_percent': round((user + system) / elapsed * 100, 1) if elapsed > 0 else 0,
+            # Linux上ru_maxrss的单位是KB，为进程生命周期内的峰值
+            'max_rss_mb': round(end_usage.ru_maxrss / 1024, 1),
+            'peak_threads': self.peak_threads
+        }
+
+
+# 默认基线文件路径
+def baseline_path(benchmark):
+    return os.path.join(RESULTS_DIR, f'{benchmark}_baseline.json')
+
+
+# 保存本次结果，返回文件路径
+def save_results(benchmark, params, metrics, path=None):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = path or os.path.join(RESULTS_DIR, f"{benchmark}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'benchmark': benchmark,
+            'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'params': params,
+            'metrics': metrics
+        }, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def compare_with_baseline(metrics, path, higher_is_better, threshold=REGRESSION_THRESHOLD):
+    """
+    与基线逐项对比并打印变化，返回变差超过threshold的指标列表。
+    higher_is_better(name)判断该指标是否越大越好（吞吐量），其余指标（延迟、CPU、内存）越小越好。
+    """
+    if not os.path.exists(path):
+        print(f"基线文件 {path} 不存在，跳过对比")
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    print(f"\n与基线对比（{baseline.get('time')}，{path}）:")
+    regressions = []
+    for name, value in metrics.items():
+        old = baseline.get('metrics', {}).get(name)
+        if not isinstance(old, (int, float)) or not isinstance(value, (int, float)):
+            continue
+        if old == 0:
+            print(f"  {name:<45} {old:>12} -> {value:<12}")
+            continue
+        change = (value - old) / abs(old)
+        worse = -change if higher_is_better(name) else change
+        flag = ''
+        if worse > threshold:
+            flag = '  <-- 变差'
+            regressions.append(name)
+        elif worse < -threshold:
+            flag = '  改善'
+        print(f"  {name:<45} {old:>12} -> {value:<12} {change:+.1%}{flag}")
+    return regressions
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+端到端吞吐量基准测试：在本地启动SMTP/IMAP替身服务器（可注入延迟和故障）、反馈服务器和一次性MySQL数据库，
+按场景驱动真实代码路径并报告吞吐量、p50/p99延迟和资源占用，结果可与保存的基线对比：
+  send      逐封调用email_sender.send_email
+  campaign  通过api_server.email_sending_task按活动并发发送
+  replies   向IMAP收件箱投递回复、退信和无关邮件，分多轮调用email_sender.check_replies
+
+数据库连接信息取自.env（需要有CREATE/DROP DATABASE权限），测试数据库在结束时删除。
+
+用法: python benchmarks/bench_end_to_end.py [--sends 500] [--concurrency 4] [--smtp-latency 0.005]
+                                            [--scenarios send,campaign,replies] [--save-baseline]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BENCH_DIR)
+from bench_common import (REPO_DIR, ResourceMonitor, ThrowawayDatabase, baseline_path,
+                          compare_with_baseline, connect, latency_summary, save_results)
+from fake_servers import FakeIMAPServer, FakeSMTPServer, FaultInjection, make_self_signed_cert
+
+BENCHMARK_NAME = 'end_to_end'
+SCENARIOS = ('send', 'campaign', 'replies')
+COUNTRIES = ['United States', 'Germany', 'France', 'Japan', 'Brazil', 'Australia', 'India', 'Canada']
+BENCH_ADDRESS = 'bench@bench.example.org'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='端到端吞吐量基准测试')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='要运行的场景，逗号分隔')
+    parser.add_argument('--sends', type=int, default=500, help='send和campaign场景各发送的邮件数')
+    parser.add_argument('--concurrency', type=int, default=4, help='campaign场景的并发发送数')
+    parser.add_argument('--smtp-latency', type=float, default=0.005, help='SMTP每封邮件DATA响应的延迟（秒）')
+    parser.add_argument('--smtp-jitter', type=float, default=0.0, help='SMTP额外随机延迟上限（秒）')
+    parser.add_argument('--smtp-error-rate', type=float, default=0.0, help='SMTP返回451临时错误的概率')
+    parser.add_argument('--smtp-disconnect-rate', type=float, default=0.0, help='SMTP断开连接的概率')
+    parser.add_argument('--imap-latency', type=float, default=0.0, help='IMAP每条UID命令的延迟（秒）')
+    parser.add_argument('--imap-error-rate', type=float, default=0.0, help='IMAP UID命令返回NO的概率')
+    parser.add_argument('--inbound', type=int, default=None, help='replies场景投递的邮件数，默认等于--sends')
+    parser.add_argument('--reply-rate', type=float, default=0.6, help='投递邮件中回复的比例')
+    parser.add_argument('--bounce-rate', type=float, default=0.1, help='投递邮件中退信的比例，其余为无关邮件')
+    parser.add_argument('--reply-rounds', type=int, default=5, help='投递邮件分几轮检查')
+    parser.add_argument('--template', default='C_template.html', help='使用的邮件模板')
+    parser.add_argument('--seed', type=int, default=42, help='随机数种子')
+    parser.add_argument('--keep-db', action='store_true', help='结束后保留测试数据库')
+    parser.add_argument('--log-level', default='WARNING', help='被测代码的日志级别')
+    parser.add_argument('--baseline', default=None, help='对比的基线文件，默认logs/benchmarks/end_to_end_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help='将本次结果保存为新的基线')
+    parser.add_argument('--fail-on-regression', action='store_true', help='有指标比基线变差超过10%%时以状态码1退出')
+    return parser.parse_args()
+
+
+# 准备隔离的工作目录：被测代码写入的logs/和config/都落在这里，模板链接到仓库中的templates/
+def prepare_workdir():
+    workdir = tempfile.mkdtemp(prefix='mailbox-bench-')
+    os.makedirs(os.path.join(workdir, 'logs'))
+    os.makedirs(os.path.join(workdir, 'config'))
+    os.symlink(os.path.join(REPO_DIR, 'templates'), os.path.join(workdir, 'templates'))
+    return workdir
+
+
+# 在后台线程中运行Flask应用，返回(服务器, 端口)
+def start_flask(app):
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-feedback-server', daemon=True).start()
+    return server, server.server_port
+
+
+# 向companies表写入count个待发送联系人
+def seed_companies(db_config, count, rng):
+    connection = connect(db_config, db_config['database'])
+    cursor = connection.cursor()
+    rows = []
+    for i in range(count):
+        suffix = uuid.uuid4().hex[:8]
+        rows.append((
+            f'Bench Foods {suffix}',
+            rng.choice(COUNTRIES),
+            f'Buyer {suffix}',
+            f'buyer.{suffix}@bench{i % 50}.example.com',
+            rng.choice(['Purchasing Manager', 'CEO', 'Import Director', ''])
+        ))
+    for i in range(0, len(rows), 1000):
+        cursor.executemany(
+            "INSERT INTO companies (company_name, company_country, contact_name, contact_email, contact_position) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            rows[i:i + 1000]
+        )
+    connection.commit()
+    cursor.close()
+    connection.close()
+
+
+def count_rows(db_config, query):
+    connection = connect(db_config, db_config['database'])
+    cursor = connection.cursor()
+    cursor.execute(query)
+    value = cursor.fetchone()[0]
+    cursor.close()
+    connection.close()
+    return value
+
+
+# 构造一封回复邮件，In-Reply-To指向本系统发出的邮件
+def build_reply(message_id, recipient, i):
+    return (
+        f"From: {recipient}\r\n"
+        f"To: {BENCH_ADDRESS}\r\n"
+        f"Subject: Re: Frozen Vegetable Product Offering\r\n"
+        f"Message-ID: <bench-reply-{i}@bench.example.com>\r\n"
+        f"In-Reply-To: {message_id}\r\n"
+        f"References: {message_id}\r\n"
+        f"Content-Type: text/plain; charset=utf-8\r\n\r\n"
+        + "Thank you for your offer, please send the price list.\r\n" * 10
+    ).encode('utf-8')
+
+
+# 构造一封标准DSN硬退信
+def build_bounce(message_id, recipient, i):
+    return (
+        f"From: MAILER-DAEMON@bench.example.com\r\n"
+        f"To: {BENCH_ADDRESS}\r\n"
+        f"Subject: Undelivered Mail Returned to Sender\r\n"
+        f"Message-ID: <bench-bounce-{i}@bench.example.com>\r\n"
+        f"MIME-Version: 1.0\r\n"
+        f"Content-Type: multipart/report; report-type=delivery-status; boundary=\"bench-{i}\"\r\n\r\n"
+        f"--bench-{i}\r\nContent-Type: text/plain\r\n\r\nDelivery to {recipient} failed.\r\n"
+        f"--bench-{i}\r\nContent-Type: message/delivery-status\r\n\r\n"
+        f"Reporting-MTA: dns; bench.example.com\r\n\r\n"
+        f"Final-Recipient: rfc822; {recipient}\r\nAction: failed\r\nStatus: 5.1.1\r\n"
+        f"Diagnostic-Code: smtp; 550 5.1.1 User unknown\r\n\r\n"
+        f"--bench-{i}\r\nContent-Type: text/rfc822-headers\r\n\r\nMessage-ID: {message_id}\r\n\r\n"
+        f"--bench-{i}--\r\n"
+    ).encode('utf-8')
+
+
+# 构造一封与本系统无关的邮件
+def build_noise(i):
+    return (
+        f"From: newsletter{i}@other.example.net\r\n"
+        f"To: {BENCH_ADDRESS}\r\n"
+        f"Subject: Weekly market update #{i}\r\n"
+        f"Message-ID: <noise-{i}@other.example.net>\r\n"
+        f"Content-Type: text/plain; charset=utf-8\r\n\r\n"
+        + "Prices for frozen vegetables are stable this week.\r\n" * 20
+    ).encode('utf-8')
+
+
+def build_inbound(delivered, count, reply_rate, bounce_rate, rng):
+    messages = []
+    for i in range(count):
+        value = rng.random()
+        if delivered and value < bounce_rate:
+            messages.append(build_bounce(*rng.choice(delivered), i))
+        elif delivered and value < bounce_rate + reply_rate:
+            messages.append(build_reply(*rng.choice(delivered), i))
+        else:
+            messages.append(build_noise(i))
+    return messages
+
+
+# 汇总一个发送场景的结果，延迟取自send_timing记录的每封邮件总耗时
+def send_result(recorder, elapsed, monitor):
+    records = list(recorder.records)
+    sent = sum(1 for record in records if record['outcome'] == 'sent')
+    summary = recorder.summarize()
+    return {
+        'sent': sent,
+        'failed': len(records) - sent,
+        'elapsed_s': round(elapsed, 3),
+        'messages_per_sec': round(sent / elapsed, 2) if elapsed > 0 else 0,
+        **latency_summary([record['total'] for record in records]),
+        **monitor.result,
+        'phases': {name: {'p50_ms': stats['p50_ms'], 'p99_ms': stats['p99_ms'], 'share': stats['share']}
+                   for name, stats in summary['phases'].items() if name != 'total'}
+    }
+
+
+def run_send(args, email_sender, TimingRecorder):
+    email_sender.send_timing_recorder = recorder = TimingRecorder(size=args.sends, trace_file=None)
+    email_sender.DB_CONFIG['batch_size'] = args.sends
+    email_sender.load_recipients()
+    template = email_sender.load_template(args.template)
+    email_sender.init_smtp_connection()
+
+    with ResourceMonitor() as monitor:
+        start = time.perf_counter()
+        for recipient in email_sender.RECIPIENTS:
+            email_sender.send_email(recipient, template)
+        elapsed = time.perf_counter() - start
+    return send_result(recorder, elapsed, monitor)
+
+
+def run_campaign_task(args, email_sender, TimingRecorder):
+    import api_server
+    from campaign_scheduler import SendCapacity
+
+    # 不覆盖仓库config/目录中的活动配置
+    api_server.save_config = lambda: None
+    api_server.SEND_CAPACITY = SendCapacity(args.concurrency)
+    api_server.update_campaign({
+        'task_name': 'bench_campaign',
+        'daily_count': args.sends,
+        'template_name': args.template,
+        'is_running': True,
+        'max_concurrency': args.concurrency
+    })
+    email_sender.send_timing_recorder = recorder = TimingRecorder(size=args.sends, trace_file=None)
+
+    with ResourceMonitor() as monitor:
+        start = time.perf_counter()
+        api_server.email_sending_task('bench_campaign')
+        elapsed = time.perf_counter() - start
+    return send_result(recorder, elapsed, monitor)
+
+
+def run_replies(args, email_sender, smtp, imap, feedback_server, db_config, rng):
+    count = args.inbound if args.inbound is not None else args.sends
+    messages = build_inbound(list(smtp.delivered), count, args.reply_rate, args.bounce_rate, rng)
+    rounds = max(1, args.reply_rounds)
+    chunk = -(-len(messages) // rounds)
+    replied_before = feedback_server.email_stats['replied']
+
+    round_times = []
+    with ResourceMonitor() as monitor:
+        for i in range(0, len(messages), chunk):
+            for raw in messages[i:i + chunk]:
+                imap.add_message(raw)
+            start = time.perf_counter()
+            email_sender.check_replies()
+            round_times.append(time.perf_counter() - start)
+    if email_sender.parse_pool is not None:
+        email_sender.parse_pool.shutdown(wait=True)
+
+    elapsed = sum(round_times)
+    # 每轮检查的耗时作为延迟，第一轮包含解析进程池的启动时间
+    latency = latency_summary(round_times)
+    return {
+        'inbound': len(messages),
+        'replies_matched': feedback_server.email_stats['replied'] - replied_before,
+        'suppressed': count_rows(db_config, "SELECT COUNT(*) FROM email_suppression WHERE is_suppressed = TRUE"),
+        'rounds': len(round_times),
+        'elapsed_s': round(elapsed, 3),
+        'messages_per_sec': round(len(messages) / elapsed, 2) if elapsed > 0 else 0,
+        'p50_ms': latency['p50_ms'],
+        'p99_ms': latency['p99_ms'],
+        'max_ms': latency['max_ms'],
+        **monitor.result
+    }
+
+
+def print_result(name, result):
+    print(f"\n[{name}]")
+    for key, value in result.items():
+        if key == 'phases':
+            print("  各阶段耗时:")
+            for phase, stats in value.items():
+                print(f"    {phase:<20} p50 {stats['p50_ms']:>9.3f} ms  p99 {stats['p99_ms']:>9.3f} ms  "
+                      f"占比 {stats['share']:.1%}")
+        else:
+            print(f"  {key:<20} {value}")
+
+
+# 展开为"场景.指标"形式的数值指标，用于保存和基线对比
+def flatten(results):
+    metrics = {}
+    for name, result in results.items():
+        for key, value in result.items():
+            if isinstance(value, (int, float)):
+                metrics[f'{name}.{key}'] = value
+    return metrics
+
+
+def main():
+    args = parse_args()
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"未知场景: {', '.join(sorted(unknown))}，可选: {', '.join(SCENARIOS)}")
+    rng = random.Random(args.seed)
+
+    workdir = prepare_workdir()
+    certfile, keyfile = make_self_signed_cert(workdir)
+    smtp = FakeSMTPServer(certfile, keyfile, FaultInjection(
+        args.smtp_latency, args.smtp_jitter, args.smtp_error_rate, args.smtp_disconnect_rate, seed=args.seed
+    )).start()
+    imap = FakeIMAPServer(certfile, keyfile, FaultInjection(
+        args.imap_latency, 0.0, args.imap_error_rate, seed=args.seed
+    )).start()
+
+    # 活动发送不等待发送间隔；反馈服务器的实时事件不转发到真实的API服务器
+    os.environ['SEND_PACING_SECONDS'] = '0'
+    os.environ['API_EVENTS_URL'] = 'http://127.0.0.1:9/events/publish'
+    os.chdir(workdir)
+
+    import logging
+    from config_loader import get_db_config, get_email_config
+
+    db_config = get_db_config()
+    results = {}
+    with ThrowawayDatabase(db_config, keep=args.keep_db) as bench_db_config:
+        # 各模块共用同一个配置字典，原地修改后所有被测代码都指向测试环境
+        db_config['database'] = bench_db_config['database']
+        db_config['sqlite_path'] = bench_db_config['sqlite_path']
+        email_config = get_email_config()
+        email_config.update({
+            'smtp_server': '127.0.0.1', 'smtp_port': smtp.port,
+            'imap_server': '127.0.0.1', 'imap_port': imap.port,
+            'username': BENCH_ADDRESS, 'password': 'bench', 'sender_name': 'Bench Sender',
+            'verify_ssl': False
+        })
+
+        import email_sender
+        import feedback_server
+        from send_timing import TimingRecorder
+
+        logging.getLogger().setLevel(args.log_level)
+        feedback, feedback_port = start_flask(feedback_server.app)
+        email_config['tracker_url'] = f'http://127.0.0.1:{feedback_port}'
+
+        seed_companies(bench_db_config, args.sends * sum(1 for name in scenarios if name != 'replies'), rng)
+        print(f"工作目录: {workdir}，SMTP端口 {smtp.port}，IMAP端口 {imap.port}，反馈服务器端口 {feedback_port}")
+
+        try:
+            if 'send' in scenarios:
+                results['send'] = run_send(args, email_sender, TimingRecorder)
+                print_result('send', results['send'])
+            if 'campaign' in scenarios:
+                results['campaign'] = run_campaign_task(args, email_sender, TimingRecorder)
+                print_result('campaign', results['campaign'])
+            if 'replies' in scenarios:
+                results['replies'] = run_replies(args, email_sender, smtp, imap, feedback_server,
+                                                 bench_db_config, rng)
+                print_result('replies', results['replies'])
+        finally:
+            feedback.shutdown()
+            smtp.stop()
+            imap.stop()
+            print(f"\nSMTP替身: {smtp.stats}")
+            print(f"IMAP替身: {imap.stats}")
+
+    os.chdir(REPO_DIR)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    params = {key: value for key, value in vars(args).items() if key not in ('baseline', 'save_baseline')}
+    metrics = flatten(results)
+    print(f"\n结果已保存到 {save_results(BENCHMARK_NAME, params, metrics)}")
+    if args.save_baseline:
+        print(f"基线已保存到 {save_results(BENCHMARK_NAME, params, metrics, baseline_path(BENCHMARK_NAME))}")
+        return
+
+    regressions = compare_with_baseline(
+        metrics, args.baseline or baseline_path(BENCHMARK_NAME),
+        higher_is_better=lambda name: name.endswith('messages_per_sec') or name.endswith('replies_matched')
+    )
+    if regressions:
+        print(f"\n{len(regressions)} 项指标比基线变差: {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
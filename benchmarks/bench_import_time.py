@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+启动耗时基准测试：在新的Python进程中导入各入口模块（api_server、email_sender、各服务和sql_tools脚本），
+测量导入耗时（多次运行取中位数，已减去空解释器的启动时间）和导入的模块数，并用-X importtime
+列出最慢的模块，检查requests、mysql.connector、smtplib等只在使用时才需要的依赖是否在导入时被加载。
+第三方依赖未安装的入口会跳过并打印错误。
+
+用法: python benchmarks/bench_import_time.py [--repeat 7] [--top 10] [--save-baseline]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BENCH_DIR)
+from bench_common import REPO_DIR, baseline_path, compare_with_baseline, save_results
+
+sys.path.append(REPO_DIR)
+from config_loader import DB_CONFIG
+
+BENCHMARK_NAME = 'import_time'
+
+# 入口模块：API服务器、发送程序、三个追踪服务和sql_tools脚本
+ENTRY_POINTS = [
+    'api_server',
+    'email_sender',
+    'tracker_server',
+    'feedback_server',
+    'ingest_server',
+    'sql_tools.mysql_connection',
+    'sql_tools.migrate_email_ids',
+]
+
+# 只在发送、收信、上报或分析时才需要的模块，导入入口模块时不应加载
+DEFERRED_MODULES = ['requests', 'smtplib', 'imaplib', 'uvicorn', 'cProfile', 'pstats',
+                    'concurrent.futures.process']
+# MySQL后端导入sql_tools.storage时就需要mysql.connector（异常类型要在导入时确定），只检查SQLite后端
+if DB_CONFIG['backend'] == 'sqlite':
+    DEFERRED_MODULES.append('mysql.connector')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='入口模块导入耗时基准测试')
+    parser.add_argument('--modules', nargs='+', default=ENTRY_POINTS, help='要测量的入口模块')
+    parser.add_argument('--repeat', type=int, default=7, help='每个模块导入的次数（取中位数）')
+    parser.add_argument('--top', type=int, default=10, help='每个模块列出的最慢模块数')
+    parser.add_argument('--baseline', default=None, help='对比的基线文件，默认logs/benchmarks/import_time_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help='将本次结果保存为新的基线')
+    parser.add_argument('--fail-on-regression', action='store_true', help='有指标比基线变差超过10%%时以状态码1退出')
+    return parser.parse_args()
+
+
+# 在新进程中执行code，返回(耗时秒, 结果)。在临时目录中运行，导入时创建的logs/等文件不写入仓库
+def run_python(code, workdir, extra_args=()):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get('PYTHONPATH')])))
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, *extra_args, '-c', code], cwd=workdir, env=env,
+                            capture_output=True, text=True)
+    return time.perf_counter() - start, result
+
+
+def median_ms(code, workdir, repeat):
+    return statistics.median(run_python(code, workdir)[0] for _ in range(repeat)) * 1000
+
+
+# 解析-X importtime的输出，返回[(模块名, 自身微秒, 累计微秒)]
+def parse_importtime(stderr):
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def measure(module, workdir, args, interpreter_ms):
+    check = (f"import sys, {module}; "
+             f"print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))")
+    _, result = run_python(check, workdir, ('-X', 'importtime'))
+    if result.returncode != 0:
+        error = (result.stderr.strip().splitlines() or ['未知错误'])[-1]
+        print(f"\n[{module}] 导入失败，跳过: {error}")
+        return None
+
+    rows = parse_importtime(result.stderr)
+    total_us = next((cumulative for name, _, cumulative in rows if name == module), 0)
+    deferred_loaded = [name for name in result.stdout.strip().split(',') if name]
+    elapsed_ms = median_ms(f'import {module}', workdir, args.repeat) - interpreter_ms
+
+    print(f"\n[{module}] 导入 {elapsed_ms:.1f} ms（importtime {total_us / 1000:.1f} ms），模块 {len(rows)} 个")
+    if deferred_loaded:
+        print(f"  导入时加载了应按需导入的模块: {', '.join(deferred_loaded)}")
+    print(f"  {'模块':<40} {'自身(ms)':>9} {'累计(ms)':>9}")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda row: row[2], reverse=True)[1:args.top + 1]:
+        print(f"  {name:<40} {self_us / 1000:>9.1f} {cumulative_us / 1000:>9.1f}")
+
+    return {
+        f'{module}.import_ms': round(elapsed_ms, 1),
+        f'{module}.importtime_ms': round(total_us / 1000, 1),
+        f'{module}.modules': len(rows),
+        f'{module}.deferred_loaded': len(deferred_loaded)
+    }
+
+
+def main():
+    args = parse_args()
+    metrics = {}
+    with tempfile.TemporaryDirectory(prefix='mailbox_import_') as workdir:
+        interpreter_ms = median_ms('pass', workdir, args.repeat)
+        print(f"Python {sys.version.split()[0]}，空解释器启动 {interpreter_ms:.1f} ms，每个模块导入 {args.repeat} 次取中位数")
+        metrics['interpreter_ms'] = round(interpreter_ms, 1)
+        for module in args.modules:
+            metrics.update(measure(module, workdir, args, interpreter_ms) or {})
+
+    params = {key: value for key, value in vars(args).items() if key not in ('baseline', 'save_baseline')}
+    print(f"\n结果已保存到 {save_results(BENCHMARK_NAME, params, metrics)}")
+    if args.save_baseline:
+        print(f"基线已保存到 {save_results(BENCHMARK_NAME, params, metrics, baseline_path(BENCHMARK_NAME))}")
+        return
+
+    regressions = compare_with_baseline(metrics, args.baseline or baseline_path(BENCHMARK_NAME),
+                                        higher_is_better=lambda name: False)
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+重连耗时基准测试：对本地SMTP/IMAP替身服务器反复建立连接（TCP、TLS握手、登录）再断开，
+比较三种方式的p50/p99延迟和恢复TLS会话的比例：
+  new_context     每次重连新建SSLContext（原来的做法）
+  shared_context  共用一个SSLContext，不恢复会话
+  resumed         共用SSLContext并恢复TLS会话（tls_session.ResumableSMTP_SSL/ResumableIMAP4_SSL）
+
+--connect-latency模拟到邮件服务器的网络往返：每次握手前额外等待的秒数乘以握手的往返次数
+（完整握手2次，恢复会话1次，均为TLS 1.2的往返数，TLS 1.3两者都是1次，恢复会话节省的是证书传输和验证）。
+
+用法: python benchmarks/bench_reconnect.py [--reconnects 200] [--protocols smtp,imap] [--save-baseline]
+"""
+
+import argparse
+import imaplib
+import os
+import shutil
+import smtplib
+import ssl
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BENCH_DIR)
+from bench_common import REPO_DIR, baseline_path, compare_with_baseline, latency_summary, save_results
+from fake_servers import FakeIMAPServer, FakeSMTPServer, make_self_signed_cert
+
+sys.path.append(REPO_DIR)
+from tls_session import ResumableIMAP4_SSL, ResumableSMTP_SSL, TLSSessionCache
+
+BENCHMARK_NAME = 'reconnect'
+PROTOCOLS = ('smtp', 'imap')
+MODES = ('new_context', 'shared_context', 'resumed')
+TLS_VERSIONS = {'1.2': ssl.TLSVersion.TLSv1_2, '1.3': ssl.TLSVersion.TLSv1_3}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='SMTP/IMAP重连耗时基准测试')
+    parser.add_argument('--protocols', default=','.join(PROTOCOLS), help='要测试的协议，逗号分隔')
+    parser.add_argument('--reconnects', type=int, default=200, help='每种方式的重连次数')
+    parser.add_argument('--tls-version', choices=sorted(TLS_VERSIONS), default='1.3', help='客户端使用的最高TLS版本')
+    parser.add_argument('--connect-latency', type=float, default=0.0, help='模拟的每次握手往返延迟（秒）')
+    parser.add_argument('--baseline', default=None, help='对比的基线文件，默认logs/benchmarks/reconnect_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help='将本次结果保存为新的基线')
+    parser.add_argument('--fail-on-regression', action='store_true', help='有指标比基线变差超过10%%时以状态码1退出')
+    return parser.parse_args()
+
+
+# 与email_sender.create_ssl_context相同的客户端上下文，信任替身服务器的自签名证书
+def client_context(certfile, tls_version):
+    context = ssl.create_default_context(cafile=certfile)
+    context.check_hostname = False
+    context.maximum_version = TLS_VERSIONS[tls_version]
+    return context
+
+
+# 建立一次连接并登录后断开，返回(耗时秒, 是否恢复了会话)
+def connect_once(protocol, port, context, cache, connect_latency):
+    start = time.perf_counter()
+    if protocol == 'smtp':
+        if cache is None:
+            connection = smtplib.SMTP_SSL('127.0.0.1', port, context=context)
+        else:
+            connection = ResumableSMTP_SSL('127.0.0.1', port, context=context, session_cache=cache)
+        connection.login('bench', 'bench')
+    else:
+        if cache is None:
+            connection = imaplib.IMAP4_SSL('127.0.0.1', port, ssl_context=context)
+        else:
+            connection = ResumableIMAP4_SSL('127.0.0.1', port, ssl_context=context, session_cache=cache)
+        connection.login('bench', 'bench')
+    resumed = getattr(connection, 'session_reused', False)
+    if connect_latency:
+        time.sleep(connect_latency * (1 if resumed else 2))
+    elapsed = time.perf_counter() - start
+
+    if protocol == 'smtp':
+        connection.quit()
+    else:
+        connection.logout()
+    return elapsed, resumed
+
+
+def run_mode(protocol, port, mode, certfile, args):
+    shared = client_context(certfile, args.tls_version)
+    cache = TLSSessionCache() if mode == 'resumed' else None
+    timings = []
+    resumed_count = 0
+    for _ in range(args.reconnects):
+        context = client_context(certfile, args.tls_version) if mode == 'new_context' else shared
+        elapsed, resumed = connect_once(protocol, port, context, cache, args.connect_latency)
+        timings.append(elapsed)
+        resumed_count += resumed
+    summary = latency_summary(timings)
+    summary['resumed_ratio'] = round(resumed_count / len(timings), 3) if timings else 0
+    return summary
+
+
+def main():
+    args = parse_args()
+    protocols = [name.strip() for name in args.protocols.split(',') if name.strip()]
+    unknown = set(protocols) - set(PROTOCOLS)
+    if unknown:
+        sys.exit(f"未知的协议: {', '.join(sorted(unknown))}")
+
+    certdir = tempfile.mkdtemp(prefix='mailbox-bench-cert-')
+    metrics = {}
+    try:
+        certfile, keyfile = make_self_signed_cert(certdir)
+        servers = {'smtp': FakeSMTPServer(certfile, keyfile), 'imap': FakeIMAPServer(certfile, keyfile)}
+        for protocol in protocols:
+            server = servers[protocol].start()
+            try:
+                # 预热：首次连接包含导入和证书加载的开销
+                connect_once(protocol, server.port, client_context(certfile, args.tls_version), None, 0)
+                print(f"\n[{protocol}] 重连 {args.reconnects} 次，TLS {args.tls_version}")
+                print(f"  {'方式':<16} {'p50(ms)':>9} {'p99(ms)':>9} {'平均(ms)':>9} {'恢复会话':>9}")
+                for mode in MODES:
+                    summary = run_mode(protocol, server.port, mode, certfile, args)
+                    print(f"  {mode:<16} {summary['p50_ms']:>9.2f} {summary['p99_ms']:>9.2f} "
+                          f"{summary['mean_ms']:>9.2f} {summary['resumed_ratio']:>9.0%}")
+                    for key, value in summary.items():
+                        metrics[f'{protocol}.{mode}.{key}'] = value
+            finally:
+                server.stop()
+    finally:
+        shutil.rmtree(certdir, ignore_errors=True)
+
+    params = {key: value for key, value in vars(args).items() if key not in ('baseline', 'save_baseline')}
+    print(f"\n结果已保存到 {save_results(BENCHMARK_NAME, params, metrics)}")
+    if args.save_baseline:
+        print(f"基线已保存到 {save_results(BENCHMARK_NAME, params, metrics, baseline_path(BENCHMARK_NAME))}")
+        return
+
+    regressions = compare_with_baseline(metrics, args.baseline or baseline_path(BENCHMARK_NAME),
+                                        higher_is_better=lambda name: name.endswith('resumed_ratio'))
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
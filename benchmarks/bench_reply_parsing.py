@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+回复解析吞吐量基准测试：生成大量不同字符集和结构的邮件，比较串行解析与进程池并行解析的吞吐量
+
+用法: python benchmarks/bench_reply_parsing.py [--count 10000] [--workers N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from email.header import Header
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formataddr
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from reply_pipeline import FETCH_BATCH_SIZE, ParsePool, parse_batch
+
+BODY_SAMPLES = [
+    ("Thank you for your offer, please send the price list.", 'utf-8'),
+    ("感谢您的来信，请发送详细报价单。", 'gbk'),
+    ("Gracias por su oferta, ¿podrían enviar la lista de precios?", 'iso-8859-1'),
+    ("ご連絡ありがとうございます。価格表をお送りください。", 'utf-8'),
+]
+
+
+# 生成一封模拟的回复邮件（原始字节）
+def build_message(i):
+    text, charset = random.choice(BODY_SAMPLES)
+    body = (text + "\n") * random.randint(5, 60)
+    if i % 3 == 0:
+        message = MIMEMultipart('alternative')
+        message.attach(MIMEText(body, 'plain', charset))
+        message.attach(MIMEText(f"<html><body><p>{body}</p></body></html>", 'html', charset))
+    else:
+        message = MIMEText(body, 'plain', charset)
+    message['Subject'] = Header(f"Re: 冷冻蔬菜产品报价 #{i}", 'utf-8').encode()
+    message['From'] = formataddr(('Buyer', f'buyer{i}@example.com'))
+    message['Message-ID'] = f'<reply-{i}@example.com>'
+    message['In-Reply-To'] = f'<00000000-0000-4000-8000-{i:012d}@example.org>'
+    message['References'] = f'<00000000-0000-4000-8000-{i:012d}@example.org>'
+    return message.as_bytes()
+
+
+def run_serial(items):
+    start = time.perf_counter()
+    results = []
+    for i in range(0, len(items), FETCH_BATCH_SIZE):
+        results.extend(parse_batch(items[i:i + FETCH_BATCH_SIZE]))
+    return results, time.perf_counter() - start
+
+
+def run_pool(items, workers):
+    pool = ParsePool(max_workers=workers)
+    # 预热进程池，启动开销单独统计
+    warmup_start = time.perf_counter()
+    pool.submit(items[:pool.inline_threshold]).result()
+    pool.warm_up()
+    warmup = time.perf_counter() - warmup_start
+
+    start = time.perf_counter()
+    futures = [pool.submit(items[i:i + FETCH_BATCH_SIZE]) for i in range(0, len(items), FETCH_BATCH_SIZE)]
+    results = []
+    for future in futures:
+        results.extend(future.result())
+    elapsed = time.perf_counter() - start
+    pool.shutdown(wait=True)
+    return results, elapsed, warmup
+
+
+def main():
+    parser = argparse.ArgumentParser(description='回复解析吞吐量基准测试')
+    parser.add_argument('--count', type=int, default=10000, help='模拟邮件数量')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='解析进程数')
+    args = parser.parse_args()
+
+    random.seed(42)
+    items = [(uid, build_message(uid)) for uid in range(1, args.count + 1)]
+    total_bytes = sum(len(raw) for _, raw in items)
+    print(f"生成 {len(items)} 封邮件，共 {total_bytes / 1024 / 1024:.1f} MB")
+
+    serial_results, serial_elapsed = run_serial(items)
+    errors = sum(1 for result in serial_results if 'error' in result)
+    print(f"串行解析: {serial_elapsed:.2f} 秒, {len(items) / serial_elapsed:.0f} 封/秒, 解析失败 {errors} 封")
+
+    pool_results, pool_elapsed, warmup = run_pool(items, args.workers)
+    errors = sum(1 for result in pool_results if 'error' in result)
+    print(f"进程池解析({args.workers}进程): {pool_elapsed:.2f} 秒, {len(items) / pool_elapsed:.0f} 封/秒, "
+          f"解析失败 {errors} 封, 进程池启动 {warmup:.2f} 秒")
+    print(f"加速比: {serial_elapsed / pool_elapsed:.2f}x")
+
+    assert [r['snippet'] for r in serial_results] == [r['snippet'] for r in pool_results]
+
+
+if __name__ == '__main__':
+    main()
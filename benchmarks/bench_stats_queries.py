@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+统计查询基准测试：在generate_stats_data.py生成的大表上计时/stats的各条路径（单日、多日、all_data）
+和活动发送前的收件人选择，并输出每条SQL的EXPLAIN执行计划（访问类型、使用的索引、预计扫描行数），
+用来判断查询在多大数据量时开始变慢以及原因。
+
+用法: python benchmarks/generate_stats_data.py --companies 3000000 --tracking 2000000
+      python benchmarks/bench_stats_queries.py [--repeat 5] [--save-baseline]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BENCH_DIR)
+from bench_common import baseline_path, compare_with_baseline, connect, latency_summary, save_results
+from generate_stats_data import DEFAULT_DB_NAME
+
+BENCHMARK_NAME = 'stats_queries'
+
+# 与api_server.get_email_stats和get_recipients_from_db执行的SQL一致，用于EXPLAIN
+STATS_DATE_QUERIES = [
+    "SELECT COUNT(*) as count FROM email_tracking WHERE sent_time BETWEEN %s AND %s",
+    "SELECT COUNT(*) as count FROM email_tracking WHERE is_opened = TRUE AND open_time BETWEEN %s AND %s",
+    "SELECT COUNT(*) as count FROM email_tracking WHERE is_replied = TRUE AND reply_time BETWEEN %s AND %s",
+]
+STATS_ALL_QUERIES = [
+    "SELECT COUNT(*) as count FROM email_tracking",
+    "SELECT COUNT(*) as count FROM email_tracking WHERE is_opened = TRUE",
+    "SELECT COUNT(*) as count FROM email_tracking WHERE is_replied = TRUE",
+]
+
+
+def recipients_query(count, countries):
+    query = """
+    SELECT id, company_name, company_country, contact_name, contact_email, contact_position
+    FROM companies
+    WHERE contact_email IS NOT NULL
+    AND contact_email != ''
+    AND contact_email_sent = 0
+    """
+    if countries:
+        query += " AND company_country IN (" + ", ".join(['%s'] * len(countries)) + ")"
+    return query + f" LIMIT {count}", tuple(countries or ())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='统计查询基准测试')
+    parser.add_argument('--db-name', default=DEFAULT_DB_NAME, help='generate_stats_data.py生成的数据库')
+    parser.add_argument('--repeat', type=int, default=5, help='每个用例的重复次数（不含首次运行）')
+    parser.add_argument('--daily-count', type=int, default=50, help='活动每天发送数，收件人选择取其3倍')
+    parser.add_argument('--baseline', default=None, help='对比的基线文件，默认logs/benchmarks/stats_queries_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help='将本次结果保存为新的基线')
+    parser.add_argument('--fail-on-regression', action='store_true', help='有指标比基线变差超过10%%时以状态码1退出')
+    return parser.parse_args()
+
+
+def describe_tables(db_config):
+    connection = connect(db_config, db_config['database'])
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT TABLE_NAME, TABLE_ROWS, DATA_LENGTH, INDEX_LENGTH FROM information_schema.TABLES "
+        "WHERE TABLE_SCHEMA = %s AND TABLE_NAME IN ('companies', 'email_tracking')",
+        (db_config['database'],)
+    )
+    for table, rows, data_length, index_length in cursor.fetchall():
+        print(f"  {table:<16} 约 {rows} 行，数据 {data_length / 1024 / 1024:.0f} MB，索引 {index_length / 1024 / 1024:.0f} MB")
+
+    cursor.execute("SELECT DATE(MAX(sent_time)) FROM email_tracking")
+    last_date = cursor.fetchone()[0]
+    cursor.execute(
+        "SELECT company_country, COUNT(*) FROM companies WHERE company_country != '' "
+        "GROUP BY company_country ORDER BY COUNT(*) ASC LIMIT 1"
+    )
+    row = cursor.fetchone()
+    cursor.close()
+    connection.close()
+    return last_date, row[0] if row else None
+
+
+# 返回每条SQL的执行计划：[(访问类型, 使用的索引, 预计扫描行数)]
+def explain(db_config, statements):
+    connection = connect(db_config, db_config['database'])
+    cursor = connection.cursor(dictionary=True)
+    plans = []
+    for query, params in statements:
+        cursor.execute('EXPLAIN ' + query, params)
+        for row in cursor.fetchall():
+            plans.append((row.get('type'), row.get('key'), int(row.get('rows') or 0)))
+    cursor.close()
+    connection.close()
+    return plans
+
+
+def time_case(func, repeat):
+    # api_server的统计和收件人函数每次查询都会记录INFO日志，计时时不输出
+    logging.disable(logging.INFO)
+    try:
+        start = time.perf_counter()
+        result = func()
+        first = time.perf_counter() - start
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    finally:
+        logging.disable(logging.NOTSET)
+    return result, first, timings
+
+
+def main():
+    args = parse_args()
+
+    from config_loader import get_db_config
+    db_config = get_db_config()
+    if db_config['backend'] != 'mysql':
+        sys.exit("统计查询基准依赖information_schema和MySQL的EXPLAIN输出，只支持mysql后端")
+    db_config['database'] = args.db_name
+    import api_server
+
+    print(f"数据库 {args.db_name}:")
+    last_date, rare_country = describe_tables(db_config)
+    if last_date is None:
+        sys.exit("email_tracking为空，请先运行generate_stats_data.py")
+
+    single_date = last_date.strftime('%Y-%m-%d')
+    week = [(last_date - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(7)]
+    month = [(last_date - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(30)]
+    region = '欧洲' if '欧洲' in api_server.REGION_COUNTRIES else next(iter(api_server.REGION_COUNTRIES), None)
+    region_countries = api_server.expand_regions_to_countries([region]) if region else []
+    count = args.daily_count * 3
+
+    # 多日查询对每个日期执行相同的SQL，只EXPLAIN第一个日期
+    def date_statements(dates):
+        return [(query, (f'{date} 00:00:00', f'{date} 23:59:59')) for date in dates[:1] for query in STATS_DATE_QUERIES]
+
+    cases = [
+        ('stats_single_date', lambda: api_server.get_email_stats(single_date),
+         date_statements([single_date]), len(STATS_DATE_QUERIES)),
+        ('stats_7_dates', lambda: api_server.get_email_stats(','.join(week)),
+         date_statements(week), len(STATS_DATE_QUERIES) * len(week)),
+        ('stats_30_dates', lambda: api_server.get_email_stats(','.join(month)),
+         date_statements(month), len(STATS_DATE_QUERIES) * len(month)),
+        ('stats_all_data', lambda: api_server.get_email_stats(get_all=True),
+         [(query, ()) for query in STATS_ALL_QUERIES], len(STATS_ALL_QUERIES)),
+        ('recipients_all_countries', lambda: api_server.get_recipients_from_db(count),
+         [recipients_query(count, None)], 1),
+        ('recipients_region', lambda: api_server.get_recipients_from_db(count, region_countries),
+         [recipients_query(count, region_countries)], 1),
+        ('recipients_rare_country', lambda: api_server.get_recipients_from_db(count, [rare_country]),
+         [recipients_query(count, [rare_country])], 1),
+        ('recipients_no_match', lambda: api_server.get_recipients_from_db(count, ['不存在的国家']),
+         [recipients_query(count, ['不存在的国家'])], 1),
+    ]
+
+    print(f"\n单日 {single_date}，区域 {region}（{len(region_countries)} 个国家），最少联系人的国家 {rare_country}")
+    print(f"\n{'用例':<26} {'SQL数':>6} {'首次(ms)':>10} {'p50(ms)':>10} {'p99(ms)':>10} {'结果':>10}  执行计划(每条SQL)")
+    metrics = {}
+    for name, func, statements, query_count in cases:
+        result, first, timings = time_case(func, args.repeat)
+        latency = latency_summary(timings)
+        plans = explain(db_config, statements)
+        size = result['sent_count'] if isinstance(result, dict) else len(result)
+        plan_text = '; '.join(f"{access}/{key or '无索引'}/{rows}行" for access, key, rows in plans)
+        print(f"{name:<26} {query_count:>6} {first * 1000:>10.1f} {latency['p50_ms']:>10.1f} "
+              f"{latency['p99_ms']:>10.1f} {size:>10}  {plan_text}")
+        metrics[f'{name}.first_ms'] = round(first * 1000, 3)
+        metrics[f'{name}.p50_ms'] = latency['p50_ms']
+        metrics[f'{name}.p99_ms'] = latency['p99_ms']
+        metrics[f'{name}.rows_examined_estimate'] = sum(rows for _, _, rows in plans)
+
+    params = {key: value for key, value in vars(args).items() if key not in ('baseline', 'save_baseline')}
+    print(f"\n结果已保存到 {save_results(BENCHMARK_NAME, params, metrics)}")
+    if args.save_baseline:
+        print(f"基线已保存到 {save_results(BENCHMARK_NAME, params, metrics, baseline_path(BENCHMARK_NAME))}")
+        return
+
+    regressions = compare_with_baseline(metrics, args.baseline or baseline_path(BENCHMARK_NAME),
+                                        higher_is_better=lambda name: False)
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
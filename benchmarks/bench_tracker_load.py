@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+跟踪/反馈服务器负载测试：在独立子进程中启动feedback_server、tracker_server或ingest_server（隔离的工作目录，
+反馈服务器和事件接收服务使用一次性数据库），回放一次活动发出后的真实流量：
+  /track/register  活动发送的邮件注册（反馈服务器和事件接收服务）
+  /track/<email_id> 发送后集中到来的打开请求，包括同一邮件的重复打开和未知邮件ID
+  /reply           部分已打开邮件的回复
+按可配置的并发报告各接口的持续请求数/秒、p50/p99延迟和错误率，结束后检查
+/stats计数、服务器保存的JSON状态和数据库记录是否与发出的流量一致。
+
+--burst-seconds为0时以最大速度发送（闭环）；大于0时按指数衰减的到达时间回放（开环），
+延迟从计划发送时间算起，负载生成跟不上时的排队时间也计入延迟。
+
+用法: python benchmarks/bench_tracker_load.py [--target feedback] [--emails 2000] [--concurrency 16]
+                                              [--burst-seconds 0] [--workers 1] [--save-baseline]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BENCH_DIR)
+from bench_common import (REPO_DIR, ThrowawayDatabase, baseline_path, compare_with_baseline, connect,
+                          latency_summary, save_results)
+from email_ids import id_bytes, new_email_id
+
+BENCHMARK_NAME = 'tracker_load'
+TARGETS = ('feedback', 'tracker', 'ingest')
+# 有注册接口并写入数据库的服务器
+DB_TARGETS = ('feedback', 'ingest')
+ENDPOINTS = ('register', 'open', 'reply')
+
+# 在子进程中启动指定模块的应用：Flask服务器用多线程开发服务器，事件接收服务用uvicorn和指定的worker数
+SERVER_SCRIPT = (
+    "import importlib, sys\n"
+    "if sys.argv[1] == 'ingest':\n"
+    "    import uvicorn\n"
+    "    uvicorn.run('ingest_server:app', host='127.0.0.1', port=int(sys.argv[2]), workers=int(sys.argv[3]),\n"
+    "                log_level='warning')\n"
+    "else:\n"
+    "    module = importlib.import_module(sys.argv[1] + '_server')\n"
+    "    module.app.run(host='127.0.0.1', port=int(sys.argv[2]), threaded=True)\n"
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='跟踪/反馈服务器负载测试')
+    parser.add_argument('--target', choices=TARGETS, default='feedback', help='被测服务器')
+    parser.add_argument('--emails', type=int, default=2000, help='活动发送的邮件数')
+    parser.add_argument('--concurrency', type=int, default=16, help='并发请求数')
+    parser.add_argument('--open-rate', type=float, default=0.4, help='被打开的邮件比例')
+    parser.add_argument('--repeat-opens', type=float, default=1.5, help='每封已打开邮件平均的重复打开次数')
+    parser.add_argument('--unknown-rate', type=float, default=0.1, help='未知邮件ID的打开请求占打开请求的比例')
+    parser.add_argument('--reply-rate', type=float, default=0.1, help='已打开邮件中回复的比例')
+    parser.add_argument('--burst-seconds', type=float, default=0.0, help='打开和回复请求分布的时间窗口，0为最大速度')
+    parser.add_argument('--workers', type=int, default=1, help='ingest_server的worker进程数')
+    parser.add_argument('--seed', type=int, default=42, help='随机数种子')
+    parser.add_argument('--keep-db', action='store_true', help='结束后保留测试数据库')
+    parser.add_argument('--baseline', default=None, help='对比的基线文件，默认logs/benchmarks/tracker_load_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help='将本次结果保存为新的基线')
+    parser.add_argument('--fail-on-regression', action='store_true', help='有指标比基线变差超过10%%时以状态码1退出')
+    return parser.parse_args()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(target, workdir, db_config, workers=1):
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, API_EVENTS_URL='http://127.0.0.1:9/events/publish')
+    if db_config:
+        env['DB_NAME'] = db_config['database']
+        env['SQLITE_PATH'] = db_config['sqlite_path']
+    log = open(os.path.join(workdir, 'server.out'), 'w')
+    process = subprocess.Popen([sys.executable, '-c', SERVER_SCRIPT, target, str(port), str(workers)],
+                               cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务器启动失败，输出见 {log.name}")
+        try:
+            requests.get(f'{url}/metrics', timeout=1)
+            return process, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("等待服务器启动超时")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+# 像email_sender那样写入email_tracking记录
+def seed_tracking(db_config, email_ids):
+    connection = connect(db_config, db_config['database'])
+    cursor = connection.cursor()
+    sent_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    rows = [(f'Bench Foods {i}', f'Buyer {i}', f'buyer{i}@bench.example.com', False, False, sent_time,
+             id_bytes(email_id)) for i, email_id in enumerate(email_ids)]
+    for i in range(0, len(rows), 1000):
+        cursor.executemany(
+            "INSERT INTO email_tracking (company_name, contact_name, email, is_replied, is_opened, sent_time, email_id) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            rows[i:i + 1000]
+        )
+    connection.commit()
+    cursor.close()
+    connection.close()
+
+
+def build_traffic(args, rng):
+    """
+    生成流量，返回(注册事件, 打开/回复事件, 预期结果)。事件为(计划时间偏移, 接口, 邮件ID)。
+    打开时间按指数衰减集中在发送后不久，重复打开和回复在首次打开之后。
+    """
+    window = args.burst_seconds
+    email_ids = [new_email_id() for _ in range(args.emails)]
+    registrations = [(0.0, 'register', email_id) for email_id in email_ids]
+
+    events = []
+    opened = set()
+    replied = set()
+    for email_id in email_ids:
+        if rng.random() >= args.open_rate:
+            continue
+        first_open = min(rng.expovariate(4.0) * window, window)
+        events.append((first_open, 'open', email_id))
+        opened.add(email_id)
+        # 重复打开次数服从几何分布，均值为repeat_opens
+        while rng.random() < args.repeat_opens / (1 + args.repeat_opens):
+            events.append((min(first_open + rng.uniform(0, window / 2), window), 'open', email_id))
+        if rng.random() < args.reply_rate:
+            events.append((min(first_open + rng.uniform(0, window / 2), window), 'reply', email_id))
+            replied.add(email_id)
+
+    opens = sum(1 for _, endpoint, _ in events if endpoint == 'open')
+    unknown_count = int(opens * args.unknown_rate / (1 - args.unknown_rate)) if args.unknown_rate < 1 else 0
+    unknown = set()
+    for _ in range(unknown_count):
+        email_id = new_email_id()
+        unknown.add(email_id)
+        events.append((rng.uniform(0, window), 'open', email_id))
+
+    rng.shuffle(events)
+    events.sort(key=lambda event: event[0])
+    expected = {'registered': len(email_ids), 'opened': len(opened), 'replied': len(replied),
+                'unknown_opened': len(unknown)}
+    return email_ids, registrations, events, expected
+
+
+def send_request(session, url, endpoint, email_id):
+    if endpoint == 'open':
+        return session.get(f'{url}/track/{email_id}', timeout=30)
+    if endpoint == 'register':
+        return session.post(f'{url}/track/register', json={
+            'email_id': email_id,
+            'recipient': f'{email_id[:8]}@bench.example.com',
+            'name': 'Bench Buyer',
+            'sent_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }, timeout=30)
+    return session.post(f'{url}/reply', json={
+        'email_id': email_id,
+        'from': f'{email_id[:8]}@bench.example.com',
+        'subject': 'Re: Frozen Vegetable Product Offering',
+        'content': 'Please send the price list.'
+    }, timeout=30)
+
+
+def run_load(url, events, concurrency, open_loop):
+    """并发发送事件，返回(各接口的延迟列表, 各接口的错误数, 总耗时)"""
+    latencies = {endpoint: [] for endpoint in ENDPOINTS}
+    errors = {endpoint: 0 for endpoint in ENDPOINTS}
+    lock = threading.Lock()
+    counter = itertools.count()
+    start = time.perf_counter()
+
+    def worker():
+        session = requests.Session()
+        local_latencies = {endpoint: [] for endpoint in ENDPOINTS}
+        local_errors = {endpoint: 0 for endpoint in ENDPOINTS}
+        while True:
+            i = next(counter)
+            if i >= len(events):
+                break
+            offset, endpoint, email_id = events[i]
+            begin = time.perf_counter()
+            if open_loop:
+                scheduled = start + offset
+                if scheduled > begin:
+                    time.sleep(scheduled - begin)
+                # 从计划时间算起，负载生成落后时的排队时间也计入延迟
+                begin = scheduled
+            try:
+                response = send_request(session, url, endpoint, email_id)
+                if response.status_code >= 400:
+                    local_errors[endpoint] += 1
+            except requests.RequestException:
+                local_errors[endpoint] += 1
+            local_latencies[endpoint].append(time.perf_counter() - begin)
+        with lock:
+            for endpoint in ENDPOINTS:
+                latencies[endpoint].extend(local_latencies[endpoint])
+                errors[endpoint] += local_errors[endpoint]
+
+    threads = [threading.Thread(target=worker, name=f'bench-load-{i}') for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def summarize(latencies, errors, elapsed):
+    result = {}
+    total = sum(len(values) for values in latencies.values())
+    total_errors = sum(errors.values())
+    result['total'] = {
+        'requests': total,
+        'requests_per_sec': round(total / elapsed, 1) if elapsed > 0 else 0,
+        'error_rate': round(total_errors / total, 4) if total else 0,
+        **latency_summary([value for values in latencies.values() for value in values])
+    }
+    for endpoint, values in latencies.items():
+        if not values:
+            continue
+        result[endpoint] = {
+            'requests': len(values),
+            'requests_per_sec': round(len(values) / elapsed, 1) if elapsed > 0 else 0,
+            'error_rate': round(errors[endpoint] / len(values), 4),
+            **latency_summary(values)
+        }
+    return result
+
+
+def load_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        return {'__error__': str(e)}
+
+
+def check_consistency(target, url, workdir, db_config, expected):
+    """对比/stats、JSON状态文件和数据库记录与预期是否一致，返回不一致项列表"""
+    problems = []
+
+    def check(name, actual, wanted):
+        status = '一致' if actual == wanted else '不一致'
+        print(f"  {name:<40} 实际 {actual!s:<10} 预期 {wanted!s:<10} {status}")
+        if actual != wanted:
+            problems.append(name)
+
+    if target in DB_TARGETS:
+        wanted = {'sent': expected['registered'], 'opened': expected['opened'], 'replied': expected['replied']}
+    else:
+        # tracker_server没有注册接口，未知邮件ID的打开同样计入
+        wanted = {'sent': 0, 'opened': expected['opened'] + expected['unknown_opened'],
+                  'replied': expected['replied']}
+
+    print("\n一致性检查:")
+    stats = requests.get(f'{url}/stats', params={'details': 'false'}, timeout=60).json()
+    # 事件接收服务在后台批量写入，等待队列写完
+    deadline = time.time() + 10
+    while target == 'ingest' and any(stats[key] != value for key, value in wanted.items()) and time.time() < deadline:
+        time.sleep(0.2)
+        stats = requests.get(f'{url}/stats', params={'details': 'false'}, timeout=60).json()
+    for key, value in wanted.items():
+        check(f'/stats {key}', stats[key], value)
+
+    if target != 'ingest':
+        stats_file = load_json(os.path.join(workdir, 'logs', 'email_stats.json'))
+        if '__error__' in stats_file:
+            check('logs/email_stats.json 可读取', stats_file['__error__'], 'OK')
+        elif target == 'feedback':
+            for key, value in wanted.items():
+                check(f'email_stats.json {key}', stats_file.get(key), value)
+        else:
+            check('email_stats.json sent', stats_file.get('sent'), wanted['sent'])
+            check('email_stats.json opened', len(set(stats_file.get('opened', []))), wanted['opened'])
+            check('email_stats.json replied', len(set(stats_file.get('replied', []))), wanted['replied'])
+
+    if target == 'feedback':
+        database = load_json(os.path.join(workdir, 'logs', 'email_database.json'))
+        if '__error__' in database:
+            check('logs/email_database.json 可读取', database['__error__'], 'OK')
+        else:
+            check('email_database.json 邮件数', len(database), wanted['sent'])
+            check('email_database.json opened', sum(1 for item in database.values() if item.get('opened')),
+                  wanted['opened'])
+            check('email_database.json replied', sum(1 for item in database.values() if item.get('replied')),
+                  wanted['replied'])
+
+    if target in DB_TARGETS:
+        connection = connect(db_config, db_config['database'])
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*), COALESCE(SUM(is_opened), 0), COALESCE(SUM(is_replied), 0) "
+                       "FROM email_tracking")
+        rows, db_opened, db_replied = cursor.fetchone()
+        cursor.close()
+        connection.close()
+        check('email_tracking 记录数', int(rows), wanted['sent'])
+        check('email_tracking is_opened', int(db_opened), wanted['opened'])
+        check('email_tracking is_replied', int(db_replied), wanted['replied'])
+
+    return problems
+
+
+def print_result(result):
+    print(f"\n{'接口':<10} {'请求数':>8} {'请求/秒':>10} {'错误率':>8} {'p50(ms)':>10} {'p99(ms)':>10} {'max(ms)':>10}")
+    for endpoint, stats in result.items():
+        print(f"{endpoint:<10} {stats['requests']:>8} {stats['requests_per_sec']:>10} {stats['error_rate']:>8.2%} "
+              f"{stats['p50_ms']:>10} {stats['p99_ms']:>10} {stats['max_ms']:>10}")
+
+
+def run(args, db_config, workdir):
+    rng = random.Random(args.seed)
+    email_ids, registrations, events, expected = build_traffic(args, rng)
+    if db_config:
+        seed_tracking(db_config, email_ids)
+
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    process, url = start_server(args.target, workdir, db_config, args.workers)
+    print(f"{args.target}_server 已启动: {url}，工作目录 {workdir}")
+    try:
+        results = {}
+        if args.target in DB_TARGETS:
+            latencies, errors, elapsed = run_load(url, registrations, args.concurrency, open_loop=False)
+            results['register_phase'] = summarize(latencies, errors, elapsed)['register']
+
+        latencies, errors, elapsed = run_load(url, events, args.concurrency, open_loop=args.burst_seconds > 0)
+        results.update(summarize(latencies, errors, elapsed))
+        results['total']['elapsed_s'] = round(elapsed, 3)
+        print_result(results)
+
+        problems = check_consistency(args.target, url, workdir, db_config, expected)
+    finally:
+        stop_server(process)
+
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    results['server'] = {
+        'cpu_user_s': round(children.ru_utime - children_before.ru_utime, 3),
+        'cpu_system_s': round(children.ru_stime - children_before.ru_stime, 3),
+        'max_rss_mb': round(children.ru_maxrss / 1024, 1)
+    }
+    print(f"\n服务器进程资源占用: {results['server']}")
+    return results, problems
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='mailbox-load-')
+    os.makedirs(os.path.join(workdir, 'logs'))
+
+    if args.target in DB_TARGETS:
+        from config_loader import get_db_config
+        with ThrowawayDatabase(get_db_config(), keep=args.keep_db) as db_config:
+            results, problems = run(args, db_config, workdir)
+    else:
+        results, problems = run(args, None, workdir)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    params = {key: value for key, value in vars(args).items() if key not in ('baseline', 'save_baseline')}
+    metrics = {f'{args.target}.{name}.{key}': value
+               for name, stats in results.items() for key, value in stats.items()}
+    metrics[f'{args.target}.consistency_problems'] = len(problems)
+    print(f"\n结果已保存到 {save_results(BENCHMARK_NAME, params, metrics)}")
+
+    if args.save_baseline:
+        print(f"基线已保存到 {save_results(BENCHMARK_NAME, params, metrics, baseline_path(BENCHMARK_NAME))}")
+    else:
+        regressions = compare_with_baseline(
+            metrics, args.baseline or baseline_path(BENCHMARK_NAME),
+            higher_is_better=lambda name: name.endswith('requests_per_sec')
+        )
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+    if problems:
+        print(f"\n发现 {len(problems)} 项不一致: {', '.join(problems)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
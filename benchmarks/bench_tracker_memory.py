@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+追踪状态内存基准测试：用tracemalloc分别测量旧版tracker_server的email_stats（ID字符串集合和每封邮件一个详情字典）
+和tracker_store.TrackerStore保存相同邮件时占用的内存，输出每封邮件的字节数和两者之比。
+两种场景：details（有收件人、姓名和发送时间的邮件，按打开率/回复率打开和回复）和opens_only（只有打开记录的邮件ID）。
+
+用法: python benchmarks/bench_tracker_memory.py [--emails 200000] [--save-baseline]
+"""
+
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BENCH_DIR)
+from bench_common import REPO_DIR, baseline_path, compare_with_baseline, save_results
+
+sys.path.append(REPO_DIR)
+from tracker_store import TIME_FORMAT, TrackerStore
+
+BENCHMARK_NAME = 'tracker_memory'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='追踪状态内存基准测试')
+    parser.add_argument('--emails', type=int, default=200000, help='邮件数')
+    parser.add_argument('--open-rate', type=float, default=0.22, help='打开率')
+    parser.add_argument('--reply-rate', type=float, default=0.03, help='回复率')
+    parser.add_argument('--seed', type=int, default=42, help='随机数种子')
+    parser.add_argument('--baseline', default=None, help='对比的基线文件，默认logs/benchmarks/tracker_memory_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help='将本次结果保存为新的基线')
+    parser.add_argument('--fail-on-regression', action='store_true', help='有指标比基线变差超过10%%时以状态码1退出')
+    return parser.parse_args()
+
+
+# 生成邮件的原始数据：(序号, ID整数, 发送时间, 打开时间或None, 是否回复)
+def generate_mails(args, rng):
+    start = datetime.now() - timedelta(days=90)
+    mails = []
+    for i in range(args.emails):
+        sent = start + timedelta(seconds=rng.randrange(90 * 86400))
+        opened = sent + timedelta(minutes=rng.randrange(1, 3000)) if rng.random() < args.open_rate else None
+        replied = opened is not None and rng.random() < args.reply_rate / args.open_rate
+        mails.append((i, rng.getrandbits(128), sent, opened, replied))
+    return mails
+
+
+# 构建时才创建字符串：(ID, 收件人, 姓名, 发送时间, 打开时间或None, 回复(发件人, 内容)或None)，
+# 与从JSON读取时一样每封邮件都是新的字符串对象，旧版保留的字符串计入测量结果
+def materialize(mails):
+    for i, id_int, sent, opened, replied in mails:
+        reply = (f'buyer{i}@bench.example.com', f'Thank you for your offer, please send the price list. #{i}') \
+            if replied else None
+        yield (str(uuid.UUID(int=id_int, version=4)), f'buyer{i}@bench.example.com', f'Buyer {i}',
+               sent.strftime(TIME_FORMAT), opened.strftime(TIME_FORMAT) if opened else None, reply)
+
+
+# 旧版tracker_server读取email_stats.json后的内存结构
+def build_legacy(mails, with_details):
+    stats = {'sent': 0, 'opened': set(), 'replied': set(), 'details': {}}
+    for email_id, recipient, name, sent_time, open_time, reply in mails:
+        if with_details:
+            detail = {'recipient': recipient, 'name': name, 'sent_time': sent_time, 'opened': False, 'replied': False}
+            stats['details'][email_id] = detail
+            if open_time:
+                detail['opened'] = True
+                detail['opened_time'] = open_time
+            if reply:
+                detail['replied'] = True
+                detail['reply_time'] = open_time
+                detail['reply_content'] = reply[1]
+        if open_time:
+            stats['opened'].add(email_id)
+        if reply:
+            stats['replied'].add(email_id)
+    return stats
+
+
+def build_compact(mails, with_details):
+    store = TrackerStore()
+    for email_id, recipient, name, sent_time, open_time, reply in mails:
+        if with_details:
+            store.register(email_id, recipient, name, sent_time)
+        if open_time:
+            store.mark_opened(email_id, open_time)
+        if reply:
+            store.mark_replied(email_id, reply[0], reply[1], open_time)
+    return store
+
+
+# 测量build保留的内存（字节）和耗时，返回(字节数, 秒)。tracemalloc会明显拖慢构建，耗时单独构建一次测量
+def measure(build, mails, with_details):
+    start = time.perf_counter()
+    build(materialize(mails), with_details)
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build(materialize(mails), with_details)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    return retained, elapsed
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    mails = generate_mails(args, rng)
+    opened = sum(1 for mail in mails if mail[3])
+
+    # opens_only场景只统计有打开记录的邮件，与旧版追踪服务器没有注册时一致
+    scenarios = [('details', mails, True, len(mails)),
+                 ('opens_only', [mail for mail in mails if mail[3]], False, opened)]
+
+    print(f"邮件 {len(mails)} 封，打开 {opened} 封，回复 {sum(1 for mail in mails if mail[4])} 封")
+    print(f"\n{'场景':<12} {'实现':<10} {'内存(MB)':>10} {'每封(字节)':>12} {'构建(s)':>9}")
+    metrics = {}
+    for scenario, items, with_details, count in scenarios:
+        results = {}
+        for name, build in (('legacy', build_legacy), ('compact', build_compact)):
+            retained, elapsed = measure(build, items, with_details)
+            results[name] = retained
+            print(f"{scenario:<12} {name:<10} {retained / 1024 / 1024:>10.1f} {retained / count:>12.1f} {elapsed:>9.2f}")
+            metrics[f'{scenario}.{name}.bytes_per_mail'] = round(retained / count, 1)
+            metrics[f'{scenario}.{name}.build_s'] = round(elapsed, 3)
+        ratio = results['legacy'] / results['compact'] if results['compact'] else 0
+        metrics[f'{scenario}.reduction_ratio'] = round(ratio, 2)
+        print(f"{scenario:<12} {'旧/新':<10} {ratio:>10.1f}x")
+
+    params = {key: value for key, value in vars(args).items() if key not in ('baseline', 'save_baseline')}
+    print(f"\n结果已保存到 {save_results(BENCHMARK_NAME, params, metrics)}")
+    if args.save_baseline:
+        print(f"基线已保存到 {save_results(BENCHMARK_NAME, params, metrics, baseline_path(BENCHMARK_NAME))}")
+        return
+
+    regressions = compare_with_baseline(metrics, args.baseline or baseline_path(BENCHMARK_NAME),
+                                        higher_is_better=lambda name: name.endswith('reduction_ratio'))
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
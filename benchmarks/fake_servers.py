@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+基准测试用的本地SMTP/IMAP替身服务器：使用自签名证书提供SMTP_SSL和IMAP4_SSL，
+只实现email_sender实际用到的命令，可配置每条命令的延迟和故障注入（临时错误、断开连接）
+"""
+
+import os
+import random
+import re
+import socket
+import socketserver
+import ssl
+import subprocess
+import threading
+import time
+
+
+# 用openssl在directory中生成localhost的自签名证书，返回(证书文件, 私钥文件)
+def make_self_signed_cert(directory):
+    certfile = os.path.join(directory, 'bench-cert.pem')
+    keyfile = os.path.join(directory, 'bench-key.pem')
+    if not (os.path.exists(certfile) and os.path.exists(keyfile)):
+        try:
+            subprocess.run(
+                ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                 '-subj', '/CN=localhost', '-keyout', keyfile, '-out', certfile],
+                check=True, capture_output=True
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise RuntimeError(f"生成自签名证书失败（需要openssl命令）: {e}")
+    return certfile, keyfile
+
+
+class FaultInjection:
+    """
+    故障注入配置：
+    latency: 每条被注入命令的固定延迟（秒）
+    jitter: 在固定延迟之上增加的0~jitter秒随机延迟
+    error_rate: 返回临时错误的概率
+    disconnect_rate: 直接断开连接的概率
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, disconnect_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.disconnect_rate = disconnect_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        with self._lock:
+            seconds = self.latency + (self._random.random() * self.jitter if self.jitter else 0)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    # 返回本次命令的故障类型：'disconnect'、'error'或None
+    def roll(self):
+        with self._lock:
+            value = self._random.random()
+        if value < self.disconnect_rate:
+            return 'disconnect'
+        if value < self.disconnect_rate + self.error_rate:
+            return 'error'
+        return None
+
+
+class _TLSServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, handler, certfile, keyfile, faults, owner):
+        self.ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.ssl_context.load_cert_chain(certfile, keyfile)
+        self.faults = faults
+        self.owner = owner
+        super().__init__(('127.0.0.1', 0), handler)
+
+    # TLS握手在每个连接自己的线程中进行，不阻塞accept。
+    # 多行响应逐行写入，关闭Nagle算法，避免与客户端的延迟确认叠加出每次约40ms的停顿
+    def finish_request(self, request, client_address):
+        request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            tls_socket = self.ssl_context.wrap_socket(request, server_side=True)
+        except (ssl.SSLError, OSError):
+            return
+        try:
+            super().finish_request(tls_socket, client_address)
+        except (ssl.SSLError, OSError):
+            pass
+        finally:
+            tls_socket.close()
+
+
+class _LineHandler(socketserver.StreamRequestHandler):
+    def send_line(self, line):
+        self.wfile.write(line.encode('utf-8') + b'\r\n')
+        self.wfile.flush()
+
+    def read_line(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        return line.rstrip(b'\r\n').decode('utf-8', errors='replace')
+
+
+class _FakeServer:
+    handler_class = None
+
+    def __init__(self, certfile, keyfile, faults=None):
+        self.faults = faults or FaultInjection()
+        self.stats = {'connections': 0, 'commands': 0, 'errors': 0, 'disconnects': 0}
+        self._stats_lock = threading.Lock()
+        self._server = _TLSServer(self.handler_class, certfile, keyfile, self.faults, self)
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + amount
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name=f'{type(self).__name__}', daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _SMTPHandler(_LineHandler):
+    recipient = ''
+
+    def handle(self):
+        server = self.server.owner
+        server.count('connections')
+        self.send_line('220 localhost ESMTP bench')
+        while True:
+            line = self.read_line()
+            if line is None:
+                return
+            server.count('commands')
+            verb = line.split(' ', 1)[0].upper()
+
+            if verb in ('EHLO', 'HELO'):
+                self.send_line('250-localhost')
+                self.send_line('250-AUTH PLAIN LOGIN')
+                self.send_line('250-8BITMIME')
+                self.send_line('250 SIZE 52428800')
+            elif verb == 'AUTH':
+                parts = line.split()
+                mechanism = parts[1].upper() if len(parts) > 1 else ''
+                if mechanism == 'PLAIN' and len(parts) == 2:
+                    self.send_line('334 ')
+                    self.read_line()
+                elif mechanism == 'LOGIN':
+                    self.send_line('334 VXNlcm5hbWU6')
+                    self.read_line()
+                    self.send_line('334 UGFzc3dvcmQ6')
+                    self.read_line()
+                self.send_line('235 2.7.0 Authentication successful')
+            elif verb == 'RCPT':
+                match = re.search(r'<([^<>]*)>', line)
+                self.recipient = match.group(1) if match else ''
+                self.send_line('250 2.0.0 OK')
+            elif verb in ('MAIL', 'RSET', 'NOOP'):
+                self.send_line('250 2.0.0 OK')
+            elif verb == 'DATA':
+                self.send_line('354 End data with <CR><LF>.<CR><LF>')
+                if not self._receive_data(server):
+                    return
+            elif verb == 'QUIT':
+                self.send_line('221 2.0.0 Bye')
+                return
+            else:
+                self.send_line('502 5.5.2 Command not implemented')
+
+    # 读取邮件内容直到单独一行"."，返回False表示已断开连接
+    def _receive_data(self, server):
+        size = 0
+        message_id = None
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return False
+            if line in (b'.\r\n', b'.\n'):
+                break
+            size += len(line)
+            if message_id is None and line[:11].lower() == b'message-id:':
+                message_id = line[11:].strip().decode('ascii', errors='replace')
+
+        self.server.faults.delay()
+        fault = self.server.faults.roll()
+        if fault == 'disconnect':
+            server.count('disconnects')
+            return False
+        if fault == 'error':
+            server.count('errors')
+            self.send_line('451 4.3.0 Injected temporary failure')
+            return True
+
+        server.record_message(message_id, self.recipient, size)
+        self.send_line(f'250 2.0.0 Ok: queued as {server.stats["messages"]}')
+        return True
+
+
+class FakeSMTPServer(_FakeServer):
+    """
+    SMTP_SSL替身：支持EHLO/AUTH/MAIL/RCPT/DATA/NOOP/RSET/QUIT，
+    延迟和故障注入作用于每封邮件的DATA结束响应。记录收到邮件的(Message-ID, 收件人)，用于生成回复和退信。
+    """
+    handler_class = _SMTPHandler
+
+    def __init__(self, certfile, keyfile, faults=None):
+        super().__init__(certfile, keyfile, faults)
+        self.stats.update({'messages': 0, 'bytes': 0})
+        self.delivered = []
+
+    def record_message(self, message_id, recipient, size):
+        with self._stats_lock:
+            self.stats['messages'] += 1
+            self.stats['bytes'] += size
+            if message_id:
+                self.delivered.append((message_id, recipient))
+
+
+UID_RANGE_PATTERN = re.compile(r'^(\d+)(?::(\d+|\*))?$')
+
+
+# 解析IMAP序列集（如"1,3,5:9"或"12:*"），返回mailbox中匹配的UID列表
+def parse_uid_set(uid_set, uids):
+    if not uids:
+        return []
+    highest = uids[-1]
+    selected = set()
+    for part in uid_set.split(','):
+        match = UID_RANGE_PATTERN.match(part.strip())
+        if not match:
+            continue
+        low = int(match.group(1))
+        if match.group(2) is None:
+            high = low
+        elif match.group(2) == '*':
+            high = highest
+        else:
+            high = int(match.group(2))
+        low, high = min(low, high), max(low, high)
+        selected.update(uid for uid in uids if low <= uid <= high)
+    return sorted(selected)
+
+
+class _IMAPHandler(_LineHandler):
+    def handle(self):
+        server = self.server.owner
+        server.count('connections')
+        self.send_line('* OK [CAPABILITY IMAP4rev1 IDLE UIDPLUS] bench IMAP ready')
+        while True:
+            line = self.read_line()
+            if line is None:
+                return
+            server.count('commands')
+            parts = line.split(' ', 2)
+            if len(parts) < 2:
+                self.send_line('* BAD invalid command')
+                continue
+            tag, command = parts[0], parts[1].upper()
+            args = parts[2] if len(parts) > 2 else ''
+
+            if command == 'CAPABILITY':
+                self.send_line('* CAPABILITY IMAP4rev1 IDLE UIDPLUS')
+                self.send_line(f'{tag} OK CAPABILITY completed')
+            elif command == 'LOGIN':
+                self.send_line(f'{tag} OK LOGIN completed')
+            elif command in ('SELECT', 'EXAMINE'):
+                uids = server.uids()
+                self.send_line(f'* {len(uids)} EXISTS')
+                self.send_line('* 0 RECENT')
+                self.send_line(f'* OK [UIDVALIDITY {server.uidvalidity}] UIDs valid')
+                self.send_line(f'* OK [UIDNEXT {(uids[-1] if uids else 0) + 1}] Predicted next UID')
+                self.send_line(f'{tag} OK [READ-WRITE] SELECT completed')
+            elif command == 'STATUS':
+                self.send_line(f'* STATUS INBOX (UIDVALIDITY {server.uidvalidity})')
+                self.send_line(f'{tag} OK STATUS completed')
+            elif command == 'NOOP':
+                self.send_line(f'{tag} OK NOOP completed')
+            elif command == 'UID':
+                if not self._uid_command(server, tag, args):
+                    return
+            elif command == 'LOGOUT':
+                self.send_line('* BYE bench IMAP logging out')
+                self.send_line(f'{tag} OK LOGOUT completed')
+                return
+            else:
+                self.send_line(f'{tag} BAD command not supported')
+
+    # 处理UID SEARCH和UID FETCH，返回False表示已断开连接
+    def _uid_command(self, server, tag, args):
+        parts = args.split(' ', 1)
+        sub_command = parts[0].upper()
+        rest = parts[1] if len(parts) > 1 else ''
+
+        self.server.faults.delay()
+        fault = self.server.faults.roll()
+        if fault == 'disconnect':
+            server.count('disconnects')
+            return False
+        if fault == 'error':
+            server.count('errors')
+            self.send_line(f'{tag} NO [UNAVAILABLE] Injected temporary failure')
+            return True
+
+        uids = server.uids()
+        if sub_command == 'SEARCH':
+            # 只支持"UID n:*"形式的搜索条件，与email_sender的增量同步一致
+            match = re.search(r'UID\s+(\S+)', rest, re.IGNORECASE)
+            selected = parse_uid_set(match.group(1), uids) if match else list(uids)
+            self.send_line('* SEARCH' + ''.join(f' {uid}' for uid in selected))
+            self.send_line(f'{tag} OK SEARCH completed')
+        elif sub_command == 'FETCH':
+            uid_set = rest.split(' ', 1)[0]
+            for uid in parse_uid_set(uid_set, uids):
+                raw = server.messages[uid]
+                self.wfile.write(f'* {uid} FETCH (UID {uid} BODY[] {{{len(raw)}}}\r\n'.encode('ascii'))
+                self.wfile.write(raw)
+                self.wfile.write(b')\r\n')
+            self.send_line(f'{tag} OK FETCH completed')
+        else:
+            self.send_line(f'{tag} BAD UID command not supported')
+        return True
+
+
+class FakeIMAPServer(_FakeServer):
+    """
+    IMAP4_SSL替身：单个INBOX，支持CAPABILITY/LOGIN/SELECT/STATUS/NOOP/UID SEARCH/UID FETCH/LOGOUT，
+    延迟和故障注入作用于每条UID命令。邮件通过add_message()放入。
+    """
+    handler_class = _IMAPHandler
+
+    def __init__(self, certfile, keyfile, faults=None, uidvalidity=1):
+        super().__init__(certfile, keyfile, faults)
+        self.uidvalidity = uidvalidity
+        self.messages = {}
+        self._uids = []
+
+    def add_message(self, raw):
+        with self._stats_lock:
+            uid = (self._uids[-1] if self._uids else 0) + 1
+            self.messages[uid] = raw
+            self._uids.append(uid)
+        return uid
+
+    def uids(self):
+        with self._stats_lock:
+            return list(self._uids)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+统计查询基准数据生成器：向基准测试数据库写入大量companies和email_tracking记录，分布接近真实数据：
+  - 国家取自config/regions.json，按长尾分布，少量联系人没有国家或邮箱
+  - 发送时间分布在最近若干个月，工作日为主、集中在上午的发送时段，发送量随时间逐步增长
+  - 打开和回复按给定比例，打开/回复延迟服从对数正态分布（大多在一天之内），未来时间的打开/回复不记录
+数据库保留，供bench_stats_queries.py重复使用。
+
+用法: python benchmarks/generate_stats_data.py [--companies 3000000] [--tracking 2000000] [--months 6]
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BENCH_DIR)
+from bench_common import REPO_DIR, ThrowawayDatabase, connect
+from email_ids import new_id_bytes
+
+# 统计查询基准默认使用的数据库
+DEFAULT_DB_NAME = 'mailbox_bench_stats'
+
+POSITIONS = ['Purchasing Manager', 'CEO', 'Import Director', 'Sales Manager', 'Owner', '']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='统计查询基准数据生成器')
+    parser.add_argument('--db-name', default=DEFAULT_DB_NAME, help='写入的数据库名')
+    parser.add_argument('--companies', type=int, default=3000000, help='companies记录数')
+    parser.add_argument('--tracking', type=int, default=2000000, help='email_tracking记录数（不超过companies）')
+    parser.add_argument('--months', type=int, default=6, help='发送时间分布的月数')
+    parser.add_argument('--open-rate', type=float, default=0.22, help='打开率')
+    parser.add_argument('--reply-rate', type=float, default=0.03, help='回复率')
+    parser.add_argument('--batch-size', type=int, default=5000, help='每批插入的记录数')
+    parser.add_argument('--seed', type=int, default=42, help='随机数种子')
+    parser.add_argument('--drop', action='store_true', help='先删除已存在的同名数据库')
+    return parser.parse_args()
+
+
+# 读取所有国家，并按打乱后的排名赋予长尾权重
+def load_countries(rng):
+    with open(os.path.join(REPO_DIR, 'config', 'regions.json'), 'r', encoding='utf-8') as f:
+        regions = json.load(f)
+    countries = sorted({country for members in regions.values() for country in members})
+    rng.shuffle(countries)
+    weights = [1 / (rank + 1) ** 1.1 for rank in range(len(countries))]
+    return countries, weights
+
+
+# 每天的发送量权重：工作日为主，随时间线性增长
+def build_days(months, now):
+    first_day = (now - timedelta(days=months * 30)).replace(hour=0, minute=0, second=0, microsecond=0)
+    days = []
+    weights = []
+    total = months * 30
+    for i in range(total):
+        day = first_day + timedelta(days=i)
+        weekday_factor = 1.0 if day.weekday() < 5 else 0.2
+        days.append(day)
+        weights.append(weekday_factor * (1 + i / total))
+    return days, weights
+
+
+class TrackingGenerator:
+    def __init__(self, args, now, rng):
+        self.now = now
+        self.rng = rng
+        self.days, self.day_weights = build_days(args.months, now)
+        self.open_rate = args.open_rate
+        # 大部分回复来自已打开的邮件，少数来自屏蔽了图片的客户端
+        self.reply_if_opened = min(1.0, args.reply_rate * 0.85 / args.open_rate) if args.open_rate > 0 else 0
+        self.reply_if_unopened = args.reply_rate * 0.15 / (1 - args.open_rate) if args.open_rate < 1 else 0
+
+    def sent_time(self):
+        day = self.rng.choices(self.days, self.day_weights)[0]
+        # 09:00开始发送，按发送间隔逐渐分散到白天
+        seconds = 9 * 3600 + min(self.rng.expovariate(1 / 3600), 10 * 3600)
+        return day + timedelta(seconds=seconds)
+
+    # 在sent_time之后经过对数正态延迟的时间，超过当前时间时返回None
+    def after(self, sent_time, median_hours, sigma):
+        delay = self.rng.lognormvariate(math.log(median_hours * 3600), sigma)
+        moment = sent_time + timedelta(seconds=delay)
+        return moment if moment <= self.now else None
+
+    def row(self, company_name, contact_name, email):
+        sent_time = self.sent_time()
+        open_time = self.after(sent_time, 3, 1.2) if self.rng.random() < self.open_rate else None
+        reply_probability = self.reply_if_opened if open_time else self.reply_if_unopened
+        reply_time = self.after(sent_time, 20, 1.0) if self.rng.random() < reply_probability else None
+        return (
+            company_name, contact_name, email,
+            reply_time is not None, open_time is not None,
+            sent_time.strftime('%Y-%m-%d %H:%M:%S'),
+            open_time.strftime('%Y-%m-%d %H:%M:%S') if open_time else None,
+            reply_time.strftime('%Y-%m-%d %H:%M:%S') if reply_time else None,
+            # 与email_sender一致，ID中的时间为发送时间
+            new_id_bytes(sent_time.timestamp())
+        )
+
+
+def generate(args, db_config):
+    rng = random.Random(args.seed)
+    countries, country_weights = load_countries(rng)
+    tracking = TrackingGenerator(args, datetime.now(), rng)
+    sent_probability = args.tracking / args.companies
+
+    connection = connect(db_config, db_config['database'])
+    cursor = connection.cursor()
+    company_rows = []
+    tracking_rows = []
+    written_companies = 0
+    written_tracking = 0
+    start = time.perf_counter()
+
+    def flush():
+        nonlocal written_companies, written_tracking
+        if company_rows:
+            cursor.executemany(
+                "INSERT INTO companies (company_name, company_country, contact_name, contact_email, "
+                "contact_position, contact_email_sent) VALUES (%s, %s, %s, %s, %s, %s)",
+                company_rows
+            )
+            written_companies += len(company_rows)
+            company_rows.clear()
+        if tracking_rows:
+            cursor.executemany(
+                "INSERT INTO email_tracking (company_name, contact_name, email, is_replied, is_opened, "
+                "sent_time, open_time, reply_time, email_id) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                tracking_rows
+            )
+            written_tracking += len(tracking_rows)
+            tracking_rows.clear()
+        connection.commit()
+
+    for i in range(args.companies):
+        suffix = f'{i:08d}'
+        company_name = f'Bench Foods {suffix}'
+        contact_name = f'Buyer {suffix}'
+        country = rng.choices(countries, country_weights)[0] if rng.random() > 0.03 else ''
+        email = f'buyer{suffix}@company{i % 20000}.example.com' if rng.random() > 0.05 else ''
+        # 约5%的联系人没有邮箱，有邮箱的联系人按比例提高发送概率，使发送记录数接近--tracking
+        sent = bool(email) and written_tracking + len(tracking_rows) < args.tracking \
+            and rng.random() < sent_probability / 0.95
+        company_rows.append((company_name, country, contact_name, email, rng.choice(POSITIONS), sent))
+        if sent:
+            tracking_rows.append(tracking.row(company_name, contact_name, email))
+
+        if len(company_rows) >= args.batch_size:
+            flush()
+            if written_companies % (args.batch_size * 20) == 0:
+                elapsed = time.perf_counter() - start
+                print(f"已写入 {written_companies} 个联系人、{written_tracking} 条发送记录，"
+                      f"{written_companies / elapsed:.0f} 行/秒")
+    flush()
+
+    cursor.close()
+    connection.close()
+    elapsed = time.perf_counter() - start
+    print(f"完成: {written_companies} 个联系人、{written_tracking} 条发送记录，用时 {elapsed:.1f} 秒")
+
+
+def main():
+    args = parse_args()
+    if args.tracking > args.companies:
+        sys.exit("--tracking不能超过--companies，每条发送记录对应一个已发送的联系人")
+
+    from config_loader import get_db_config
+    db_config = get_db_config()
+    if args.drop:
+        connection = connect(db_config)
+        cursor = connection.cursor()
+        cursor.execute(f"DROP DATABASE IF EXISTS `{args.db_name}`")
+        cursor.close()
+        connection.close()
+
+    with ThrowawayDatabase(db_config, name=args.db_name, keep=True) as bench_db_config:
+        generate(args, bench_db_config)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+退信处理：解析投递状态通知(DSN)，将硬退信地址写入屏蔽表，并记录软退信次数
+"""
+
+import email
+import logging
+import re
+import time
+from datetime import datetime
+
+from sql_tools.storage import Error, backend, connect_db
+
+from metrics import DB_WRITE_SECONDS
+
+logger = logging.getLogger('email_sender')
+
+# 软退信累计达到该次数后也加入屏蔽
+SOFT_BOUNCE_LIMIT = 3
+
+STATUS_PATTERN = re.compile(r'\b([245])\.\d{1,3}\.\d{1,3}\b')
+MESSAGE_ID_PATTERN = re.compile(r'<([^<>@\s]+)@[^<>\s]*>')
+
+
+# 规范化邮箱地址，用于屏蔽表和去重
+def normalize_address(address):
+    return (address or '').strip().strip('<>').lower()
+
+
+# 从"rfc822; user@example.com"格式的字段中取出邮箱地址
+def _address_field(value):
+    if not value:
+        return ''
+    value = str(value)
+    if ';' in value:
+        value = value.split(';', 1)[1]
+    return normalize_address(value)
+
+
+# 从退信附带的原始邮件头中取出本系统的邮件ID
+def _original_email_id(part):
+    headers = None
+    if part.get_content_type() == 'text/rfc822-headers':
+        payload = part.get_payload(decode=True)
+        if payload:
+            headers = email.message_from_bytes(payload)
+    elif part.get_content_type() == 'message/rfc822':
+        payload = part.get_payload()
+        if isinstance(payload, list) and payload:
+            headers = payload[0]
+    if headers is None:
+        return None
+    match = MESSAGE_ID_PATTERN.search(str(headers.get('Message-ID', '')))
+    return match.group(1) if match else None
+
+
+# 根据Action和Status判断退信类型：'hard'、'soft'或None（非失败通知）。
+# delayed只表示仍在重试，一次慢投递常会产生多封，不计为软退信；只有failed的4.x.x才是软退信
+def classify(action, status):
+    action = (action or '').strip().lower()
+    if action in ('delivered', 'relayed', 'expanded', 'delayed'):
+        return None
+    if status.startswith('5'):
+        return 'hard'
+    if action == 'failed':
+        return 'soft' if status.startswith('4') else 'hard'
+    return None
+
+
+def parse_dsn(message):
+    """
+    解析DSN（multipart/report; report-type=delivery-status）退信，
+    返回每个失败收件人的列表: [{recipient, status, action, diagnostic, email_id, hard}]。
+    不是退信的邮件返回空列表。
+    """
+    bounces = []
+    email_id = None
+    status_parts = []
+
+    if message.get_content_type() == 'multipart/report':
+        for part in message.walk():
+            content_type = part.get_content_type()
+            if content_type == 'message/delivery-status':
+                status_parts.append(part)
+            elif content_type in ('text/rfc822-headers', 'message/rfc822') and email_id is None:
+                email_id = _original_email_id(part)
+
+    for part in status_parts:
+        # 第一个字段块为整封邮件的信息，其余每块对应一个收件人
+        blocks = part.get_payload()
+        if not isinstance(blocks, list):
+            continue
+        for block in blocks[1:]:
+            recipient = _address_field(block.get('Final-Recipient') or block.get('Original-Recipient'))
+            match = STATUS_PATTERN.search(str(block.get('Status', '')))
+            status = match.group(0) if match else ''
+            kind = classify(block.get('Action'), status)
+            if not recipient or kind is None:
+                continue
+            bounces.append({
+                'recipient': recipient,
+                'status': status,
+                'action': str(block.get('Action', '')).strip().lower(),
+                'diagnostic': str(block.get('Diagnostic-Code', '')).strip()[:500],
+                'email_id': email_id,
+                'hard': kind == 'hard'
+            })
+
+    # 非标准退信：部分服务器只提供X-Failed-Recipients头
+    if not bounces and message.get('X-Failed-Recipients'):
+        for recipient in str(message.get('X-Failed-Recipients')).split(','):
+            recipient = normalize_address(recipient)
+            if recipient:
+                bounces.append({
+                    'recipient': recipient,
+                    'status': '5.0.0',
+                    'action': 'failed',
+                    'diagnostic': '',
+                    'email_id': email_id,
+                    'hard': True
+                })
+
+    return bounces
+
+
+# 屏蔽表的插入或更新语句（硬退信, 软退信），按存储后端区分写法
+SUPPRESSION_UPSERTS = {
+    'mysql': (
+        """
+        INSERT INTO email_suppression
+        (email, reason, is_suppressed, status_code, diagnostic, last_email_id, last_bounce_time)
+        VALUES (%s, 'hard_bounce', TRUE, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            reason = 'hard_bounce',
+            is_suppressed = TRUE,
+            status_code = VALUES(status_code),
+            diagnostic = VALUES(diagnostic),
+            last_email_id = VALUES(last_email_id),
+            last_bounce_time = VALUES(last_bounce_time)
+        """,
+        # MySQL按顺序执行赋值，is_suppressed使用的是已加1后的soft_bounce_count
+        f"""
+        INSERT INTO email_suppression
+        (email, reason, is_suppressed, soft_bounce_count, status_code, diagnostic, last_email_id, last_bounce_time)
+        VALUES (%s, 'soft_bounce', FALSE, 1, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            soft_bounce_count = soft_bounce_count + 1,
+            is_suppressed = is_suppressed OR soft_bounce_count >= {SOFT_BOUNCE_LIMIT},
+            status_code = VALUES(status_code),
+            diagnostic = VALUES(diagnostic),
+            last_email_id = VALUES(last_email_id),
+            last_bounce_time = VALUES(last_bounce_time)
+        """
+    ),
+    'sqlite': (
+        """
+        INSERT INTO email_suppression
+        (email, reason, is_suppressed, status_code, diagnostic, last_email_id, last_bounce_time)
+        VALUES (%s, 'hard_bounce', TRUE, %s, %s, %s, %s)
+        ON CONFLICT (email) DO UPDATE SET
+            reason = 'hard_bounce',
+            is_suppressed = TRUE,
+            status_code = excluded.status_code,
+            diagnostic = excluded.diagnostic,
+            last_email_id = excluded.last_email_id,
+            last_bounce_time = excluded.last_bounce_time
+        """,
+        # SQLite的赋值都基于更新前的行，is_suppressed需要自己加1
+        f"""
+        INSERT INTO email_suppression
+        (email, reason, is_suppressed, soft_bounce_count, status_code, diagnostic, last_email_id, last_bounce_time)
+        VALUES (%s, 'soft_bounce', FALSE, 1, %s, %s, %s, %s)
+        ON CONFLICT (email) DO UPDATE SET
+            soft_bounce_count = soft_bounce_count + 1,
+            is_suppressed = is_suppressed OR soft_bounce_count + 1 >= {SOFT_BOUNCE_LIMIT},
+            status_code = excluded.status_code,
+            diagnostic = excluded.diagnostic,
+            last_email_id = excluded.last_email_id,
+            last_bounce_time = excluded.last_bounce_time
+        """
+    )
+}
+
+
+def record_bounces(bounces, db_config):
+    """
+    将退信写入email_suppression表：硬退信直接屏蔽，软退信累加次数，
+    达到SOFT_BOUNCE_LIMIT后屏蔽。返回写入的记录数，写入失败时返回None。
+    """
+    if not bounces:
+        return 0
+
+    bounce_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    hard_rows = []
+    soft_rows = []
+    for bounce in bounces:
+        row = (bounce['recipient'], bounce['status'], bounce['diagnostic'], bounce['email_id'], bounce_time)
+        (hard_rows if bounce['hard'] else soft_rows).append(row)
+
+    connection = None
+    try:
+        connection = connect_db(db_config)
+        cursor = connection.cursor()
+        start = time.perf_counter()
+
+        hard_query, soft_query = SUPPRESSION_UPSERTS[backend(db_config)]
+        if hard_rows:
+            cursor.executemany(hard_query, hard_rows)
+        if soft_rows:
+            cursor.executemany(soft_query, soft_rows)
+
+        connection.commit()
+        DB_WRITE_SECONDS.labels(operation='suppression_upsert').observe(time.perf_counter() - start)
+        cursor.close()
+        logger.info(f"已记录退信: 硬退信 {len(hard_rows)} 个, 软退信 {len(soft_rows)} 个")
+        return len(hard_rows) + len(soft_rows)
+    except Error as e:
+        logger.error(f"记录退信到屏蔽表失败: {e}")
+        return None
+    finally:
+        if connection is not None and connection.is_connected():
+            connection.close()
+
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+多活动并发发送：多个营销活动共享有限的发送并发数，按各自的并发配额加权公平分配发送槽位，
+一个活动的长时间发送不会阻塞其他活动
+"""
+
+import logging
+import os
+import threading
+
+from log_setup import PER_MAIL
+
+logger = logging.getLogger('email_tracker')
+
+# 每个工作线程两次发送之间的默认间隔（秒），基准测试时可设为0
+SEND_PACING_SECONDS = float(os.getenv('SEND_PACING_SECONDS', '5'))
+
+
+class SendCapacity:
+    """
+    全局发送槽位。每个活动以max_concurrency作为权重和上限，
+    有空闲槽位时优先分配给"已发送数/权重"最小的等待活动（加权轮转）。
+    同时记录各活动正在发送的地址，避免目标重叠的活动同时给同一地址发信。
+    """
+
+    def __init__(self, total):
+        self.total = max(1, int(total))
+        self.active = 0
+        self.campaigns = {}
+        self.in_flight = set()
+        self._cond = threading.Condition()
+
+    def register(self, name, share):
+        share = max(1, int(share))
+        with self._cond:
+            # 新加入的活动从当前最小加权发送量开始计数，避免它长时间独占槽位
+            base = min((state['served'] / state['share'] for state in self.campaigns.values()), default=0)
+            self.campaigns[name] = {'share': share, 'active': 0, 'waiting': 0, 'served': base * share}
+
+    def unregister(self, name):
+        with self._cond:
+            self.campaigns.pop(name, None)
+            self._cond.notify_all()
+
+    # 在所有可以获得槽位的等待活动中，选出加权发送量最小的一个
+    def _next_campaign(self):
+        candidates = [
+            (state['served'] / state['share'], state['active'] / state['share'], name)
+            for name, state in self.campaigns.items()
+            if state['waiting'] and state['active'] < state['share']
+        ]
+        return min(candidates)[2] if candidates else None
+
+    def acquire(self, name, stop_event=None):
+        """等待并占用一个发送槽位，stop_event被设置时放弃等待并返回False"""
+        with self._cond:
+            state = self.campaigns[name]
+            state['waiting'] += 1
+            try:
+                while self.active >= self.total or self._next_campaign() != name:
+                    if stop_event is not None and stop_event.is_set():
+                        return False
+                    self._cond.wait(timeout=1)
+                state['active'] += 1
+                state['served'] += 1
+                self.active += 1
+                return True
+            finally:
+                state['waiting'] -= 1
+
+    def release(self, name):
+        with self._cond:
+            state = self.campaigns.get(name)
+            if state:
+                state['active'] -= 1
+            self.active -= 1
+            self._cond.notify_all()
+
+    # 声明正在给某地址发信，已被其他活动占用时返回False
+    def claim(self, address):
+        with self._cond:
+            if address in self.in_flight:
+                return False
+            self.in_flight.add(address)
+            return True
+
+    def unclaim(self, address):
+        with self._cond:
+            self.in_flight.discard(address)
+
+    # 当前已注册活动在发送间隔限制下每分钟最多能发送的邮件数
+    def pacing_rate(self, pacing=SEND_PACING_SECONDS):
+        with self._cond:
+            workers = min(self.total, sum(state['share'] for state in self.campaigns.values()))
+        return workers * 60 / pacing if pacing > 0 else 0
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                'total': self.total,
+                'active': self.active,
+                'campaigns': {name: dict(state) for name, state in self.campaigns.items()}
+            }
+
+
+def run_campaign(name, recipients, target_count, send_func, capacity,
+                 concurrency=1, skip_func=None, pacing=SEND_PACING_SECONDS, stop_event=None, on_result=None):
+    """
+    以concurrency个工作线程执行一个活动的发送，每次发送前从capacity获取槽位。
+    recipients: 候选收件人列表（通常多取一些以应对失败或跳过）
+    send_func(recipient): 发送单封邮件，成功返回True
+    skip_func(recipient): 返回True表示跳过该收件人（已发送、已屏蔽等），不占用槽位和发送间隔
+    pacing: 每个工作线程两次发送之间的间隔秒数，避免被识别为垃圾邮件发送者
+    stop_event: 被设置后不再开始新的发送，用于取消
+    on_result(recipient, outcome): 每个收件人处理完成后调用，outcome为'sent'、'failed'或'skipped'
+    返回成功发送数量
+    """
+    lock = threading.Lock()
+    pending = iter(recipients)
+    processed_emails = set()
+    counters = {'success': 0, 'in_progress': 0}
+    stop_event = stop_event or threading.Event()
+
+    # 取出下一个需要发送的收件人，已达到目标数量或没有收件人时返回None
+    def next_recipient():
+        while True:
+            with lock:
+                if counters['success'] + counters['in_progress'] >= target_count:
+                    return None
+                recipient = next(pending, None)
+                if recipient is None:
+                    return None
+                recipient_email = recipient.get('email', '').strip().upper()
+                if not recipient_email or recipient_email in processed_emails:
+                    continue
+                processed_emails.add(recipient_email)
+            if skip_func and skip_func(recipient):
+                if on_result:
+                    on_result(recipient, 'skipped')
+                continue
+            if not capacity.claim(recipient_email):
+                logger.info(f"[{name}] {recipient_email} 正在由其他活动发送，跳过", extra=PER_MAIL)
+                continue
+            with lock:
+                counters['in_progress'] += 1
+            return recipient
+
+    def worker():
+        while not stop_event.is_set():
+            recipient = next_recipient()
+            if recipient is None:
+                return
+            recipient_email = recipient.get('email', '').strip().upper()
+            sent = False
+            try:
+                if not capacity.acquire(name, stop_event):
+                    return
+                try:
+                    sent = send_func(recipient)
+                finally:
+                    capacity.release(name)
+            except Exception as e:
+                logger.error(f"活动 {name} 发送至 {recipient_email} 时出错: {e}")
+            finally:
+                capacity.unclaim(recipient_email)
+                with lock:
+                    counters['in_progress'] -= 1
+                    if sent:
+                        counters['success'] += 1
+                    progress = counters['success']
+
+            if on_result:
+                on_result(recipient, 'sent' if sent else 'failed')
+            if sent:
+                logger.info(f"[{name}] 成功发送至 {recipient_email}，当前进度: {progress}/{target_count}", extra=PER_MAIL)
+            else:
+                logger.info(f"[{name}] 发送至 {recipient_email} 失败或已经发送过，跳过", extra=PER_MAIL)
+
+            # 短暂延迟，避免被识别为垃圾邮件发送者
+            stop_event.wait(pacing)
+
+    capacity.register(name, concurrency)
+    try:
+        workers = [
+            threading.Thread(target=worker, name=f'campaign-{name}-{i}', daemon=True)
+            for i in range(max(1, int(concurrency)))
+        ]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+    finally:
+        capacity.unregister(name)
+
+    return counters['success']
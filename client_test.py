@@ -12,7 +12,8 @@ def main(
     daily_count: Optional[int] = 20,
     workdays: Optional[Union[str, List[int]]] = None,  # 发送邮件的工作日，0-6表示周一到周日
     count: Optional[int] = None,  # 临时发送邮件数量参数
-    all_data: Optional[bool] = False  # 新增是否获取所有数据统计参数
+    all_data: Optional[bool] = False,  # 新增是否获取所有数据统计参数
+    job_id: Optional[str] = None  # 后台任务ID，查询或取消临时发送任务时使用
 ) -> dict:
     """
     统一处理邮件发送系统的API请求接口函数。
@@ -25,7 +26,9 @@ def main(
             - "stop": 停止邮件发送任务
             - "stats": 获取统计数据
             - "send-now": 立即执行一次邮件发送任务
-            - "send-temp": 临时发送指定数量的邮件到指定国家或区域
+            - "send-temp": 临时发送指定数量的邮件到指定国家或区域，立即返回后台任务ID
+            - "jobs": 查看后台任务进度，不提供job_id时列出最近的任务
+            - "cancel-job": 取消后台任务
 
         target_regions (Union[str, List[str]], 可选): 目标区域列表或单个区域字符串，用于按区域发送邮件
             例如: ["南美洲", "东南亚"] 或 "南美洲"
@@ -64,6 +67,9 @@ def main(
         all_data (bool, 可选): 是否获取所有统计数据，默认为False
             注意: 仅在获取统计数据(suffix="stats")时可用，若为True则忽略date参数
 
+        job_id (str, 可选): 后台任务ID，由send-temp或send-now返回
+            注意: 在查看(suffix="jobs")或取消(suffix="cancel-job")后台任务时使用
+
     返回:
         dict: API响应的JSON数据
 
@@ -204,6 +210,18 @@ def main(
             
         response = requests.post(url, headers=headers, json=payload)
     
+    elif suffix == "jobs":
+        # GET请求 - 查看后台任务进度
+        url = f"{base_url}/jobs/{job_id}" if job_id else f"{base_url}/jobs"
+        response = requests.get(url)
+    
+    elif suffix == "cancel-job":
+        # POST请求 - 取消后台任务
+        if not job_id:
+            raise ValueError("job_id must be provided")
+        url = f"{base_url}/jobs/{job_id}/cancel"
+        response = requests.post(url)
+    
     elif suffix == "stop":
         # POST请求 - 停止邮件发送任务
         url = f"{base_url}/stop"
@@ -9,8 +9,7 @@ import os
 import logging
 from dotenv import load_dotenv
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 日志由入口程序配置（见log_setup），未配置时警告仍会输出到stderr
 logger = logging.getLogger('config_loader')
 
 # 加载.env文件
@@ -23,7 +22,9 @@ DB_CONFIG = {
     'user': os.getenv('DB_USER'),
     'password': os.getenv('DB_PASSWORD'),
     'database': os.getenv('DB_NAME'),
-    'table_name': 'companies'  # 表名不是敏感信息，保留在代码中
+    'table_name': 'companies',  # 表名不是敏感信息，保留在代码中
+    'backend': os.getenv('DB_BACKEND', 'mysql'),  # mysql或sqlite
+    'sqlite_path': os.getenv('SQLITE_PATH', 'logs/mailbox.db')  # sqlite后端的数据库文件
 }
 
 # 邮件配置
@@ -36,31 +37,53 @@ EMAIL_CONFIG = {
     'password': os.getenv('EMAIL_PASSWORD'),
     'sender_name': os.getenv('SENDER_NAME'),
     'tracker_url': os.getenv('TRACKER_URL', 'http://localhost:5000'),
+    'max_concurrent_sends': int(os.getenv('MAX_CONCURRENT_SENDS', '4')),  # 所有活动共享的最大并发发送数
     'verify_ssl': False  # 不是敏感信息，保留在代码中
 }
 
+# 已检查过的配置（db、email），每类只在第一次获取时检查一次
+_checked = set()
+
 def get_db_config():
-    """获取数据库配置"""
+    """获取数据库配置，第一次获取时检查是否完整"""
+    _check_once('db', missing_db_config, "数据库配置缺失")
     return DB_CONFIG
 
 def get_email_config():
-    """获取邮件配置"""
+    """获取邮件配置，第一次获取时检查是否完整"""
+    _check_once('email', missing_email_config, "邮件配置缺失")
     return EMAIL_CONFIG
 
+def missing_db_config():
+    missing = [key for key, value in DB_CONFIG.items() if value is None and key != 'table_name']
+    # SQLite后端不需要MySQL服务器的连接信息
+    if DB_CONFIG['backend'] == 'sqlite':
+        missing = [key for key in missing if key not in ['host', 'user', 'password', 'database']]
+    return missing
+
+def missing_email_config():
+    return [key for key, value in EMAIL_CONFIG.items() if value is None and key not in ['verify_ssl']]
+
+# 只用到数据库的脚本（如sql_tools）不会因为缺少邮件配置而打印警告
+def _check_once(kind, find_missing, message):
+    if kind in _checked:
+        return
+    _checked.add(kind)
+    missing = find_missing()
+    if missing:
+        logger.warning(f"{message}: {', '.join(missing)}")
+        logger.warning("请确保.env文件存在并包含所有必要的环境变量")
+
 # 验证配置是否完整
 def validate_config():
     """验证配置是否完整，如果有缺失则打印警告"""
-    missing_db_config = [key for key, value in DB_CONFIG.items() if value is None and key != 'table_name']
-    missing_email_config = [key for key, value in EMAIL_CONFIG.items() if value is None and key not in ['verify_ssl']]
+    missing_db = missing_db_config()
+    missing_email = missing_email_config()
     
-    if missing_db_config:
-        logger.warning(f"数据库配置缺失: {', '.join(missing_db_config)}")
+    if missing_db:
+        logger.warning(f"数据库配置缺失: {', '.join(missing_db)}")
     
-    if missing_email_config:
-        logger.warning(f"邮件配置缺失: {', '.join(missing_email_config)}")
+    if missing_email:
+        logger.warning(f"邮件配置缺失: {', '.join(missing_email)}")
     
-    return len(missing_db_config) == 0 and len(missing_email_config) == 0
-
-# 当模块被导入时验证配置
-if not validate_config():
-    logger.warning("请确保.env文件存在并包含所有必要的环境变量")
+    return len(missing_db) == 0 and len(missing_email) == 0
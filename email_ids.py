@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+邮件ID：按时间递增的UUIDv7（前48位为毫秒时间戳），数据库中以16字节二进制保存，
+追踪链接和Message-ID中使用22个字符的URL安全编码。
+
+编码使用按ASCII顺序排列的64个URL安全字符（-0-9A-Z_a-z），文本ID的字典序与时间顺序一致，
+按文本保存的地方（tracked_emails的主键、JSON状态文件）同样按时间顺序插入。
+旧版邮件使用的36个字符的UUID文本仍可解码为相同的16字节，迁移见sql_tools/migrate_email_ids.py。
+"""
+
+import base64
+import binascii
+import secrets
+import threading
+import time
+
+ID_SIZE = 16
+ID_TEXT_LENGTH = 22
+LEGACY_ID_TEXT_LENGTH = 36
+
+# 标准base64url字母表与按ASCII排序的字母表之间的转换表
+_URLSAFE_ALPHABET = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'
+_SORTED_ALPHABET = b'-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz'
+_ENCODE_TABLE = bytes.maketrans(_URLSAFE_ALPHABET, _SORTED_ALPHABET)
+_DECODE_TABLE = bytes.maketrans(_SORTED_ALPHABET, _URLSAFE_ALPHABET)
+
+# 同一毫秒内生成的ID用12位计数器（RFC 9562的rand_a）保持递增
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def new_id_bytes(timestamp=None):
+    """
+    生成16字节的UUIDv7。timestamp（秒）为None时取当前时间，同一进程内严格递增；
+    指定时间时（如生成历史数据）计数器取随机值
+    """
+    global _last_ms, _counter
+    if timestamp is not None:
+        ms = int(timestamp * 1000)
+        counter = secrets.randbits(12)
+    else:
+        with _lock:
+            ms = time.time_ns() // 1000000
+            if ms > _last_ms:
+                _last_ms = ms
+                # 起始值只取11位随机数，给同一毫秒内的递增留出空间
+                _counter = secrets.randbits(11)
+            else:
+                _counter += 1
+                if _counter > 0xFFF:
+                    # 计数器用完时借用下一毫秒
+                    _last_ms += 1
+                    _counter = secrets.randbits(11)
+            ms = _last_ms
+            counter = _counter
+    value = (ms & 0xFFFFFFFFFFFF) << 80 | 0x7 << 76 | counter << 64 | 0b10 << 62 | secrets.randbits(62)
+    return value.to_bytes(ID_SIZE, 'big')
+
+
+def encode_id(raw):
+    """16字节ID编码为22个字符的文本"""
+    return base64.urlsafe_b64encode(bytes(raw))[:ID_TEXT_LENGTH].translate(_ENCODE_TABLE).decode('ascii')
+
+
+def new_email_id(timestamp=None):
+    """生成新的邮件ID文本，用于追踪链接、Message-ID和跟踪服务器注册"""
+    return encode_id(new_id_bytes(timestamp))
+
+
+# 旧版ID：小写、带连字符的36个字符的UUID
+def _legacy_id_bytes(email_id):
+    if (email_id[8] != '-' or email_id[13] != '-' or email_id[18] != '-' or email_id[23] != '-'
+            or email_id.lower() != email_id):
+        return None
+    try:
+        raw = bytes.fromhex(email_id.replace('-', ''))
+    except ValueError:
+        return None
+    return raw if len(raw) == ID_SIZE else None
+
+
+def id_bytes(email_id):
+    """
+    邮件ID转换为数据库中保存的16字节：新格式（22个字符的UUIDv7）和旧格式（36个字符的UUID）都可以，
+    已是16字节时原样返回，其他格式返回None
+    """
+    if isinstance(email_id, (bytes, bytearray)):
+        return bytes(email_id) if len(email_id) == ID_SIZE else None
+    if not isinstance(email_id, str):
+        return None
+    if len(email_id) == LEGACY_ID_TEXT_LENGTH:
+        return _legacy_id_bytes(email_id)
+    if len(email_id) != ID_TEXT_LENGTH:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(email_id.encode('ascii').translate(_DECODE_TABLE) + b'==')
+    except (UnicodeEncodeError, binascii.Error, ValueError):
+        return None
+    # 往返一致且版本为7、变体为RFC 9562时才是本系统生成的ID
+    if len(raw) != ID_SIZE or encode_id(raw) != email_id or raw[6] >> 4 != 7 or raw[8] >> 6 != 0b10:
+        return None
+    return raw
+
+
+def is_mail_id(email_id):
+    """是否为本系统生成的邮件ID（新格式或旧格式）"""
+    return id_bytes(email_id) is not None
+
+
+def is_legacy_id(email_id):
+    return isinstance(email_id, str) and len(email_id) == LEGACY_ID_TEXT_LENGTH
+
+
+def legacy_id_text(raw):
+    """16字节ID按旧格式（UUID文本）输出"""
+    text = bytes(raw).hex()
+    return f'{text[:8]}-{text[8:12]}-{text[12:16]}-{text[16:20]}-{text[20:]}'
@@ -5,42 +5,37 @@
 邮件发送程序：负责定时发送带有跟踪图片的邮件
 """
 
-import smtplib
-import ssl
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
 from email.utils import formataddr
 import logging
 import time
 import json
-import uuid
 import os
-import schedule
-import imaplib
-import email
-from email.header import decode_header
+from collections import deque
 from datetime import datetime
 import threading
-import requests
-import mysql.connector
-from mysql.connector import Error
-
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/sender.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger('email_sender')
+from sql_tools.storage import Error, connect_db
+
+from lazy_import import lazy_module
+from log_setup import PER_MAIL, setup_logging
 
-# 确保日志目录存在
-os.makedirs('logs', exist_ok=True)
+# 发送、收信和上报时才导入，api_server等导入本模块时不加载
+requests = lazy_module('requests')
+smtplib = lazy_module('smtplib')
+ssl = lazy_module('ssl')
+tls_session = lazy_module('tls_session')
+
+# 日志由入口程序配置（直接运行本文件时见__main__，api_server见其setup_logging）
+logger = logging.getLogger('email_sender')
 
 # 从配置加载器导入配置
 from config_loader import get_email_config, get_db_config
+from reply_pipeline import FETCH_BATCH_SIZE, ParsePool, parse_fetch_response
+from bounce_processor import record_bounces
+from email_ids import id_bytes, new_email_id
+from event_scheduler import EventScheduler, every
+from send_timing import RECORDER as send_timing_recorder, SendTiming
+from metrics import (DB_WRITE_SECONDS, EMAILS_FAILED, EMAILS_SENT, EMAILS_SKIPPED, MAIL_CONNECT_SECONDS,
+                     REGISTRY, SMTP_SEND_SECONDS, TRACKER_REGISTER_SECONDS)
 
 # 邮件配置
 EMAIL_CONFIG = get_email_config()
@@ -59,6 +54,26 @@ smtp_connection = None
 imap_connection = None
 connection_lock = threading.Lock()  # 用于保护连接对象的线程锁
 
+# IMAP IDLE回复监听线程
+reply_listener = None
+
+# IMAP增量同步状态文件，保证同一时间只有一个回复检查在运行
+IMAP_SYNC_STATE_FILE = 'logs/imap_sync_state.json'
+reply_check_lock = threading.Lock()
+
+# 已发送邮件ID索引，用于快速匹配回复
+sent_message_index = None
+
+# 回复邮件解析进程池
+parse_pool = None
+
+# 已发送/已屏蔽地址索引，发送前用于去重
+address_index = None
+
+# 所有SMTP/IMAP连接共用的SSL上下文（TLS会话只能在创建它的上下文中恢复，见tls_session）
+ssl_context = None
+ssl_context_lock = threading.Lock()
+
 # 创建SSL上下文
 def create_ssl_context():
     context = ssl.create_default_context()
@@ -68,6 +83,21 @@ def create_ssl_context():
         logger.info("已禁用SSL证书验证")
     return context
 
+# 获取共用的SSL上下文，首次使用时创建
+def get_ssl_context():
+    global ssl_context
+    with ssl_context_lock:
+        if ssl_context is None:
+            ssl_context = create_ssl_context()
+        return ssl_context
+
+# 记录一次建立连接（含TLS握手和登录）的耗时，返回是否恢复了TLS会话
+def observe_connect(protocol, connection, start):
+    resumed = connection.session_reused
+    MAIL_CONNECT_SECONDS.labels(protocol=protocol, tls_resumed=str(resumed).lower()).observe(
+        time.perf_counter() - start)
+    return resumed
+
 # 初始化SMTP连接
 def init_smtp_connection():
     global smtp_connection
@@ -89,21 +119,35 @@ def init_smtp_connection():
                         pass
                     smtp_connection = None
             
-            # 创建新连接
-            context = create_ssl_context()
-            smtp_connection = smtplib.SMTP_SSL(
+            # 创建新连接，有之前的TLS会话时恢复会话，省去完整握手
+            start = time.perf_counter()
+            smtp_connection = tls_session.ResumableSMTP_SSL(
                 EMAIL_CONFIG['smtp_server'], 
                 EMAIL_CONFIG['smtp_port'], 
-                context=context
+                context=get_ssl_context()
             )
             smtp_connection.login(EMAIL_CONFIG['username'], EMAIL_CONFIG['password'])
-            logger.info("SMTP连接已成功建立")
+            resumed = observe_connect('smtp', smtp_connection, start)
+            logger.info(f"SMTP连接已成功建立{'（恢复TLS会话）' if resumed else ''}")
             return True
         except Exception as e:
             logger.error(f"建立SMTP连接失败: {e}")
             smtp_connection = None
             return False
 
+# 创建一个已登录的IMAP连接
+# （检查回复的连接和IDLE监听连接共用TLS会话缓存）
+def open_imap_connection():
+    start = time.perf_counter()
+    connection = tls_session.ResumableIMAP4_SSL(
+        EMAIL_CONFIG['imap_server'], 
+        EMAIL_CONFIG['imap_port'], 
+        ssl_context=get_ssl_context()
+    )
+    connection.login(EMAIL_CONFIG['username'], EMAIL_CONFIG['password'])
+    observe_connect('imap', connection, start)
+    return connection
+
 # 初始化IMAP连接
 def init_imap_connection():
     global imap_connection
@@ -127,13 +171,7 @@ def init_imap_connection():
                     imap_connection = None
             
             # 创建新连接
-            context = create_ssl_context()
-            imap_connection = imaplib.IMAP4_SSL(
-                EMAIL_CONFIG['imap_server'], 
-                EMAIL_CONFIG['imap_port'], 
-                ssl_context=context
-            )
-            imap_connection.login(EMAIL_CONFIG['username'], EMAIL_CONFIG['password'])
+            imap_connection = open_imap_connection()
             imap_connection.select('INBOX')
             logger.info("IMAP连接已成功建立")
             return True
@@ -159,12 +197,7 @@ def load_recipients():
     global RECIPIENTS
     try:
         # 创建数据库连接
-        connection = mysql.connector.connect(
-            host=DB_CONFIG['host'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            database=DB_CONFIG['database']
-        )
+        connection = connect_db(DB_CONFIG)
         
         if connection.is_connected():
             # 创建游标对象
@@ -245,45 +278,77 @@ def load_template(template_name='C_template.html'):
         </body>
         </html>
         """
+    return EMAIL_TEMPLATE
+
+# 获取已发送/已屏蔽地址索引（首次使用时从数据库加载）
+def get_address_index():
+    global address_index
+    from address_index import AddressIndex
+    
+    if address_index is None:
+        address_index = AddressIndex(DB_CONFIG)
+        address_index.refresh()
+    return address_index
 
 # 检查邮件是否已经发送到指定收件人
 def check_email_already_sent(email):
     """
-    检查邮件是否已经发送到指定邮箱地址
+    检查邮件是否已经发送到指定邮箱地址（查询内存地址索引）
     """
+    return get_address_index().skip_reason(email) == 'sent'
+
+# 将联系人标记为已发送，跳过重复或已屏蔽的地址时使用，避免下次再被选中
+def mark_contact_sent(recipient_id):
     try:
-        connection = mysql.connector.connect(
-            host=DB_CONFIG['host'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            database=DB_CONFIG['database']
-        )
+        connection = connect_db(DB_CONFIG)
         
         if connection.is_connected():
-            cursor = connection.cursor(dictionary=True)
-            
-            # 查询email_tracking表
-            query = """
-            SELECT id FROM email_tracking
-            WHERE email = %s AND sent_time IS NOT NULL
-            LIMIT 1
-            """
-            
-            cursor.execute(query, (email,))
-            result = cursor.fetchone()
-            
+            cursor = connection.cursor()
+            with DB_WRITE_SECONDS.labels(operation='contact_update').time():
+                cursor.execute(
+                    f"UPDATE {DB_CONFIG['table_name']} SET contact_email_sent = 1 WHERE id = %s",
+                    (recipient_id,)
+                )
+                connection.commit()
             cursor.close()
             connection.close()
-            
-            return result is not None
-        
     except Error as e:
-        logger.error(f"检查邮件是否已发送时出错: {e}")
-        
-    return False
+        logger.error(f"更新ID为 {recipient_id} 的联系人发送状态失败: {e}")
 
-# 发送单封邮件
-def send_email(recipient):
+# 发送单封邮件，template为空时使用已加载的全局模板。每封邮件的各阶段耗时记录到send_timing
+def send_email(recipient, template=None):
+    timing = SendTiming()
+    sent = _send_email(recipient, template, timing)
+    # 跳过的收件人没有经过任何阶段，不记录
+    if timing.phases:
+        send_timing_recorder.record(timing, 'sent' if sent else 'failed')
+    return sent
+
+# 服务器对这封邮件返回了错误响应（收件人被拒、临时错误等）时smtplib已发送RSET，连接仍然可用；
+# 连接断开、超时、421（服务器关闭连接）或其他异常时才丢弃连接
+def smtp_connection_usable(error):
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+    elif isinstance(error, smtplib.SMTPResponseException):
+        codes = [error.smtp_code]
+    else:
+        return False
+    return bool(codes) and 421 not in codes
+
+# 已发送过或已屏蔽的地址跳过：计数、记日志并标记联系人，返回是否跳过。
+# send_email和api_server的活动发送（发送前过滤收件人）共用，跳过数都计入EMAILS_SKIPPED
+def skip_recipient(to_email, recipient_id=None, address_index=None):
+    skip_reason = (address_index or get_address_index()).skip_reason(to_email)
+    if not skip_reason:
+        return False
+    EMAILS_SKIPPED.labels(reason=skip_reason).inc()
+    logger.info(f"收件人 {to_email} {'已在屏蔽列表中' if skip_reason == 'suppressed' else '已发送过邮件'}，跳过发送",
+                extra=PER_MAIL)
+    if recipient_id:
+        mark_contact_sent(recipient_id)
+    return True
+
+def _send_email(recipient, template, timing):
     global smtp_connection
     
     name = recipient.get('name', '用户')
@@ -295,51 +360,66 @@ def send_email(recipient):
         logger.error(f"收件人 {name} 没有邮箱地址")
         return False
     
-    # 生成唯一邮件ID
-    email_id = str(uuid.uuid4())
+    # 发送前查询内存地址索引，已发送过或已屏蔽的地址直接跳过
+    if skip_recipient(to_email, recipient_id):
+        return False
     
-    # 创建邮件
-    msg = MIMEMultipart('alternative')
-    msg['Subject'] = recipient.get('subject', '重要信息')
-    msg['From'] = formataddr((EMAIL_CONFIG['sender_name'], EMAIL_CONFIG['username']))
-    msg['To'] = to_email
-    msg['Message-ID'] = f"<{email_id}@{EMAIL_CONFIG['username'].split('@')[1]}>"
+    # 生成唯一邮件ID（按时间递增，数据库中保存为16字节）
+    email_id = new_email_id()
+    timing.email_id = email_id
     
     # 填充模板
-    html_content = EMAIL_TEMPLATE.format(
-        name=name,
-        tracker_url=EMAIL_CONFIG['tracker_url'],
-        email_id=email_id
-    )
+    with timing.phase('template_render'):
+        html_content = (template or EMAIL_TEMPLATE).format(
+            name=name,
+            tracker_url=EMAIL_CONFIG['tracker_url'],
+            email_id=email_id
+        )
     
-    # 附加HTML内容
-    msg.attach(MIMEText(html_content, 'html'))
+    # 创建邮件并附加HTML内容
+    with timing.phase('mime_build'):
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = recipient.get('subject', '重要信息')
+        msg['From'] = formataddr((EMAIL_CONFIG['sender_name'], EMAIL_CONFIG['username']))
+        msg['To'] = to_email
+        msg['Message-ID'] = f"<{email_id}@{EMAIL_CONFIG['username'].split('@')[1]}>"
+        msg.attach(MIMEText(html_content, 'html'))
+        message_text = msg.as_string()
     
     try:
         # 确保SMTP连接可用
-        if not init_smtp_connection():
+        with timing.phase('smtp_connect_check'):
+            smtp_ready = init_smtp_connection()
+        if not smtp_ready:
             logger.error("无法建立SMTP连接，邮件发送失败")
+            EMAILS_FAILED.inc()
             return False
         
-        # 使用已建立的连接发送邮件
+        # 使用已建立的连接发送邮件（只统计SMTP交互耗时，不含等待连接锁的时间）
         with connection_lock:
-            smtp_connection.sendmail(EMAIL_CONFIG['username'], to_email, msg.as_string())
+            with timing.phase('smtp_data'), SMTP_SEND_SECONDS.time():
+                smtp_connection.sendmail(EMAIL_CONFIG['username'], to_email, message_text)
         
-        logger.info(f"邮件已成功发送至 {to_email}，邮件ID: {email_id}")
+        EMAILS_SENT.inc()
+        logger.info(f"邮件已成功发送至 {to_email}，邮件ID: {email_id}", extra=PER_MAIL)
+        get_address_index().add_sent(to_email)
         
         # 将邮件信息保存到跟踪服务
         try:
-            response = requests.post(
-                f"{EMAIL_CONFIG['tracker_url']}/track/register",
-                json={
-                    'email_id': email_id,
-                    'recipient': to_email,
-                    'name': name,
-                    'sent_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
-            )
+            with timing.phase('tracker_register'), TRACKER_REGISTER_SECONDS.time():
+                response = requests.post(
+                    f"{EMAIL_CONFIG['tracker_url']}/track/register",
+                    json={
+                        'email_id': email_id,
+                        'recipient': to_email,
+                        'name': name,
+                        'sent_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    }
+                )
             if response.status_code == 200:
-                logger.info(f"邮件 {email_id} 已在跟踪服务器注册")
+                logger.info(f"邮件 {email_id} 已在跟踪服务器注册", extra=PER_MAIL)
             else:
                 logger.warning(f"邮件 {email_id} 在跟踪服务器注册失败: {response.text}")
         except Exception as e:
@@ -349,12 +429,8 @@ def send_email(recipient):
         
         # 更新email_tracking表
         try:
-            connection = mysql.connector.connect(
-                host=DB_CONFIG['host'],
-                user=DB_CONFIG['user'],
-                password=DB_CONFIG['password'],
-                database=DB_CONFIG['database']
-            )
+            with timing.phase('db_connect'):
+                connection = connect_db(DB_CONFIG)
             
             if connection.is_connected():
                 cursor = connection.cursor()
@@ -366,13 +442,18 @@ def send_email(recipient):
                 VALUES (%s, %s, %s, %s, %s, %s, %s)
                 """
                 
-                cursor.execute(
-                    insert_query, 
-                    (company_name, name, to_email, False, False, sent_time, email_id)
-                )
-                connection.commit()
+                with timing.phase('db_insert'), DB_WRITE_SECONDS.labels(operation='tracking_insert').time():
+                    cursor.execute(
+                        insert_query, 
+                        (company_name, name, to_email, False, False, sent_time, id_bytes(email_id))
+                    )
+                    connection.commit()
+                
+                logger.info(f"已将邮件信息保存到email_tracking表，邮件ID: {email_id}", extra=PER_MAIL)
                 
-                logger.info(f"已将邮件信息保存到email_tracking表，邮件ID: {email_id}")
+                # 同步更新回复匹配索引
+                if sent_message_index is not None:
+                    sent_message_index.add(email_id)
                 
             # 更新联系人的邮件发送状态
             if recipient_id:
@@ -385,10 +466,11 @@ def send_email(recipient):
                 WHERE id = %s
                 """
                 
-                cursor.execute(update_query, (recipient_id,))
-                connection.commit()
+                with timing.phase('companies_update'), DB_WRITE_SECONDS.labels(operation='contact_update').time():
+                    cursor.execute(update_query, (recipient_id,))
+                    connection.commit()
                 
-                logger.info(f"已更新ID为 {recipient_id} 的联系人邮件发送状态")
+                logger.info(f"已更新ID为 {recipient_id} 的联系人邮件发送状态", extra=PER_MAIL)
                 
             cursor.close()
             connection.close()
@@ -397,8 +479,11 @@ def send_email(recipient):
         
         return True
     except Exception as e:
+        EMAILS_FAILED.inc()
         logger.error(f"发送邮件到 {to_email} 失败: {e}")
-        # 连接可能已断开，下次将重新连接
+        if smtp_connection_usable(e):
+            return False
+        # 连接可能已断开，下次将重新连接（恢复TLS会话）
         with connection_lock:
             try:
                 smtp_connection.quit()
@@ -428,12 +513,165 @@ def send_batch():
     except Exception as e:
         logger.error(f"更新跟踪服务器统计信息失败: {e}")
 
+# 读取IMAP增量同步状态（UIDVALIDITY和已处理的最大UID）
+def load_imap_sync_state():
+    if os.path.exists(IMAP_SYNC_STATE_FILE):
+        try:
+            with open(IMAP_SYNC_STATE_FILE, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            return {
+                'uidvalidity': state.get('uidvalidity'),
+                'last_uid': int(state.get('last_uid', 0))
+            }
+        except Exception as e:
+            logger.error(f"读取IMAP同步状态失败，将执行全量同步: {e}")
+    return {'uidvalidity': None, 'last_uid': 0}
+
+# 保存IMAP增量同步状态
+def save_imap_sync_state(state):
+    tmp_path = IMAP_SYNC_STATE_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, IMAP_SYNC_STATE_FILE)
+
+# 获取当前所选邮箱的UIDVALIDITY
+def get_uidvalidity():
+    _, data = imap_connection.response('UIDVALIDITY')
+    if not data or data[0] is None:
+        status, data = imap_connection.status('INBOX', '(UIDVALIDITY)')
+        if status != 'OK':
+            return None
+        # 响应格式: b'INBOX (UIDVALIDITY 1234)'
+        return data[0].decode().rstrip(')').split()[-1]
+    value = data[0]
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+# 连接、进程池和内存索引的状态指标
+REGISTRY.gauge('mailbox_smtp_connected', 'SMTP长连接是否可用').set_function(
+    lambda: smtp_connection is not None)
+REGISTRY.gauge('mailbox_parse_pool_workers', '邮件解析进程池的进程数').set_function(
+    lambda: parse_pool.max_workers if parse_pool is not None else 0)
+REGISTRY.gauge('mailbox_reply_listener_alive', 'IMAP IDLE回复监听线程是否在运行').set_function(
+    lambda: reply_listener is not None and reply_listener.is_alive())
+REGISTRY.gauge('mailbox_sent_message_index_size', '回复匹配索引中的邮件ID数').set_function(
+    lambda: len(sent_message_index) if sent_message_index is not None else 0)
+_address_index_size = REGISTRY.gauge('mailbox_address_index_size', '地址索引中的地址数', ['kind'])
+_address_index_size.labels(kind='sent').set_function(
+    lambda: len(address_index.sent) if address_index is not None else 0)
+_address_index_size.labels(kind='suppressed').set_function(
+    lambda: len(address_index.suppressed) if address_index is not None else 0)
+
+# 获取邮件解析进程池
+def get_parse_pool():
+    global parse_pool
+    
+    if parse_pool is None:
+        parse_pool = ParsePool()
+    return parse_pool
+
+# 匹配一批已解析的邮件，回复加入matches，退信加入bounces，然后推进已处理的最大UID
+def match_parsed_batch(batch_uids, future, index, sync_state, matches, bounces):
+    for result in future.result():
+        if 'error' in result:
+            logger.error(f"解析邮件 UID {result['uid']} 失败，已跳过: {result['error']}")
+            continue
+        
+        if result['bounces']:
+            for bounce in result['bounces']:
+                logger.info(f"收到退信: {bounce['recipient']}, 状态码: {bounce['status']}, "
+                            f"{'硬退信' if bounce['hard'] else '软退信'}")
+            bounces.extend(result['bounces'])
+            continue
+        
+        reply_to_id = index.resolve(result['in_reply_to'], result['references'])
+        if reply_to_id:
+            logger.info(f"收到邮件回复，回复ID: {reply_to_id}, 来自: {result['from']}")
+            matches.append({
+                'email_id': reply_to_id,
+                'from': result['from'],
+                'subject': result['subject'],
+                'content': result['snippet']
+            })
+    
+    sync_state['last_uid'] = max(sync_state['last_uid'], batch_uids[-1])
+
+# 将退信写入屏蔽表，硬退信地址同时加入内存地址索引，返回是否成功
+def handle_bounces(bounces):
+    recorded = record_bounces(bounces, DB_CONFIG)
+    if recorded is None:
+        return False
+    if recorded:
+        index = get_address_index()
+        for bounce in bounces:
+            if bounce['hard']:
+                index.add_suppressed(bounce['recipient'])
+    return True
+
+# 向跟踪服务器批量报告回复，返回是否成功
+def report_replies(replies):
+    if not replies:
+        return True
+    
+    try:
+        response = requests.post(
+            f"{EMAIL_CONFIG['tracker_url']}/reply/bulk",
+            json={'replies': replies}
+        )
+        if response.status_code == 200:
+            logger.info(f"已向跟踪服务器批量报告 {len(replies)} 条回复")
+            return True
+        if response.status_code != 404:
+            logger.error(f"向跟踪服务器批量报告回复失败: {response.text}")
+            return False
+    except Exception as e:
+        logger.error(f"向跟踪服务器批量报告回复失败: {e}")
+        return False
+    
+    # 跟踪服务器不支持批量接口时逐条报告
+    for reply in replies:
+        try:
+            response = requests.post(f"{EMAIL_CONFIG['tracker_url']}/reply", json=reply)
+        except Exception as e:
+            logger.error(f"向跟踪服务器报告回复失败: {e}")
+            return False
+        if response.status_code != 200:
+            logger.error(f"向跟踪服务器报告回复失败: {response.status_code} {response.text}")
+            return False
+    return True
+
+# 获取已发送邮件ID索引（首次使用时从数据库加载）
+def get_sent_message_index():
+    global sent_message_index
+    from reply_index import SentMessageIndex
+    
+    if sent_message_index is None:
+        sent_message_index = SentMessageIndex(DB_CONFIG)
+    return sent_message_index
+
 # 检查邮件回复
 def check_replies():
+    """
+    基于UID增量同步检查回复：只获取上次处理的最大UID之后的新邮件，
+    UIDVALIDITY变化时才从头全量同步。不依赖也不修改邮件的已读标记。
+    """
+    with reply_check_lock:
+        _check_replies()
+
+def _check_replies():
     global imap_connection
     
     logger.info("开始检查邮件回复...")
     
+    sync_state = load_imap_sync_state()
+    
+    # 增量加载新发送的邮件ID，非本系统邮件的回复将直接丢弃
+    index = get_sent_message_index()
+    index.refresh()
+    
+    matches = []
+    bounces = []
+    start_uid = None
+    
     try:
         # 确保IMAP连接可用
         if not init_imap_connection():
@@ -444,88 +682,64 @@ def check_replies():
             # 刷新收件箱状态
             imap_connection.select('INBOX')
             
-            # 搜索所有未读邮件
-            status, data = imap_connection.search(None, 'UNSEEN')
+            uidvalidity = get_uidvalidity()
+            if uidvalidity != sync_state['uidvalidity']:
+                logger.warning(f"UIDVALIDITY已变化({sync_state['uidvalidity']} -> {uidvalidity})，执行全量同步")
+                sync_state = {'uidvalidity': uidvalidity, 'last_uid': 0}
+            
+            # 只搜索上次处理之后的新邮件
+            status, data = imap_connection.uid('SEARCH', None, f"UID {sync_state['last_uid'] + 1}:*")
             
             if status != 'OK':
                 logger.error("无法搜索邮件")
                 return
             
-            message_nums = data[0].split()
+            # "n:*"至少会返回最大UID的邮件，需过滤掉已处理过的
+            uids = sorted(int(uid) for uid in data[0].split() if int(uid) > sync_state['last_uid'])
+        
+        logger.info(f"发现 {len(uids)} 封新邮件(UID > {sync_state['last_uid']})")
         
-        # 逐个处理邮件，避免长时间占用锁
-        for num in message_nums:
+        # 流水线处理：当前线程按批抓取原始邮件，解析交给进程池并行执行，
+        # 已完成的批次按UID顺序匹配，抓取下一批时不等待解析；
+        # 本轮匹配到的回复最后一次性批量上报
+        pool = get_parse_pool()
+        pending = deque()
+        start_uid = sync_state['last_uid']
+        for i in range(0, len(uids), FETCH_BATCH_SIZE):
+            batch_uids = uids[i:i + FETCH_BATCH_SIZE]
             with connection_lock:
-                status, data = imap_connection.fetch(num, '(RFC822)')
-                
-                if status != 'OK':
-                    logger.error(f"无法获取邮件 {num}")
-                    continue
-                
-                raw_email = data[0][1]
-            
-            # 在锁外处理邮件内容
-            email_message = email.message_from_bytes(raw_email)
-            
-            # 获取主题和发件人
-            subject = decode_header(email_message["Subject"])[0][0]
-            if isinstance(subject, bytes):
-                subject = subject.decode()
-            
-            from_email = email.utils.parseaddr(email_message["From"])[1]
-            
-            # 获取邮件内容
-            body = ""
-            if email_message.is_multipart():
-                for part in email_message.walk():
-                    content_type = part.get_content_type()
-                    if content_type == "text/plain" or content_type == "text/html":
-                        try:
-                            body = part.get_payload(decode=True).decode()
-                            break
-                        except:
-                            pass
-            else:
-                body = email_message.get_payload(decode=True).decode()
-            
-            # 检查是否为回复，查找In-Reply-To或References字段
-            in_reply_to = email_message.get("In-Reply-To", "")
-            references = email_message.get("References", "")
-            
-            # 从In-Reply-To或References中提取邮件ID
-            reply_to_id = None
-            
-            if in_reply_to:
-                # 格式通常是 <id@domain>
-                reply_to_id = in_reply_to.strip("<>").split("@")[0]
-            elif references:
-                # 可能包含多个引用，通常最早的ID是最后一个
-                ids = references.split()
-                if ids:
-                    reply_to_id = ids[-1].strip("<>").split("@")[0]
+                # 使用BODY.PEEK避免修改邮件的已读状态
+                status, data = imap_connection.uid(
+                    'FETCH', ','.join(str(uid) for uid in batch_uids), '(UID BODY.PEEK[])'
+                )
             
-            if reply_to_id:
-                logger.info(f"收到邮件回复，回复ID: {reply_to_id}, 来自: {from_email}")
-                
-                # 向跟踪服务器报告回复
-                try:
-                    requests.post(
-                        f"{EMAIL_CONFIG['tracker_url']}/reply",
-                        json={
-                            'email_id': reply_to_id,
-                            'from': from_email,
-                            'content': body[:200]  # 只保存前200个字符的内容
-                        }
-                    )
-                except Exception as e:
-                    logger.error(f"向跟踪服务器报告回复失败: {e}")
+            if status != 'OK':
+                logger.error(f"无法获取邮件 UID {batch_uids[0]}-{batch_uids[-1]}")
+                break
             
-            # 标记邮件为已读
-            with connection_lock:
-                imap_connection.store(num, '+FLAGS', '\\Seen')
+            pending.append((batch_uids, pool.submit(parse_fetch_response(data))))
+            while pending and pending[0][1].done():
+                match_parsed_batch(*pending.popleft(), index, sync_state, matches, bounces)
+        
+        while pending:
+            match_parsed_batch(*pending.popleft(), index, sync_state, matches, bounces)
+        
+        # 退信写入屏蔽表，回复批量上报
+        bounces_saved = handle_bounces(bounces)
+        bounces = []
+        replies_reported = report_replies(matches)
+        
+        if not (bounces_saved and replies_reported):
+            # 写入或上报失败时不推进进度，下次重新处理这些邮件
+            sync_state['last_uid'] = start_uid
     
     except Exception as e:
         logger.error(f"检查邮件回复时出错: {e}")
+        # 先上报已匹配的回复和退信，失败则下次从头重新处理本轮邮件
+        if start_uid is not None:
+            bounces_saved = handle_bounces(bounces)
+            if not (report_replies(matches) and bounces_saved):
+                sync_state['last_uid'] = start_uid
         # 连接可能已断开，下次将重新连接
         with connection_lock:
             try:
@@ -533,6 +747,34 @@ def check_replies():
             except:
                 pass
             imap_connection = None
+    finally:
+        # 保存进度，下次从已处理的最大UID之后继续
+        try:
+            save_imap_sync_state(sync_state)
+        except Exception as e:
+            logger.error(f"保存IMAP同步状态失败: {e}")
+
+# 启动IMAP IDLE回复监听，新邮件到达时立即检查回复
+def start_reply_listener():
+    global reply_listener
+    from imap_idle import ReplyIdleListener
+    
+    if reply_listener is not None and reply_listener.is_alive():
+        return reply_listener
+    
+    reply_listener = ReplyIdleListener(check_replies, open_imap_connection)
+    reply_listener.start()
+    logger.info("已启动IMAP回复监听线程")
+    return reply_listener
+
+# 停止IMAP IDLE回复监听
+def stop_reply_listener():
+    global reply_listener
+    
+    if reply_listener is not None:
+        reply_listener.stop()
+        reply_listener = None
+        logger.info("已停止IMAP回复监听线程")
 
 # 创建配置目录和示例收件人列表
 def init_config():
@@ -581,21 +823,15 @@ def init_config():
         
         logger.info("已创建示例邮件模板")
 
-# 定时任务函数
-def schedule_jobs():
-    global SEND_INTERVAL
-    
-    # 配置定时发送邮件和检查回复
-    schedule.every(SEND_INTERVAL).hours.do(send_batch)
-    schedule.every(1).hours.do(check_replies)
+# 定时任务函数：在传入的调度器上添加发送和连接维护任务，返回该调度器
+def schedule_jobs(scheduler):
+    # 配置定时发送邮件，回复由IMAP IDLE监听线程实时检查
+    scheduler.add_job('send_batch', every(SEND_INTERVAL * 3600), send_batch)
     # 每30分钟检查一次连接状态
-    schedule.every(30).minutes.do(maintain_connections)
-    
-    logger.info(f"已设置定时任务：每{SEND_INTERVAL}小时发送一次邮件，每1小时检查回复，每30分钟检查连接状态")
+    scheduler.add_job('maintain_connections', every(30 * 60), maintain_connections)
     
-    while True:
-        schedule.run_pending()
-        time.sleep(60)
+    logger.info(f"已设置定时任务：每{SEND_INTERVAL}小时发送一次邮件，每30分钟检查连接状态")
+    return scheduler
 
 # 打印当前统计信息
 def print_stats():
@@ -670,6 +906,8 @@ def view_email_status():
         print(f"查看邮件状态时出错: {e}")
 
 if __name__ == "__main__":
+    setup_logging('email_sender', 'logs/sender.log')
+
     # 初始化配置和示例文件
     init_config()
     
@@ -684,10 +922,11 @@ if __name__ == "__main__":
     else:
         logger.warning("邮件服务器连接初始化失败，将在发送邮件时重试")
     
-    # 启动定时任务线程
-    scheduler_thread = threading.Thread(target=schedule_jobs)
-    scheduler_thread.daemon = True
-    scheduler_thread.start()
+    # 启动调度器线程并设置定时任务
+    scheduler = schedule_jobs(EventScheduler().start_in_thread())
+    
+    # 启动回复监听线程
+    start_reply_listener()
     
     logger.info("邮件发送系统已启动")
     
@@ -716,10 +955,8 @@ if __name__ == "__main__":
                 hours = int(input("请输入新的发送间隔（小时）: "))
                 if hours > 0:
                     SEND_INTERVAL = hours
-                    # 重新设置定时任务
-                    schedule.clear()
-                    schedule.every(SEND_INTERVAL).hours.do(send_batch)
-                    schedule.every(1).hours.do(check_replies)
+                    # 重新计算发送任务的执行时间
+                    scheduler.reschedule('send_batch', every(SEND_INTERVAL * 3600))
                     print(f"发送间隔已更新为 {SEND_INTERVAL} 小时")
                 else:
                     print("间隔必须大于0")
@@ -727,6 +964,7 @@ if __name__ == "__main__":
                 print("请输入有效的数字")
         elif choice == '6':
             print("正在退出...")
+            stop_reply_listener()
             break
         else:
             print("无效的选择，请重试")
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+实时事件总线：发送结果、邮件打开和回复事件在进程内发布一次，分发给所有订阅者（如SSE连接）。
+每个订阅者有独立的有界队列，客户端读取过慢时丢弃其最旧的事件，发布者永远不会被阻塞。
+"""
+
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from lazy_import import lazy_module
+
+# 只有EventBus的订阅者（API服务器的SSE连接）使用，追踪服务器只用EventForwarder，不加载asyncio
+asyncio = lazy_module('asyncio')
+
+logger = logging.getLogger('email_tracker')
+
+# 每个订阅者最多缓存的事件数量
+SUBSCRIBER_QUEUE_SIZE = 1000
+# 保留最近的事件，用于客户端断线重连时按Last-Event-ID补发
+REPLAY_BUFFER_SIZE = 256
+
+
+class Subscription:
+    def __init__(self, loop, maxsize, types=None):
+        self.loop = loop
+        self.maxsize = maxsize
+        self.types = set(types) if types else None
+        self.queue = deque()
+        self.dropped = 0
+        self._ready = asyncio.Event()
+        self._notify_pending = False
+
+    # 由发布者在总线锁内调用，不做任何阻塞操作
+    def _offer(self, event):
+        if self.types and event['type'] not in self.types:
+            return
+        if len(self.queue) >= self.maxsize:
+            self.queue.popleft()
+            self.dropped += 1
+        self.queue.append(event)
+        if not self._notify_pending:
+            self._notify_pending = True
+            try:
+                self.loop.call_soon_threadsafe(self._wake)
+            except RuntimeError:
+                # 订阅者的事件循环已关闭
+                pass
+
+    def _wake(self):
+        self._notify_pending = False
+        self._ready.set()
+
+
+class EventBus:
+    def __init__(self, queue_size=SUBSCRIBER_QUEUE_SIZE, replay_size=REPLAY_BUFFER_SIZE):
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.recent = deque(maxlen=replay_size)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def publish(self, event_type, data):
+        """发布事件，可在任意线程中调用"""
+        with self._lock:
+            event = {
+                'id': next(self._ids),
+                'type': event_type,
+                'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'data': data
+            }
+            self.recent.append(event)
+            for subscription in self.subscribers:
+                subscription._offer(event)
+        return event
+
+    def subscribe(self, types=None, last_event_id=None):
+        """在事件循环中调用，返回订阅对象；提供last_event_id时先补发之后的事件"""
+        subscription = Subscription(asyncio.get_running_loop(), self.queue_size, types)
+        with self._lock:
+            if last_event_id is not None:
+                for event in self.recent:
+                    if event['id'] > last_event_id:
+                        subscription._offer(event)
+            self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self.subscribers.discard(subscription)
+
+    async def next_batch(self, subscription, timeout):
+        """等待并取出订阅者队列中的全部事件，超时返回空列表。发生过丢弃时插入一条dropped事件"""
+        subscription._ready.clear()
+        if not subscription.queue:
+            try:
+                await asyncio.wait_for(subscription._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        with self._lock:
+            events = list(subscription.queue)
+            subscription.queue.clear()
+            dropped, subscription.dropped = subscription.dropped, 0
+        if dropped:
+            events.insert(0, {'id': None, 'type': 'dropped', 'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                              'data': {'count': dropped}})
+        return events
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self.subscribers),
+                'queued': sum(len(subscription.queue) for subscription in self.subscribers),
+                'last_event_id': self.recent[-1]['id'] if self.recent else 0
+            }
+
+
+# 将事件编码为SSE格式
+def format_sse(event):
+    lines = []
+    if event['id'] is not None:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {json.dumps(event, ensure_ascii=False)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class EventForwarder:
+    """
+    在其他进程（跟踪/反馈服务器）中使用：把事件放入有界队列，由后台线程转发到API服务器的事件总线。
+    队列满或API服务器不可用时直接丢弃，不影响请求处理。
+    """
+
+    def __init__(self, url=None, maxsize=10000, timeout=2):
+        self.url = url or os.getenv('API_EVENTS_URL', 'http://localhost:8000/events/publish')
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def publish(self, event_type, data):
+        self._ensure_thread()
+        try:
+            self.queue.put_nowait({'type': event_type, 'data': data})
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='event-forwarder', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        # 转发线程启动时才导入，没有事件要转发的进程不加载requests
+        import requests
+
+        session = requests.Session()
+        while True:
+            events = [self.queue.get()]
+            # 一次转发队列中已积压的所有事件
+            while len(events) < 500:
+                try:
+                    events.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                session.post(self.url, json={'events': events}, timeout=self.timeout)
+            except Exception as e:
+                self.dropped += len(events)
+                logger.debug(f"转发事件到API服务器失败: {e}")
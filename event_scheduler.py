@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+事件驱动的定时调度器：根据任务配置计算下一次触发时间并精确休眠到该时间，
+没有到期任务时不会唤醒，取代每秒轮询的schedule.run_pending()
+"""
+
+import datetime
+import logging
+import threading
+
+from lazy_import import lazy_module
+
+# 调度器启动时才导入，只计算下次运行时间的调用方（如api_server的状态接口、email_sender）不加载
+asyncio = lazy_module('asyncio')
+
+logger = logging.getLogger('email_tracker')
+
+# 单次休眠的最长时间（秒）。长时间休眠使用单调时钟，到点后按墙上时间重新校准，
+# 以免系统时间调整导致任务提前或推迟
+MAX_SLEEP_SECONDS = 3600
+
+
+# 计算每日定时任务的下一次执行时间
+def next_daily_run(send_time, workdays, now=None):
+    """
+    send_time: "HH:MM"格式的发送时间
+    workdays: 允许执行的星期列表，0-6分别代表周一到周日
+    返回下一次执行的datetime，没有可用工作日时返回None
+    """
+    now = now or datetime.datetime.now()
+    hour, minute = (int(part) for part in send_time.split(':')[:2])
+    for days_ahead in range(8):
+        day = now.date() + datetime.timedelta(days=days_ahead)
+        if day.weekday() not in workdays:
+            continue
+        run_at = datetime.datetime.combine(day, datetime.time(hour=hour, minute=minute))
+        if run_at > now:
+            return run_at
+    return None
+
+
+# 生成按每日时间表计算下次执行时间的函数
+def daily_at(send_time, workdays):
+    return lambda now: next_daily_run(send_time, workdays, now)
+
+
+# 生成按固定间隔计算下次执行时间的函数
+def every(seconds):
+    return lambda now: now + datetime.timedelta(seconds=seconds)
+
+
+class ScheduledJob:
+    def __init__(self, name, next_run_func, callback):
+        self.name = name
+        self.next_run_func = next_run_func
+        self.callback = callback
+        self.next_run = None
+        self.last_run = None
+        self.running = False
+        self.handle = None
+
+
+class EventScheduler:
+    """
+    基于asyncio的调度器。每个任务只持有一个TimerHandle，到期时才被唤醒；
+    任务回调在线程池中执行，不阻塞事件循环。协程函数在独立的事件循环中运行。
+    所有公开方法都可以从其他线程安全调用。
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.jobs = {}
+        self._thread = None
+
+    # 绑定到一个正在运行的事件循环（例如FastAPI/uvicorn的事件循环）
+    def attach(self, loop):
+        self.loop = loop
+
+    # 在后台线程中创建并运行独立的事件循环（用于命令行程序）
+    def start_in_thread(self):
+        ready = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            ready.set()
+            self.loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='event-scheduler', daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def _call(self, func, *args):
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self.loop:
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(func, *args)
+
+    def add_job(self, name, next_run_func, callback):
+        """添加（或替换）任务，next_run_func(now)返回下一次执行的datetime"""
+        self._call(self._add_job, name, next_run_func, callback)
+
+    def cancel(self, name):
+        """取消任务"""
+        self._call(self._cancel, name)
+
+    def cancel_all(self):
+        for name in list(self.jobs):
+            self.cancel(name)
+
+    def reschedule(self, name, next_run_func=None):
+        """修改任务的时间表并重新计算下一次执行时间"""
+        self._call(self._reschedule, name, next_run_func)
+
+    def upcoming(self):
+        """返回按时间排序的待执行任务列表"""
+        jobs = sorted(
+            (job for job in list(self.jobs.values()) if job.next_run),
+            key=lambda job: job.next_run
+        )
+        return [{
+            'name': job.name,
+            'next_run': job.next_run.strftime('%Y-%m-%d %H:%M:%S'),
+            'last_run': job.last_run.strftime('%Y-%m-%d %H:%M:%S') if job.last_run else None,
+            'running': job.running
+        } for job in jobs]
+
+    def next_run_time(self, name):
+        job = self.jobs.get(name)
+        return job.next_run if job else None
+
+    def _add_job(self, name, next_run_func, callback):
+        self._cancel(name)
+        job = ScheduledJob(name, next_run_func, callback)
+        self.jobs[name] = job
+        self._arm(job)
+
+    def _cancel(self, name):
+        job = self.jobs.pop(name, None)
+        if job and job.handle:
+            job.handle.cancel()
+
+    def _reschedule(self, name, next_run_func):
+        job = self.jobs.get(name)
+        if job is None:
+            return
+        if next_run_func is not None:
+            job.next_run_func = next_run_func
+        if job.handle:
+            job.handle.cancel()
+        self._arm(job)
+
+    def _arm(self, job, now=None):
+        now = now or datetime.datetime.now()
+        job.next_run = job.next_run_func(now)
+        if job.next_run is None:
+            job.handle = None
+            logger.warning(f"任务 {job.name} 没有下一次执行时间")
+            return
+        self._sleep_until(job)
+
+    def _sleep_until(self, job):
+        delay = (job.next_run - datetime.datetime.now()).total_seconds()
+        delay = max(0.0, min(delay, MAX_SLEEP_SECONDS))
+        job.handle = self.loop.call_later(delay, self._wake, job)
+
+    def _wake(self, job):
+        if self.jobs.get(job.name) is not job:
+            return
+        now = datetime.datetime.now()
+        if now < job.next_run:
+            # 长时间休眠被截断，继续休眠到真正的执行时间
+            self._sleep_until(job)
+            return
+
+        if job.running:
+            logger.warning(f"任务 {job.name} 上一次执行尚未结束，本次跳过")
+        else:
+            job.running = True
+            job.last_run = now
+            future = self.loop.run_in_executor(None, self._run_callback, job)
+            future.add_done_callback(lambda _: setattr(job, 'running', False))
+        self._arm(job, now)
+
+    @staticmethod
+    def _run_callback(job):
+        try:
+            if asyncio.iscoroutinefunction(job.callback):
+                asyncio.run(job.callback())
+            else:
+                job.callback()
+        except Exception as e:
+            logger.error(f"执行定时任务 {job.name} 失败: {e}")
@@ -5,28 +5,26 @@
 客户端反馈接收服务：用于接收邮件打开和回复的反馈
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 import os
-import logging
 import json
+import time
 from datetime import datetime
 
 # 导入配置加载器
 from config_loader import get_db_config
+from email_ids import id_bytes
+from event_bus import EventForwarder
+from log_setup import PER_MAIL, setup_logging
+from metrics import (CONTENT_TYPE, DB_WRITE_SECONDS, EMAILS_OPENED, EMAILS_REPLIED,
+                     PIXEL_REQUEST_SECONDS, REGISTRY)
+from sql_tools.storage import Error, connect_db
 
 # 获取数据库配置
 DB_CONFIG = get_db_config()
 
 # 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/feedback.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger('feedback_server')
+logger = setup_logging('feedback_server', 'logs/feedback.log')
 
 # 创建Flask应用
 app = Flask(__name__)
@@ -38,6 +36,14 @@ os.makedirs('logs', exist_ok=True)
 email_database = {}
 email_stats = {'sent': 0, 'opened': 0, 'replied': 0}
 
+# 将打开和回复事件转发到API服务器的实时事件流，不阻塞请求
+event_forwarder = EventForwarder()
+
+REGISTRY.gauge('mailbox_event_forward_queue_depth', '等待转发到API服务器的事件数').set_function(
+    lambda: event_forwarder.queue.qsize())
+REGISTRY.gauge('mailbox_tracked_emails', '反馈服务器内存中记录的邮件数').set_function(
+    lambda: len(email_database))
+
 @app.route('/track/register', methods=['POST'])
 def register_email():
     """注册新发送的邮件"""
@@ -58,33 +64,32 @@ def register_email():
     email_stats['sent'] += 1
     save_data()
     
-    logger.info(f"注册了新邮件: {email_id}, 发送给: {data.get('recipient')}")
+    logger.info(f"注册了新邮件: {email_id}, 发送给: {data.get('recipient')}", extra=PER_MAIL)
     return jsonify({'status': 'success', 'email_id': email_id})
 
 @app.route('/track/<email_id>')
 def track_open(email_id):
     """记录邮件打开事件"""
+    start = time.perf_counter()
     # 更新本地缓存
     if email_id in email_database and not email_database[email_id]['opened']:
         email_database[email_id]['opened'] = True
         opened_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         email_database[email_id]['opened_time'] = opened_time
         email_stats['opened'] += 1
+        EMAILS_OPENED.inc()
         save_data()
         
-        logger.info(f"邮件 {email_id} 已被打开")
+        logger.info(f"邮件 {email_id} 已被打开", extra=PER_MAIL)
+        event_forwarder.publish('open', {
+            'email_id': email_id,
+            'email': email_database[email_id].get('recipient'),
+            'open_time': opened_time
+        })
         
         # 更新数据库中的邮件打开状态
         try:
-            import mysql.connector
-            from mysql.connector import Error
-            
-            connection = mysql.connector.connect(
-                host=DB_CONFIG['host'],
-                user=DB_CONFIG['user'],
-                password=DB_CONFIG['password'],
-                database=DB_CONFIG['database']
-            )
+            connection = connect_db(DB_CONFIG)
             
             if connection.is_connected():
                 cursor = connection.cursor()
@@ -96,12 +101,13 @@ def track_open(email_id):
                 WHERE email_id = %s
                 """
                 
-                cursor.execute(update_query, (opened_time, email_id))
-                connection.commit()
+                with DB_WRITE_SECONDS.labels(operation='open_update').time():
+                    cursor.execute(update_query, (opened_time, id_bytes(email_id)))
+                    connection.commit()
                 
                 rows_affected = cursor.rowcount
                 if rows_affected > 0:
-                    logger.info(f"已更新数据库中邮件 {email_id} 的打开状态")
+                    logger.info(f"已更新数据库中邮件 {email_id} 的打开状态", extra=PER_MAIL)
                 else:
                     logger.warning(f"未找到数据库中邮件 {email_id} 的记录")
                 
@@ -117,6 +123,7 @@ def track_open(email_id):
     response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
+    PIXEL_REQUEST_SECONDS.observe(time.perf_counter() - start)
     return response
 
 @app.route('/reply', methods=['POST'])
@@ -128,57 +135,92 @@ def track_reply():
     if not email_id:
         return jsonify({'error': 'Missing email_id'}), 400
     
+    record_replies([data])
+    
+    return jsonify({'status': 'success'})
+
+@app.route('/reply/bulk', methods=['POST'])
+def track_replies_bulk():
+    """批量记录邮件回复事件，一次事务更新数据库，一次写入文件"""
+    data = request.json
+    replies = data.get('replies') if isinstance(data, dict) else data
+    
+    if not isinstance(replies, list):
+        return jsonify({'error': 'Expected a list of replies'}), 400
+    
+    updated = record_replies([reply for reply in replies if isinstance(reply, dict) and reply.get('email_id')])
+    
+    return jsonify({'status': 'success', 'received': len(replies), 'updated': updated})
+
+def record_replies(replies):
+    """更新本地缓存和数据库中的回复状态，返回新记录的回复数量"""
+    reply_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    updates = []
+    
     # 更新本地缓存
-    if email_id in email_database and not email_database[email_id]['replied']:
-        email_database[email_id]['replied'] = True
-        reply_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        email_database[email_id]['reply_time'] = reply_time
-        email_database[email_id]['reply_from'] = data.get('from')
-        email_database[email_id]['reply_content'] = data.get('content', '')
-        email_stats['replied'] += 1
-        save_data()
-        
-        logger.info(f"邮件 {email_id} 已收到回复")
+    for reply in replies:
+        email_id = reply['email_id']
+        if email_id in email_database and not email_database[email_id]['replied']:
+            email_database[email_id]['replied'] = True
+            email_database[email_id]['reply_time'] = reply_time
+            email_database[email_id]['reply_from'] = reply.get('from')
+            email_database[email_id]['reply_content'] = reply.get('content', '')
+            email_stats['replied'] += 1
+            updates.append((reply_time, email_id))
+            
+            logger.info(f"邮件 {email_id} 已收到回复", extra=PER_MAIL)
+            event_forwarder.publish('reply', {
+                'email_id': email_id,
+                'email': email_database[email_id].get('recipient'),
+                'from': reply.get('from'),
+                'subject': reply.get('subject'),
+                'reply_time': reply_time
+            })
+    
+    if not updates:
+        return 0
+    
+    EMAILS_REPLIED.inc(len(updates))
+    save_data()
+    
+    # 在同一个事务中更新数据库中的邮件回复状态
+    try:
+        connection = connect_db(DB_CONFIG)
         
-        # 更新数据库中的邮件回复状态
-        try:
-            import mysql.connector
-            from mysql.connector import Error
+        if connection.is_connected():
+            cursor = connection.cursor()
             
-            connection = mysql.connector.connect(
-                host=DB_CONFIG['host'],
-                user=DB_CONFIG['user'],
-                password=DB_CONFIG['password'],
-                database=DB_CONFIG['database']
-            )
+            # 更新email_tracking表中对应邮件的回复状态
+            update_query = """
+            UPDATE email_tracking 
+            SET is_replied = TRUE, reply_time = %s
+            WHERE email_id = %s
+            """
             
-            if connection.is_connected():
-                cursor = connection.cursor()
-                
-                # 更新email_tracking表中对应邮件的回复状态
-                update_query = """
-                UPDATE email_tracking 
-                SET is_replied = TRUE, reply_time = %s
-                WHERE email_id = %s
-                """
-                
-                cursor.execute(update_query, (reply_time, email_id))
+            with DB_WRITE_SECONDS.labels(operation='reply_update').time():
+                cursor.executemany(update_query,
+                                   [(reply_time, id_bytes(email_id)) for reply_time, email_id in updates])
                 connection.commit()
-                
-                rows_affected = cursor.rowcount
-                if rows_affected > 0:
-                    logger.info(f"已更新数据库中邮件 {email_id} 的回复状态")
-                else:
-                    logger.warning(f"未找到数据库中邮件 {email_id} 的记录")
-                
-                cursor.close()
-                connection.close()
-        except Error as e:
-            logger.error(f"更新数据库中邮件回复状态时出错: {e}")
-        except Exception as e:
-            logger.error(f"处理邮件回复事件时出错: {e}")
+            
+            rows_affected = cursor.rowcount
+            if rows_affected > 0:
+                logger.info(f"已更新数据库中 {rows_affected} 封邮件的回复状态")
+            else:
+                logger.warning(f"未找到数据库中邮件 {', '.join(email_id for _, email_id in updates)} 的记录")
+            
+            cursor.close()
+            connection.close()
+    except Error as e:
+        logger.error(f"更新数据库中邮件回复状态时出错: {e}")
+    except Exception as e:
+        logger.error(f"处理邮件回复事件时出错: {e}")
     
-    return jsonify({'status': 'success'})
+    return len(updates)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus格式的指标"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 @app.route('/stats', methods=['GET'])
 def get_stats():
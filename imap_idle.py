@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+IMAP IDLE监听器：在独立线程中保持长连接，收到新邮件时立即触发回复检查
+"""
+
+import imaplib
+import logging
+import socket
+import threading
+
+logger = logging.getLogger('email_sender')
+
+# RFC 2177建议客户端至少每29分钟重新发出一次IDLE
+IDLE_TIMEOUT = 29 * 60
+# 服务器不支持IDLE时的轮询间隔（秒）
+FALLBACK_POLL_INTERVAL = 3600
+# 重连退避时间上限（秒）
+MAX_RECONNECT_DELAY = 300
+
+
+class ReplyIdleListener(threading.Thread):
+    """
+    使用IMAP IDLE监听收件箱，有新邮件到达时调用on_new_mail回调。
+    连接断开时自动重连；服务器不支持IDLE时退回定时轮询。
+
+    connect: 返回已登录的IMAP连接的函数，IDLE使用独立连接，不与共享连接争用锁
+    """
+
+    def __init__(self, on_new_mail, connect, idle_timeout=IDLE_TIMEOUT,
+                 fallback_interval=FALLBACK_POLL_INTERVAL):
+        super().__init__(name='imap-idle-listener', daemon=True)
+        self.on_new_mail = on_new_mail
+        self.connect = connect
+        self.idle_timeout = idle_timeout
+        self.fallback_interval = fallback_interval
+        self.mode = None  # 'idle' 或 'poll'
+        self._stop_event = threading.Event()
+        self._connection = None
+
+    # 停止监听，关闭套接字以打断阻塞中的IDLE
+    def stop(self):
+        self._stop_event.set()
+        connection = self._connection
+        if connection is not None:
+            try:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+            except Exception:
+                pass
+
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    def run(self):
+        delay = 1
+        while not self.stopped():
+            try:
+                self._connection = self.connect()
+                self._connection.select('INBOX', readonly=True)
+                if 'IDLE' not in self._connection.capabilities:
+                    logger.warning("IMAP服务器不支持IDLE，退回定时轮询模式")
+                    self._close()
+                    self._poll_loop()
+                    return
+
+                self.mode = 'idle'
+                delay = 1
+                logger.info("IMAP IDLE监听已启动")
+
+                # 连接（或重连）后先处理期间到达的邮件
+                self._notify()
+
+                while not self.stopped():
+                    if self._idle_once():
+                        self._notify()
+            except Exception as e:
+                if self.stopped():
+                    break
+                logger.error(f"IMAP IDLE监听出错: {e}，{delay}秒后重连")
+                self._close()
+                self._stop_event.wait(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+        self._close()
+        logger.info("IMAP IDLE监听已停止")
+
+    def _close(self):
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            try:
+                connection.logout()
+            except Exception:
+                pass
+
+    def _poll_loop(self):
+        self.mode = 'poll'
+        logger.info(f"IMAP轮询模式已启动，每{self.fallback_interval}秒检查一次回复")
+        self._notify()
+        while not self._stop_event.wait(self.fallback_interval):
+            self._notify()
+
+    def _notify(self):
+        try:
+            self.on_new_mail()
+        except Exception as e:
+            logger.error(f"处理新邮件时出错: {e}")
+
+    # 执行一次IDLE，直到收到EXISTS通知或超时；返回是否有新邮件
+    def _idle_once(self):
+        connection = self._connection
+        tag = connection._new_tag()
+        connection.send(tag + b' IDLE\r\n')
+
+        sock = connection.sock
+        buffer = b''
+        has_new_mail = False
+        continued = False
+        sock.settimeout(self.idle_timeout)
+        try:
+            while not has_new_mail:
+                try:
+                    chunk = sock.recv(4096)
+                except socket.timeout:
+                    break
+                if not chunk:
+                    raise imaplib.IMAP4.abort("IDLE期间连接被服务器关闭")
+                buffer += chunk
+                while b'\r\n' in buffer:
+                    line, buffer = buffer.split(b'\r\n', 1)
+                    if line.startswith(b'+'):
+                        continued = True
+                    elif line.startswith(tag):
+                        raise imaplib.IMAP4.error(f"IDLE被拒绝: {line!r}")
+                    elif line.startswith(b'*') and line.upper().endswith(b'EXISTS'):
+                        has_new_mail = True
+                    elif line.upper().startswith(b'* BYE'):
+                        raise imaplib.IMAP4.abort(f"服务器断开连接: {line!r}")
+            if not continued and not has_new_mail:
+                raise imaplib.IMAP4.abort("服务器未响应IDLE命令")
+
+            # 结束IDLE并读取带标签的完成响应
+            connection.send(b'DONE\r\n')
+            done = False
+            while not done:
+                while b'\r\n' in buffer:
+                    line, buffer = buffer.split(b'\r\n', 1)
+                    if line.startswith(tag):
+                        done = True
+                        break
+                if done:
+                    break
+                chunk = sock.recv(4096)
+                if not chunk:
+                    raise imaplib.IMAP4.abort("结束IDLE时连接被服务器关闭")
+                buffer += chunk
+        finally:
+            sock.settimeout(None)
+
+        return has_new_mail
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+事件接收服务：用一个异步ASGI应用替代tracker_server和feedback_server，接收追踪像素、邮件注册、回复和统计请求，
+路由和返回格式与email_sender使用的接口兼容（/track/register、/track/<email_id>、/reply、/reply/bulk、
+/stats、/stats/update）。状态保存在数据库中，由ingest_store在后台批量写入，可以用多个worker进程运行。
+
+多worker运行时由本文件的启动器先创建共享内存（见shared_state），worker共用其中的计数器和已打开/已回复邮件的
+去重表：重复的打开和回复直接返回，不再进入写入队列，/metrics中的合计计数在所有worker之间一致。
+
+用法: python ingest_server.py
+      环境变量INGEST_HOST（默认0.0.0.0）、INGEST_PORT（默认5000）、INGEST_WORKERS（默认1）
+"""
+
+import os
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.responses import Response
+
+from config_loader import get_db_config
+from email_ids import is_mail_id
+from event_bus import EventForwarder
+from ingest_store import IngestStore, current_time
+from log_setup import serve_log_records, setup_logging
+from metrics import CONTENT_TYPE, EMAILS_OPENED, EMAILS_REPLIED, PIXEL_REQUEST_SECONDS, REGISTRY
+from shared_state import COUNTERS, SHARED_STATE_ENV, SharedState
+from sql_tools.storage import Error, connect_db
+
+# 配置日志
+logger = setup_logging('ingest_server', 'logs/ingest.log')
+
+INGEST_HOST = os.getenv('INGEST_HOST', '0.0.0.0')
+INGEST_PORT = int(os.getenv('INGEST_PORT', '5000'))
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '1'))
+
+# 最小的1x1透明PNG图像
+TRACKING_PIXEL = (b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00'
+                  b'\x1f\x15\xc4\x89\x00\x00\x00\nIDATx\x9cc\x00\x00\x00\x02\x00\x01\x9a\x00\xe3\x99\x00\x00'
+                  b'\x00\x00IEND\xaeB`\x82')
+NO_CACHE_HEADERS = {
+    'Cache-Control': 'no-cache, no-store, must-revalidate',
+    'Pragma': 'no-cache',
+    'Expires': '0'
+}
+
+app = FastAPI(title="邮件事件接收服务", description="接收邮件打开、注册和回复事件")
+
+# 将首次打开和回复转发到API服务器的实时事件流，不阻塞请求
+event_forwarder = EventForwarder()
+
+# 启动器创建的共享状态，直接用uvicorn运行单个进程时为None
+shared = SharedState.from_environ()
+
+
+# 首次打开写入数据库后计数并转发事件
+def on_open(email_id, recipient, open_time):
+    EMAILS_OPENED.inc()
+    if shared:
+        shared.add('open', email_id)
+        shared.inc('opened')
+    event_forwarder.publish('open', {'email_id': email_id, 'email': recipient, 'open_time': open_time})
+
+
+# 首次回复写入数据库后计数并转发事件
+def on_reply(email_id, recipient, reply, reply_time):
+    EMAILS_REPLIED.inc()
+    if shared:
+        shared.add('reply', email_id)
+        shared.inc('replied')
+    event_forwarder.publish('reply', {
+        'email_id': email_id,
+        'email': recipient,
+        'from': reply.get('from'),
+        'subject': reply.get('subject'),
+        'reply_time': reply_time
+    })
+
+
+# 数据库中已经打开/回复过的邮件加入去重表，之后的重复事件不再进入写入队列
+def on_duplicate(kind, email_id):
+    if shared:
+        shared.add(kind, email_id)
+
+
+# 重复的打开/回复（去重表中已存在）直接计数并丢弃，返回是否为重复事件
+def is_duplicate(kind, email_id):
+    if shared and shared.contains(kind, email_id):
+        shared.inc('duplicate_opens' if kind == 'open' else 'duplicate_replies')
+        return True
+    return False
+
+
+# 需要写入的打开/回复：格式不是邮件ID的请求（扫描器等）与tracker_server一样直接忽略，
+# 不进入写入队列反复查询数据库；重复事件也不写入
+def should_record(kind, email_id):
+    return is_mail_id(email_id) and not is_duplicate(kind, email_id)
+
+
+store = IngestStore(get_db_config(), on_open=on_open, on_reply=on_reply, on_duplicate=on_duplicate)
+
+REGISTRY.gauge('mailbox_event_forward_queue_depth', '等待转发到API服务器的事件数').set_function(
+    lambda: event_forwarder.queue.qsize())
+REGISTRY.gauge('mailbox_ingest_queue_depth', '等待写入数据库的事件数').set_function(store.depth)
+if shared:
+    SHARED_EVENTS = REGISTRY.gauge('mailbox_ingest_events_all_workers', '所有worker合计的事件数（启动后）', ['event'])
+    for _counter in COUNTERS:
+        SHARED_EVENTS.labels(event=_counter).set_function(lambda counter=_counter: shared.value(counter))
+    REGISTRY.gauge('mailbox_ingest_dedup_entries', '共享去重表中的邮件事件数').set_function(shared.used)
+
+
+# 读取JSON请求体，格式不正确时返回None
+async def read_json(request: Request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+# 每个worker进程在启动后各自创建写入线程
+@app.on_event("startup")
+async def startup_event():
+    store.start()
+    logger.info(f"事件接收服务已启动，进程 {os.getpid()}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    store.stop()
+
+
+@app.post("/track/register")
+async def register_email(request: Request):
+    """注册新发送的邮件"""
+    data = await read_json(request)
+    email_id = data.get('email_id') if isinstance(data, dict) else None
+    if not email_id:
+        return JSONResponse({'error': 'Missing email_id'}, status_code=400)
+
+    if not store.register(email_id, data.get('recipient'), data.get('name'), data.get('sent_time')):
+        return JSONResponse({'error': 'Ingest queue full'}, status_code=503)
+    if shared:
+        shared.inc('registered')
+    return {'status': 'success', 'email_id': email_id}
+
+
+@app.get("/track/{email_id}")
+async def track_open(email_id: str):
+    """记录邮件打开事件，返回1x1透明像素"""
+    start = time.perf_counter()
+    if should_record('open', email_id):
+        store.record_open(email_id)
+    response = Response(content=TRACKING_PIXEL, media_type='image/png', headers=NO_CACHE_HEADERS)
+    PIXEL_REQUEST_SECONDS.observe(time.perf_counter() - start)
+    return response
+
+
+@app.post("/reply")
+async def track_reply(request: Request):
+    """记录邮件回复事件"""
+    data = await read_json(request)
+    if not isinstance(data, dict) or not data.get('email_id'):
+        return JSONResponse({'error': 'Missing email_id'}, status_code=400)
+
+    if should_record('reply', data['email_id']):
+        store.record_reply(data['email_id'], data)
+    return {'status': 'success'}
+
+
+@app.post("/reply/bulk")
+async def track_replies_bulk(request: Request):
+    """批量记录邮件回复事件。写入是异步的，updated为已接收等待写入的回复数"""
+    data = await read_json(request)
+    replies = data.get('replies') if isinstance(data, dict) else data
+    if not isinstance(replies, list):
+        return JSONResponse({'error': 'Expected a list of replies'}, status_code=400)
+
+    reply_time = current_time()
+    accepted = 0
+    for reply in replies:
+        if isinstance(reply, dict) and reply.get('email_id') and should_record('reply', reply['email_id']):
+            accepted += store.record_reply(reply['email_id'], reply, reply_time)
+    return {'status': 'success', 'received': len(replies), 'updated': accepted}
+
+
+@app.get("/stats")
+def get_stats(details: bool = True):
+    """获取统计信息，数据来自数据库，所有worker返回相同的结果（最多滞后一个写入间隔）"""
+    return store.stats(details=details)
+
+
+@app.post("/stats/update")
+async def update_stats(request: Request):
+    """
+    兼容旧接口。发送数由注册的邮件数得出，不再单独累加，
+    否则会与/track/register重复计数
+    """
+    return {'status': 'success'}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus格式的指标（mailbox_ingest_events_all_workers为所有worker合计，其余为当前worker）"""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+# 启动器：创建共享状态并预加载数据库中已打开/已回复的邮件，然后启动worker，全部退出后删除共享内存
+def main():
+    import uvicorn
+
+    state = SharedState.create()
+    try:
+        connection = connect_db(get_db_config())
+        cursor = connection.cursor()
+        for kind, column in (('open', 'opened_time'), ('reply', 'reply_time')):
+            cursor.execute(f"SELECT email_id FROM tracked_emails WHERE {column} IS NOT NULL")
+            for (email_id,) in cursor.fetchall():
+                state.add(kind, email_id)
+        cursor.close()
+        connection.close()
+        logger.info(f"去重表已预加载 {state.used()} 个已打开/已回复的邮件")
+    except Error as e:
+        logger.warning(f"预加载去重表失败: {e}")
+
+    os.environ[SHARED_STATE_ENV] = state.name
+    if INGEST_WORKERS > 1:
+        # worker的日志由本进程统一写入logs/ingest.log，多个进程不会各自轮转同一个文件
+        serve_log_records()
+    try:
+        uvicorn.run("ingest_server:app", host=INGEST_HOST, port=INGEST_PORT, workers=INGEST_WORKERS)
+    finally:
+        state.unlink()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+事件接收服务的存储层：注册、打开和回复事件先放入内存队列，由后台线程按批写入tracked_emails表，
+首次打开和回复同时更新email_tracking表，请求处理不等待数据库。
+切换前发送的邮件和注册失败的邮件不在tracked_emails中，打开或回复时从email_tracking补入（含已有的打开/回复时间），
+与feedback_server按email_id直接更新email_tracking的行为一致。
+
+多个worker进程共用同一个数据库。打开和回复用带条件的UPDATE（opened_time/reply_time IS NULL）去重，
+只有真正写入的那个worker计数和转发事件；共享内存中的去重表（shared_state）只用来提前过滤重复事件，
+计数的准确性不依赖它。
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from email_ids import id_bytes
+from log_setup import PER_MAIL
+from metrics import DB_WRITE_SECONDS
+from sql_tools.storage import Error, backend, connect_db
+
+logger = logging.getLogger('ingest_server')
+
+# 后台写入的间隔（秒）和每批最多写入的事件数
+FLUSH_INTERVAL = float(os.getenv('INGEST_FLUSH_INTERVAL', '0.05'))
+FLUSH_BATCH_SIZE = 500
+
+# 打开/回复可能先于另一个worker写入的注册到达，tracked_emails和email_tracking中都找不到的事件在该时间内重试，
+# 之后视为未知邮件丢弃
+UNMATCHED_RETRY_SECONDS = 5
+
+# 数据库不可用时队列中最多保留的事件数，超过后丢弃新事件
+MAX_PENDING_EVENTS = 100000
+
+# 注册的插入或更新语句，按存储后端区分写法
+REGISTER_UPSERTS = {
+    'mysql': """
+    INSERT INTO tracked_emails (email_id, recipient, name, sent_time)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        recipient = VALUES(recipient),
+        name = VALUES(name),
+        sent_time = VALUES(sent_time)
+    """,
+    'sqlite': """
+    INSERT INTO tracked_emails (email_id, recipient, name, sent_time)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (email_id) DO UPDATE SET
+        recipient = excluded.recipient,
+        name = excluded.name,
+        sent_time = excluded.sent_time
+    """
+}
+
+
+# 从email_tracking补入tracked_emails的语句，已注册的邮件不覆盖
+BACKFILL_INSERTS = {
+    'mysql': """
+    INSERT IGNORE INTO tracked_emails (email_id, recipient, name, sent_time, opened_time, reply_time)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    """,
+    'sqlite': """
+    INSERT OR IGNORE INTO tracked_emails (email_id, recipient, name, sent_time, opened_time, reply_time)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    """
+}
+
+
+# 当前时间，格式与email_tracking和旧JSON状态中的时间一致
+def current_time():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+# 数据库中的时间转换为与旧JSON状态相同的字符串格式
+def _format_time(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+class IngestStore:
+    """
+    事件写入队列。register/record_open/record_reply只追加到队列，立即返回；
+    后台线程每FLUSH_INTERVAL秒或攒够一批时在一个事务中写入。
+    on_open(email_id, recipient, open_time)和on_reply(email_id, recipient, reply, reply_time)
+    在首次打开/回复写入提交后调用，用于计数和转发实时事件；
+    on_duplicate(kind, email_id)在已打开/已回复过的邮件再次出现时调用，kind为'open'或'reply'。
+    """
+
+    def __init__(self, db_config, on_open=None, on_reply=None, on_duplicate=None,
+                 flush_interval=FLUSH_INTERVAL, batch_size=FLUSH_BATCH_SIZE):
+        self.db_config = db_config
+        self.on_open = on_open
+        self.on_reply = on_reply
+        self.on_duplicate = on_duplicate
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._pending = deque()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+        self._thread.start()
+        return self
+
+    # 停止后台线程，写入队列中剩余的事件
+    def stop(self, timeout=10):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush(final=True)
+
+    def depth(self):
+        return len(self._pending)
+
+    def _enqueue(self, event):
+        if len(self._pending) >= MAX_PENDING_EVENTS:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.error(f"事件队列已满（{MAX_PENDING_EVENTS}），已丢弃 {self.dropped} 个事件")
+            return False
+        self._pending.append(event)
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def register(self, email_id, recipient, name, sent_time=None):
+        payload = (recipient, name, sent_time or current_time())
+        return self._enqueue(('register', email_id, payload, time.monotonic()))
+
+    def record_open(self, email_id, open_time=None):
+        return self._enqueue(('open', email_id, open_time or current_time(), time.monotonic()))
+
+    def record_reply(self, email_id, reply, reply_time=None):
+        return self._enqueue(('reply', email_id, (reply, reply_time or current_time()), time.monotonic()))
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"写入事件时出错: {e}")
+
+    def flush(self, final=False):
+        """写入队列中的所有事件，返回写入的事件数。final=True时不再重试未匹配的事件"""
+        written = 0
+        with self._flush_lock:
+            while self._pending:
+                batch = []
+                while self._pending and len(batch) < self.batch_size:
+                    batch.append(self._pending.popleft())
+                retry = self._write_batch(batch, final)
+                if retry is None:
+                    # 数据库不可用：事件放回队列头部，等下一轮再写
+                    self._pending.extendleft(reversed(batch))
+                    break
+                written += len(batch) - len(retry)
+                if retry:
+                    self._pending.extend(retry)
+                    break
+        return written
+
+    def _write_batch(self, batch, final):
+        """在一个事务中写入一批事件，返回需要稍后重试的事件；数据库出错时返回None"""
+        registers = [(email_id, *payload) for kind, email_id, payload, _ in batch if kind == 'register']
+        events = [event for event in batch if event[0] != 'register']
+        opened = []
+        replied = []
+        duplicates = []
+        retry = []
+
+        connection = None
+        try:
+            start = time.perf_counter()
+            connection = connect_db(self.db_config)
+            cursor = connection.cursor()
+
+            # 注册先写入，同一批中的打开和回复可以匹配到刚注册的邮件
+            if registers:
+                cursor.executemany(REGISTER_UPSERTS[backend(self.db_config)], registers)
+
+            known = {}
+            ids = list({email_id for _, email_id, _, _ in events})
+            if ids:
+                placeholders = ', '.join(['%s'] * len(ids))
+                cursor.execute(
+                    f"SELECT email_id, recipient FROM tracked_emails WHERE email_id IN ({placeholders})", ids
+                )
+                known = dict(cursor.fetchall())
+                missing = [email_id for email_id in ids if email_id not in known]
+                if missing:
+                    known.update(self._backfill(cursor, missing))
+
+            now = time.monotonic()
+            for event in events:
+                kind, email_id, payload, received = event
+                if email_id not in known:
+                    if not final and now - received < UNMATCHED_RETRY_SECONDS:
+                        retry.append(event)
+                    continue
+                if kind == 'open':
+                    cursor.execute(
+                        "UPDATE tracked_emails SET opened_time = %s WHERE email_id = %s AND opened_time IS NULL",
+                        (payload, email_id)
+                    )
+                    if cursor.rowcount > 0:
+                        opened.append((email_id, known[email_id], payload))
+                    else:
+                        duplicates.append(('open', email_id))
+                else:
+                    reply, reply_time = payload
+                    cursor.execute(
+                        "UPDATE tracked_emails SET reply_time = %s, reply_from = %s, reply_content = %s "
+                        "WHERE email_id = %s AND reply_time IS NULL",
+                        (reply_time, reply.get('from'), reply.get('content', ''), email_id)
+                    )
+                    if cursor.rowcount > 0:
+                        replied.append((email_id, known[email_id], reply, reply_time))
+                    else:
+                        duplicates.append(('reply', email_id))
+
+            # 与feedback_server一致，首次打开和回复同步到email_tracking表
+            if opened:
+                cursor.executemany(
+                    "UPDATE email_tracking SET is_opened = TRUE, open_time = %s WHERE email_id = %s",
+                    [(open_time, id_bytes(email_id)) for email_id, _, open_time in opened]
+                )
+            if replied:
+                cursor.executemany(
+                    "UPDATE email_tracking SET is_replied = TRUE, reply_time = %s WHERE email_id = %s",
+                    [(reply_time, id_bytes(email_id)) for email_id, _, _, reply_time in replied]
+                )
+
+            connection.commit()
+            cursor.close()
+            DB_WRITE_SECONDS.labels(operation='ingest_flush').observe(time.perf_counter() - start)
+        except Error as e:
+            logger.error(f"写入 {len(batch)} 个事件到数据库失败: {e}")
+            return None
+        finally:
+            if connection is not None and connection.is_connected():
+                connection.close()
+
+        for email_id, recipient, open_time in opened:
+            logger.info(f"邮件 {email_id} 已被打开", extra=PER_MAIL)
+            if self.on_open:
+                self.on_open(email_id, recipient, open_time)
+        for email_id, recipient, reply, reply_time in replied:
+            logger.info(f"邮件 {email_id} 已收到回复", extra=PER_MAIL)
+            if self.on_reply:
+                self.on_reply(email_id, recipient, reply, reply_time)
+        if self.on_duplicate:
+            for kind, email_id in duplicates:
+                self.on_duplicate(kind, email_id)
+        return retry
+
+    def _backfill(self, cursor, email_ids):
+        """
+        把email_tracking中有、tracked_emails中没有的邮件补入tracked_emails，已有的打开/回复时间一并写入，
+        之后的打开/回复按已有状态去重。返回补入的{email_id: 收件人}
+        """
+        raw_ids = {}
+        for email_id in email_ids:
+            raw = id_bytes(email_id)
+            if raw is not None:
+                raw_ids[raw] = email_id
+        if not raw_ids:
+            return {}
+
+        placeholders = ', '.join(['%s'] * len(raw_ids))
+        cursor.execute(
+            "SELECT email_id, email, contact_name, sent_time, open_time, reply_time "
+            f"FROM email_tracking WHERE email_id IN ({placeholders})", list(raw_ids)
+        )
+        rows = [(raw_ids[bytes(raw)], recipient, name, sent_time, open_time, reply_time)
+                for raw, recipient, name, sent_time, open_time, reply_time in cursor.fetchall()]
+        if rows:
+            cursor.executemany(BACKFILL_INSERTS[backend(self.db_config)], rows)
+            logger.info(f"已从email_tracking补入 {len(rows)} 封未注册的邮件")
+        return {row[0]: row[1] for row in rows}
+
+    def stats(self, details=True):
+        """已注册、已打开和已回复的邮件数，details=True时附带每封邮件的状态（与feedback_server的/stats格式一致）"""
+        connection = connect_db(self.db_config)
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT COUNT(*), COUNT(opened_time), COUNT(reply_time) FROM tracked_emails")
+            sent, opened, replied = cursor.fetchone()
+            result = {'sent': int(sent), 'opened': int(opened), 'replied': int(replied)}
+
+            if details:
+                cursor.execute(
+                    "SELECT email_id, recipient, name, sent_time, opened_time, reply_time, reply_from, reply_content "
+                    "FROM tracked_emails"
+                )
+                result['details'] = {
+                    email_id: {
+                        'recipient': recipient,
+                        'name': name,
+                        'sent_time': _format_time(sent_time),
+                        'opened': opened_time is not None,
+                        'opened_time': _format_time(opened_time),
+                        'replied': reply_time is not None,
+                        'reply_time': _format_time(reply_time),
+                        'reply_from': reply_from,
+                        'reply_content': reply_content
+                    }
+                    for email_id, recipient, name, sent_time, opened_time, reply_time, reply_from, reply_content
+                    in cursor.fetchall()
+                }
+            cursor.close()
+            return result
+        finally:
+            connection.close()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+后台发送任务注册表：长时间的发送任务提交到线程池执行，接口立即返回任务ID，
+之后可查询发送进度、吞吐量和预计剩余时间，也可以取消任务
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+logger = logging.getLogger('email_tracker')
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+
+class SendJob:
+    def __init__(self, kind, target, params=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.target = target
+        self.params = params or {}
+        self.status = QUEUED
+        self.message = ''
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.stop_event.is_set()
+
+    # 记录单个收件人的处理结果：'sent'、'failed'或'skipped'
+    def record(self, recipient, outcome):
+        with self._lock:
+            if outcome == 'sent':
+                self.sent += 1
+            elif outcome == 'failed':
+                self.failed += 1
+            else:
+                self.skipped += 1
+
+    def to_dict(self):
+        with self._lock:
+            sent, failed, skipped = self.sent, self.failed, self.skipped
+        now = self.finished_at or time.time()
+        elapsed = (now - self.started_at) if self.started_at else 0
+        remaining = max(0, self.target - sent)
+        # 吞吐量按成功发送数计算，包含发送间隔在内
+        throughput = sent / elapsed if elapsed > 0 else 0
+        eta = None
+        if self.status == RUNNING and throughput > 0:
+            eta = round(remaining / throughput)
+
+        def fmt(timestamp):
+            return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S') if timestamp else None
+
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'message': self.message,
+            'params': self.params,
+            'target': self.target,
+            'sent': sent,
+            'failed': failed,
+            'skipped': skipped,
+            'remaining': remaining,
+            'elapsed_seconds': round(elapsed, 1),
+            'throughput_per_minute': round(throughput * 60, 2),
+            'eta_seconds': eta,
+            'created_at': fmt(self.created_at),
+            'started_at': fmt(self.started_at),
+            'finished_at': fmt(self.finished_at)
+        }
+
+
+class JobRegistry:
+    """
+    func(job)在线程池中执行，返回值为完成时的说明信息；抛出异常时任务标记为失败。
+    只保留最近max_finished个已结束的任务。
+    """
+
+    def __init__(self, max_workers=4, max_finished=100):
+        self.jobs = OrderedDict()
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='send-job')
+        self._lock = threading.Lock()
+
+    def submit(self, kind, target, func, params=None):
+        job = SendJob(kind, target, params)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, func)
+        logger.info(f"已提交后台任务 {job.id} ({kind})，目标 {target} 封")
+        return job
+
+    def _run(self, job, func):
+        if job.cancelled:
+            job.status = CANCELLED
+            job.finished_at = time.time()
+            return
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            job.message = func(job) or ''
+            job.status = CANCELLED if job.cancelled else COMPLETED
+        except Exception as e:
+            logger.error(f"后台任务 {job.id} 执行失败: {e}")
+            job.message = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+        logger.info(f"后台任务 {job.id} 结束，状态: {job.status}，成功 {job.sent} 封，失败 {job.failed} 封")
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list(self):
+        return list(self.jobs.values())
+
+    def cancel(self, job_id):
+        """请求取消任务，正在发送的邮件完成后停止，返回任务或None"""
+        job = self.jobs.get(job_id)
+        if job is not None and job.status not in FINISHED_STATES:
+            job.stop_event.set()
+            if job.status == QUEUED:
+                job.status = CANCELLED
+                job.finished_at = time.time()
+        return job
+
+    # 删除最早结束的任务，只保留最近的max_finished个
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
+
+    def shutdown(self):
+        for job in self.list():
+            job.stop_event.set()
+        self._executor.shutdown(wait=False)
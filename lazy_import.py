@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+按需导入：lazy_module()返回的对象在第一次访问属性时才导入真正的模块，
+启动时不加载只在发送、收信或分析时才用到的依赖（requests、smtplib、imaplib、cProfile等）。
+
+    requests = lazy_module('requests')
+    requests.post(...)  # 第一次调用时导入
+
+导入由importlib完成，多个线程同时首次访问时也只导入一次。依赖未安装时在第一次使用时抛出ImportError。
+`from x import y`和异常类型的绑定（如except Error）需要在导入时确定，不适用。
+启动耗时见benchmarks/bench_import_time.py。
+"""
+
+import importlib
+import sys
+
+
+class LazyModule:
+    """模块的占位对象，属性访问转发到第一次使用时导入的模块"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_module(name):
+    """返回按需导入的模块，已经导入过的模块直接返回"""
+    return sys.modules.get(name) or LazyModule(name)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+统一的日志配置：各服务的日志记录只放入内存队列（QueueHandler），由后台线程（QueueListener）写入
+日志文件、控制台和系统日志，发送、追踪等热路径不会因磁盘或syslog阻塞。
+
+  - 日志文件按大小（LOG_MAX_BYTES，默认10MB）和时间（每天零点）轮转，保留LOG_BACKUP_COUNT个旧文件（默认7个）
+  - 每封邮件一条的INFO日志（发送、注册、打开、回复等）传入extra=PER_MAIL，可按LOG_SAMPLE_RATE抽样
+    （默认1，即全部记录；0.1为每10条记录1条），WARNING及以上的日志不抽样。发送成功的日志是每封邮件
+    唯一的发送记录，只在日志量确实过大时才降低
+  - 同一进程中多次调用setup_logging共用一个队列和后台线程，
+    各次调用的日志文件都会收到进程中所有日志
+  - 多进程服务（ingest_server的多个worker）由启动进程调用serve_log_records()统一写日志：
+    worker通过Unix套接字把日志发给启动进程，不会各自轮转同一个日志文件、互相覆盖
+
+用法: logger = setup_logging('email_sender', 'logs/sender.log')
+"""
+
+import atexit
+import itertools
+import logging
+import logging.handlers
+import os
+import pickle
+import queue
+import socketserver
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '7'))
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1'))
+
+# 每封邮件一条的INFO日志：logger.info(..., extra=PER_MAIL)
+PER_MAIL = {'per_mail': True}
+
+# 启动进程的日志接收地址，子进程从该环境变量得知应把日志发往哪里
+LOG_SERVER_ENV = 'MAILBOX_LOG_SERVER'
+
+_lock = threading.Lock()
+_queue = None
+_listener = None
+_targets = {}
+_log_server = None
+
+
+class SizedTimedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    超过max_bytes或过了零点时轮转，旧文件按编号保存为.1、.2……（同一天多次按大小轮转也不会覆盖）
+    """
+
+    def __init__(self, filename, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.rollover_at = self._next_midnight()
+
+    @staticmethod
+    def _next_midnight():
+        tomorrow = datetime.now().date() + timedelta(days=1)
+        return datetime.combine(tomorrow, datetime.min.time()).timestamp()
+
+    def shouldRollover(self, record):
+        if time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = self._next_midnight()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    PER_MAIL的INFO及以下日志每1/rate条保留1条（按计数，不随机），rate<=0时全部丢弃，
+    其他日志不受影响。放在QueueHandler上，丢弃的记录不进入队列
+    """
+
+    def __init__(self, rate=LOG_SAMPLE_RATE):
+        super().__init__()
+        self.every = round(1 / rate) if rate > 0 else 0
+        self._count = itertools.count()
+
+    def filter(self, record):
+        if not getattr(record, 'per_mail', False) or record.levelno > logging.INFO:
+            return True
+        if self.every <= 1:
+            return self.every == 1
+        return next(self._count) % self.every == 0
+
+
+# 创建队列、根日志记录器上的QueueHandler和后台线程
+def _start():
+    global _queue, _listener
+    _queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(_queue)
+    queue_handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    # 替换其他模块（如config_loader）用basicConfig添加的处理器
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(logging.INFO)
+
+    _listener = logging.handlers.QueueListener(_queue, *_targets.values(), respect_handler_level=True)
+    _listener.start()
+
+
+# fork出的子进程中没有后台线程，重新创建队列和线程，否则日志会一直积压在队列中
+def _restart_after_fork():
+    global _lock
+    _lock = threading.Lock()
+    if _listener is not None:
+        _start()
+
+
+# 进程退出时写完队列中剩余的日志
+def _stop():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    for handler in _targets.values():
+        handler.close()
+
+
+# 没有syslog守护进程（如容器中）时不添加，否则每条日志都会报错
+def _syslog_handler(address='/dev/log'):
+    if not os.path.exists(address):
+        raise OSError(f"{address} 不存在")
+    return logging.handlers.SysLogHandler(address=address)
+
+
+class _RecordReceiver(socketserver.StreamRequestHandler):
+    """接收子进程SocketHandler发来的日志（4字节长度 + pickle的LogRecord属性），放入本进程的队列"""
+
+    def handle(self):
+        while True:
+            header = self.rfile.read(4)
+            if len(header) < 4:
+                return
+            length = struct.unpack('>L', header)[0]
+            data = self.rfile.read(length)
+            if len(data) < length:
+                return
+            # 子进程已抽样过，直接交给后台线程写入
+            _queue.put(logging.makeLogRecord(pickle.loads(data)))
+
+
+# 进程退出时先停止接收，再由_stop写完队列
+def _stop_log_server(directory):
+    global _log_server
+    if _log_server is not None:
+        _log_server.shutdown()
+        _log_server.server_close()
+        _log_server = None
+    try:
+        os.unlink(os.path.join(directory, 'log.sock'))
+        os.rmdir(directory)
+    except OSError:
+        pass
+
+
+def serve_log_records():
+    """
+    在已调用过setup_logging的进程中接收子进程的日志，返回套接字路径并写入环境变量LOG_SERVER_ENV。
+    之后启动的子进程调用setup_logging时只把日志发给本进程，由本进程写入日志文件和控制台。
+    套接字放在只有当前用户可访问的临时目录中（接收的是pickle数据）
+    """
+    global _log_server
+    with _lock:
+        if _listener is None:
+            raise RuntimeError("需要先调用setup_logging")
+        if _log_server is None:
+            directory = tempfile.mkdtemp(prefix='mailbox-log-')
+            _log_server = socketserver.ThreadingUnixStreamServer(os.path.join(directory, 'log.sock'), _RecordReceiver)
+            _log_server.daemon_threads = True
+            threading.Thread(target=_log_server.serve_forever, name='log-receiver', daemon=True).start()
+            atexit.register(_stop_log_server, directory)
+        os.environ[LOG_SERVER_ENV] = _log_server.server_address
+        return _log_server.server_address
+
+
+def _add_target(key, factory):
+    if key in _targets:
+        return
+    try:
+        handler = factory()
+    except OSError as e:
+        logging.getLogger('log_setup').warning(f"无法创建日志处理器 {key}: {e}")
+        return
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _targets[key] = handler
+
+
+def setup_logging(name, log_file=None, syslog=False):
+    """
+    配置本进程的日志并返回名为name的日志记录器。log_file为轮转的日志文件，
+    syslog为True时同时写入系统日志（/dev/log）。可以多次调用，已添加的处理器不会重复添加。
+    设置了LOG_SERVER_ENV（由启动进程的serve_log_records设置）时，日志只发给启动进程
+    """
+    with _lock:
+        log_server = os.getenv(LOG_SERVER_ENV)
+        if log_server and _log_server is None:
+            # 启动进程统一写文件、控制台和系统日志，本进程只发送
+            _add_target('log_server', lambda: logging.handlers.SocketHandler(log_server, None))
+        else:
+            _add_target('console', logging.StreamHandler)
+            if log_file:
+                os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+                _add_target(log_file, lambda: SizedTimedRotatingFileHandler(log_file))
+            if syslog:
+                _add_target('syslog', _syslog_handler)
+
+        if _listener is None:
+            _start()
+            atexit.register(_stop)
+            os.register_at_fork(after_in_child=_restart_after_fork)
+        else:
+            # 后台线程每条记录都读取handlers，直接替换即可
+            _listener.handlers = tuple(_targets.values())
+    return logging.getLogger(name)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+进程内指标：计数器、仪表和直方图，以Prometheus文本格式通过各服务的/metrics接口输出。
+每个进程（API服务器、跟踪服务器、反馈服务器）维护自己的指标，分别抓取。
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# 默认延迟直方图分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value != value:
+        return 'NaN'
+    if value in (float('inf'), float('-inf')):
+        return '+Inf' if value > 0 else '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        # 没有标签的指标在注册时即输出0值
+        if not self.labelnames:
+            self.labels()
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        values = tuple(str(value) for value in values)
+        with self._lock:
+            child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = self._new_child()
+            return child
+
+    # 没有标签的指标直接使用默认子项
+    def _default(self):
+        return self.labels()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}']
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self.func = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, func):
+        """抓取时调用func()获取当前值，用于池大小、队列深度等"""
+        self.func = func
+
+    def get(self):
+        if self.func is not None:
+            try:
+                return float(self.func())
+            except Exception:
+                return float('nan')
+        return self.value
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def set_function(self, func):
+        self._default().set_function(func)
+
+    def _render_child(self, values, child):
+        return [f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}']
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if index < len(self.counts):
+                self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _render_child(self, values, child):
+        with child._lock:
+            counts, count, total = list(child.counts), child.count, child.sum
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, values, ('le', _format_value(float(bound))))
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, values, ('le', '+Inf'))
+        lines.append(f'{self.name}_bucket{labels} {count}')
+        lines.append(f'{self.name}_sum{_format_labels(self.labelnames, values)} {_format_value(total)}')
+        lines.append(f'{self.name}_count{_format_labels(self.labelnames, values)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    # 同名指标只注册一次，模块被重复导入时返回已有的指标
+    def _register(self, cls, name, documentation, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, documentation, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames=labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames=labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames=labelnames, buckets=buckets)
+
+    def render(self):
+        """返回Prometheus文本格式的全部指标"""
+        with self._lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# 进程内默认注册表
+REGISTRY = Registry()
+
+# 各服务共用的指标
+EMAILS_SENT = REGISTRY.counter('mailbox_emails_sent_total', '成功发送的邮件数')
+EMAILS_FAILED = REGISTRY.counter('mailbox_emails_failed_total', '发送失败的邮件数')
+EMAILS_SKIPPED = REGISTRY.counter('mailbox_emails_skipped_total', '发送前跳过的收件人数', ['reason'])
+EMAILS_OPENED = REGISTRY.counter('mailbox_emails_opened_total', '记录到的邮件打开数')
+EMAILS_REPLIED = REGISTRY.counter('mailbox_emails_replied_total', '记录到的邮件回复数')
+SMTP_SEND_SECONDS = REGISTRY.histogram('mailbox_smtp_send_seconds', 'SMTP发送单封邮件的耗时')
+MAIL_CONNECT_SECONDS = REGISTRY.histogram('mailbox_mail_connect_seconds', 'SMTP/IMAP建立连接（TCP、TLS握手和登录）的耗时',
+                                          ['protocol', 'tls_resumed'])
+DB_WRITE_SECONDS = REGISTRY.histogram('mailbox_db_write_seconds', '数据库写入耗时', ['operation'])
+TRACKER_REGISTER_SECONDS = REGISTRY.histogram('mailbox_tracker_register_seconds', '向跟踪服务器注册邮件的耗时')
+PIXEL_REQUEST_SECONDS = REGISTRY.histogram('mailbox_pixel_request_seconds', '追踪像素请求的处理耗时')
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+按需性能分析：在运行中的服务里对一个时间窗口或下一次发送任务启用cProfile或采样分析器，
+结果保存为pstats和折叠栈(collapsed stack)文件。每次分析都有最长时间限制，到时自动停止。
+"""
+
+import io
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from lazy_import import lazy_module
+
+# 开始分析时才导入
+cProfile = lazy_module('cProfile')
+pstats = lazy_module('pstats')
+
+logger = logging.getLogger('email_tracker')
+
+PROFILE_DIR = 'logs/profiles'
+
+# 单次分析的最长时间（秒），超时自动停止，防止分析器被遗忘而一直运行
+MAX_PROFILE_SECONDS = 600
+
+# 采样分析的默认间隔（秒）
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+MODES = ('cprofile', 'sampling')
+TARGETS = ('window', 'next_send')
+
+
+class ProfileSession:
+    def __init__(self, mode, target, duration, interval, thread_prefix=None):
+        self.id = datetime.now().strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6]
+        self.mode = mode
+        self.target = target
+        self.duration = duration
+        self.interval = interval
+        self.thread_prefix = thread_prefix
+        self.state = 'armed' if target == 'next_send' else 'running'
+        self.created_at = time.time()
+        self.started_at = None
+        self.stopped_at = None
+        self.stop_reason = None
+        self.samples = Counter()
+        self.sample_count = 0
+        self.profiles = []
+        self.files = {}
+        self.summary = ''
+        self.stop_event = threading.Event()
+        self._sampler = None
+
+    def to_dict(self):
+        def fmt(timestamp):
+            return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S') if timestamp else None
+
+        return {
+            'session_id': self.id,
+            'mode': self.mode,
+            'target': self.target,
+            'state': self.state,
+            'duration': self.duration,
+            'created_at': fmt(self.created_at),
+            'started_at': fmt(self.started_at),
+            'stopped_at': fmt(self.stopped_at),
+            'stop_reason': self.stop_reason,
+            'samples': self.sample_count,
+            'profiled_threads': len(self.profiles),
+            'files': self.files
+        }
+
+
+class Profiler:
+    """
+    同一时间只允许一个分析会话。
+    - target='window'：立即开始，duration秒后自动停止
+    - target='next_send'：等待下一次发送任务进入run_scope()时开始，任务结束时停止；
+      duration秒内没有发送任务则自动取消
+    cProfile只能分析启用它的线程，因此发送线程通过thread_scope()在每次发送时挂接各自的Profile，
+    停止时合并；采样分析器通过sys._current_frames()覆盖所有线程。
+    """
+
+    def __init__(self, output_dir=PROFILE_DIR):
+        self.output_dir = output_dir
+        self.session = None
+        self.last_session = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def start(self, mode='sampling', target='window', duration=60,
+              interval=DEFAULT_SAMPLE_INTERVAL, thread_prefix=None):
+        if mode not in MODES:
+            raise ValueError(f"mode必须是{MODES}之一")
+        if target not in TARGETS:
+            raise ValueError(f"target必须是{TARGETS}之一")
+        duration = max(1, min(float(duration), MAX_PROFILE_SECONDS))
+        interval = max(0.001, float(interval))
+
+        with self._lock:
+            if self.session is not None:
+                raise RuntimeError(f"已有分析会话 {self.session.id} 正在进行")
+            session = ProfileSession(mode, target, duration, interval, thread_prefix)
+            self.session = session
+            if target == 'window':
+                self._begin(session)
+
+        # 看门狗：无论是否有人调用stop，到时都会停止
+        self._timer = threading.Timer(duration, self._expire, args=(session,))
+        self._timer.name = 'profiler-watchdog'
+        self._timer.daemon = True
+        self._timer.start()
+        logger.info(f"性能分析会话 {session.id} 已{'开始' if target == 'window' else '就绪，等待下一次发送任务'}，"
+                    f"模式: {mode}，最长 {duration:.0f} 秒")
+        return session
+
+    def _begin(self, session):
+        session.state = 'running'
+        session.started_at = time.time()
+        if session.mode == 'sampling':
+            session._sampler = threading.Thread(
+                target=self._sample_loop, args=(session,), name='profiler-sampler', daemon=True
+            )
+            session._sampler.start()
+
+    def _expire(self, session):
+        if self.session is session:
+            self.stop(reason='timeout')
+
+    def stop(self, reason='manual'):
+        """停止当前会话并保存结果，没有会话时返回None"""
+        with self._lock:
+            session = self.session
+            if session is None:
+                return None
+            self.session = None
+        if self._timer is not None:
+            self._timer.cancel()
+
+        session.stop_event.set()
+        if session._sampler is not None:
+            session._sampler.join(timeout=5)
+        session.stopped_at = time.time()
+        session.stop_reason = reason
+        if session.started_at is None:
+            session.state = 'expired'
+            logger.info(f"性能分析会话 {session.id} 在等待期间没有发送任务，已取消")
+        else:
+            session.state = 'finished'
+            self._save(session)
+            logger.info(f"性能分析会话 {session.id} 已停止({reason})，结果: {session.files}")
+        self.last_session = session
+        return session
+
+    @contextmanager
+    def run_scope(self):
+        """包裹一次发送任务：存在等待中的next_send会话时在此开始，任务结束时停止"""
+        session = None
+        with self._lock:
+            if self.session is not None and self.session.state == 'armed':
+                session = self.session
+                self._begin(session)
+        try:
+            yield
+        finally:
+            if session is not None and self.session is session:
+                self.stop(reason='send_finished')
+
+    @contextmanager
+    def thread_scope(self):
+        """包裹发送线程中的一次发送：cProfile会话运行时为当前线程启用Profile"""
+        session = self.session
+        if session is None or session.mode != 'cprofile' or session.state != 'running':
+            yield
+            return
+        profile = getattr(self._local, 'profiles', {}).get(session.id)
+        if profile is None:
+            profile = cProfile.Profile()
+            self._local.profiles = {session.id: profile}
+            with self._lock:
+                session.profiles.append(profile)
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+的cProfile基于sys.monitoring，同一时间只能有一个线程启用，其余发送不计入
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+
+    def _sample_loop(self, session):
+        own_id = threading.get_ident()
+        while not session.stop_event.wait(session.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                thread_name = names.get(thread_id, str(thread_id))
+                if session.thread_prefix and not thread_name.startswith(session.thread_prefix):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(thread_name)
+                session.samples[';'.join(reversed(stack))] += 1
+            session.sample_count += 1
+
+    def _save(self, session):
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, session.id)
+
+        if session.mode == 'cprofile':
+            if not session.profiles:
+                session.summary = '分析期间没有发送线程执行'
+                return
+            stats = pstats.Stats(session.profiles[0])
+            for profile in session.profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(base + '.pstats')
+            session.files['pstats'] = base + '.pstats'
+
+            output = io.StringIO()
+            pstats.Stats(base + '.pstats', stream=output).sort_stats('cumulative').print_stats(40)
+            session.summary = output.getvalue()
+        else:
+            with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+                for stack, count in session.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            session.files['collapsed'] = base + '.collapsed'
+            session.summary = '\n'.join(
+                f"{count:>7} {stack}" for stack, count in session.samples.most_common(20)
+            )
+
+        session.profiles = []
+
+    def status(self):
+        session = self.session
+        last = self.last_session
+        return {
+            'active': session.to_dict() if session else None,
+            'last': dict(last.to_dict(), summary=last.summary) if last else None
+        }
+
+
+# 进程内默认分析器
+PROFILER = Profiler()
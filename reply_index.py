@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+回复匹配索引：在内存中维护已发送邮件的Message-ID，用于快速判断收到的邮件是否为回复
+"""
+
+import logging
+import re
+import threading
+
+from email_ids import id_bytes
+from sql_tools.storage import Error, connect_db
+
+logger = logging.getLogger('email_sender')
+
+# 匹配In-Reply-To/References中的<local@domain>
+MESSAGE_ID_PATTERN = re.compile(r'<([^<>@\s]+)@[^<>\s]*>')
+
+
+# 将邮件ID转换为紧凑的键：本系统的邮件ID（新旧格式、数据库中的16字节）使用16字节二进制，其他格式保留原值
+def compact_id(email_id):
+    return id_bytes(email_id) or email_id
+
+
+# 从In-Reply-To和References头中提取所有候选邮件ID（按出现顺序去重）
+def extract_candidate_ids(in_reply_to, references):
+    candidates = []
+    for header in (in_reply_to or '', references or ''):
+        for local_part in MESSAGE_ID_PATTERN.findall(header):
+            if local_part not in candidates:
+                candidates.append(local_part)
+    return candidates
+
+
+class SentMessageIndex:
+    """
+    已发送邮件ID索引：从email_tracking.email_id加载，并随新发送的邮件增量更新，以哈希集合O(1)确认。
+    （在集合前加布隆过滤器只会更慢：计算摘要比查集合慢约30倍，而集合仍需保留）
+    """
+
+    def __init__(self, db_config):
+        self.db_config = db_config
+        self.ids = set()
+        self.ready = False
+        self._last_row_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    # 添加一个已发送邮件ID
+    def add(self, email_id):
+        key = compact_id(email_id)
+        with self._lock:
+            self.ids.add(key)
+
+    def __contains__(self, email_id):
+        return compact_id(email_id) in self.ids
+
+    # 从数据库增量加载新写入的邮件ID
+    def refresh(self):
+        connection = None
+        try:
+            connection = connect_db(self.db_config)
+            cursor = connection.cursor()
+            cursor.execute(
+                "SELECT id, email_id FROM email_tracking WHERE id > %s AND email_id IS NOT NULL ORDER BY id",
+                (self._last_row_id,)
+            )
+            loaded = 0
+            while True:
+                rows = cursor.fetchmany(5000)
+                if not rows:
+                    break
+                for row_id, email_id in rows:
+                    self.add(email_id)
+                    self._last_row_id = max(self._last_row_id, row_id)
+                    loaded += 1
+            cursor.close()
+            self.ready = True
+            if loaded:
+                logger.info(f"回复匹配索引已加载 {loaded} 个邮件ID，共 {len(self.ids)} 个")
+        except Error as e:
+            logger.error(f"加载回复匹配索引失败: {e}")
+        finally:
+            if connection is not None and connection.is_connected():
+                connection.close()
+        return self.ready
+
+    # 在候选ID中查找属于本系统发送的邮件ID，未找到返回None
+    def resolve(self, in_reply_to, references):
+        if not self.ready:
+            # 索引不可用时退回旧逻辑：优先In-Reply-To，否则References中最后一个
+            candidates = (extract_candidate_ids(in_reply_to, None)
+                          or extract_candidate_ids(None, references)[-1:])
+            return candidates[0] if candidates else None
+        candidates = extract_candidate_ids(in_reply_to, references)
+        for candidate in candidates:
+            if candidate in self:
+                return candidate
+        return None
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+回复解析流水线：IMAP抓取、邮件解析、结果上报分离，解析阶段由进程池并行执行
+"""
+
+import email
+import email.utils
+import logging
+import os
+import re
+import threading
+from concurrent.futures import BrokenExecutor, Future
+from email.header import decode_header, make_header
+
+from bounce_processor import parse_dsn
+
+logger = logging.getLogger('email_sender')
+
+# 每次UID FETCH获取的邮件数量
+FETCH_BATCH_SIZE = 100
+# 单批邮件少于该数量时直接在当前线程解析，避免进程间传输开销
+INLINE_PARSE_THRESHOLD = 20
+# 回复内容摘要长度
+SNIPPET_LENGTH = 200
+
+FETCH_UID_PATTERN = re.compile(rb'UID (\d+)')
+
+
+# 解码MIME编码的邮件头，无法识别的字符集以替换字符代替
+def decode_mime_header(value):
+    if not value:
+        return ''
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        parts = []
+        for fragment, charset in decode_header(value):
+            if isinstance(fragment, bytes):
+                parts.append(decode_bytes(fragment, charset))
+            else:
+                parts.append(fragment)
+        return ''.join(parts)
+
+
+# 按声明的字符集解码字节，字符集未知或数据损坏时不抛出异常
+def decode_bytes(data, charset=None):
+    for candidate in (charset, 'utf-8', 'gb18030'):
+        if not candidate:
+            continue
+        try:
+            return data.decode(candidate)
+        except (LookupError, UnicodeDecodeError):
+            continue
+    return data.decode('latin-1', errors='replace')
+
+
+# 提取邮件正文文本，优先text/plain，其次text/html，跳过附件
+def extract_body(message):
+    html_body = None
+    for part in message.walk() if message.is_multipart() else [message]:
+        if part.is_multipart() or part.get_content_disposition() == 'attachment':
+            continue
+        content_type = part.get_content_type()
+        if content_type not in ('text/plain', 'text/html'):
+            continue
+        payload = part.get_payload(decode=True)
+        if payload is None:
+            continue
+        text = decode_bytes(payload, part.get_content_charset())
+        if content_type == 'text/plain':
+            return text
+        if html_body is None:
+            html_body = text
+    return html_body or ''
+
+
+# 解析单封邮件，返回回复匹配和上报所需的字段；退信邮件在bounces中返回失败收件人
+def parse_message(uid, raw_email):
+    try:
+        message = email.message_from_bytes(raw_email)
+        bounces = parse_dsn(message)
+        body = '' if bounces else extract_body(message)
+        return {
+            'uid': uid,
+            'subject': decode_mime_header(message.get('Subject')),
+            'from': email.utils.parseaddr(message.get('From', ''))[1],
+            'in_reply_to': str(message.get('In-Reply-To', '') or ''),
+            'references': str(message.get('References', '') or ''),
+            'snippet': body[:SNIPPET_LENGTH],
+            'bounces': bounces
+        }
+    except Exception as e:
+        return {'uid': uid, 'error': str(e)}
+
+
+# 解析一批邮件（进程池任务单元，按批提交以摊薄进程间通信开销）
+def parse_batch(items):
+    return [parse_message(uid, raw_email) for uid, raw_email in items]
+
+
+# 将UID FETCH的响应拆分为(uid, 原始邮件)列表
+def parse_fetch_response(data):
+    items = []
+    pending = None
+    for entry in data or []:
+        if isinstance(entry, tuple):
+            match = FETCH_UID_PATTERN.search(entry[0])
+            uid = int(match.group(1)) if match else None
+            pending = [uid, entry[1]]
+            items.append(pending)
+        elif isinstance(entry, bytes) and pending is not None and pending[0] is None:
+            # 部分服务器在字面量之后才返回UID，例如 b' UID 101)'
+            match = FETCH_UID_PATTERN.search(entry)
+            if match:
+                pending[0] = int(match.group(1))
+    return [(uid, raw_email) for uid, raw_email in items if uid is not None]
+
+
+class _PooledBatch:
+    """
+    提交到进程池的一批邮件，用法与Future相同（done()、result()）。
+    子进程崩溃（如OOM）导致进程池损坏时，丢弃该进程池（下次提交时重建），并在当前线程重新解析这一批
+    """
+
+    def __init__(self, pool, executor, items, future):
+        self._pool = pool
+        self._executor = executor
+        self._items = items
+        self._future = future
+        self._fallback = None
+
+    def done(self):
+        return self._fallback is not None or self._future.done()
+
+    def result(self, timeout=None):
+        if self._fallback is None:
+            try:
+                return self._future.result(timeout)
+            except BrokenExecutor as e:
+                self._fallback = self._pool.parse_after_broken(self._executor, self._items, e)
+        return self._fallback
+
+
+class ParsePool:
+    """
+    邮件解析进程池：小批量直接在当前线程解析，大批量提交到进程池并行解析。
+    进程池在首次需要时创建，并在多次检查之间复用。
+    """
+
+    def __init__(self, max_workers=None, inline_threshold=INLINE_PARSE_THRESHOLD):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.inline_threshold = inline_threshold
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # 进程池和multiprocessing在首次需要时才导入，少量回复内联解析时不加载
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        with self._lock:
+            if self._executor is None:
+                # 使用spawn启动子进程，避免在多线程进程中fork导致死锁
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                logger.info(f"已启动邮件解析进程池，进程数: {self.max_workers}")
+            return self._executor
+
+    def warm_up(self):
+        """提前启动进程池并等每个子进程完成导入，首批邮件不再承担启动开销。max_workers<=1时不使用进程池"""
+        if self.max_workers <= 1:
+            return
+        executor = self._get_executor()
+        for future in [executor.submit(parse_batch, []) for _ in range(self.max_workers)]:
+            future.result()
+
+    # 提交一批待解析邮件，返回Future
+    def submit(self, items):
+        if self.max_workers <= 1 or len(items) < self.inline_threshold:
+            future = Future()
+            future.set_result(parse_batch(items))
+            return future
+        executor = self._get_executor()
+        try:
+            future = executor.submit(parse_batch, items)
+        except BrokenExecutor as e:
+            future = Future()
+            future.set_result(self.parse_after_broken(executor, items, e))
+            return future
+        return _PooledBatch(self, executor, items, future)
+
+    def parse_after_broken(self, executor, items, error):
+        """进程池已损坏：丢弃它（仍是当前进程池时），在当前线程解析items"""
+        with self._lock:
+            if self._executor is executor:
+                logger.error(f"邮件解析进程池已损坏，将在下次使用时重建: {error}")
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+        return parse_batch(items)
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+                self._executor = None
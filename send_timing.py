@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+发送耗时分解：记录每封邮件在send_email各阶段（模板渲染、MIME构建、SMTP连接检查、SMTP DATA、
+跟踪注册、数据库写入等）的耗时，保存在环形缓冲区中，并可选写入JSONL追踪文件
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger('email_sender')
+
+# send_email中按执行顺序排列的阶段
+PHASES = (
+    'template_render',
+    'mime_build',
+    'smtp_connect_check',
+    'smtp_data',
+    'tracker_register',
+    'db_connect',
+    'db_insert',
+    'companies_update',
+)
+
+# 环形缓冲区保留的最近发送记录数
+RING_BUFFER_SIZE = 5000
+
+# 设置该环境变量后，每条记录同时追加写入JSONL文件
+TRACE_FILE = os.getenv('SEND_TIMING_TRACE_FILE')
+
+
+class SendTiming:
+    """一封邮件的各阶段耗时（秒）"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.email_id = None
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+
+class TimingRecorder:
+    def __init__(self, size=RING_BUFFER_SIZE, trace_file=TRACE_FILE):
+        self.records = deque(maxlen=size)
+        self.trace_file = trace_file
+        self._trace = None
+        self._lock = threading.Lock()
+
+    def record(self, timing, outcome):
+        record = {
+            'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+            'email_id': timing.email_id,
+            'outcome': outcome,
+            'total': round(time.perf_counter() - timing.start, 6),
+            'phases': {name: round(seconds, 6) for name, seconds in timing.phases.items()}
+        }
+        self.records.append(record)
+        if self.trace_file:
+            self._write_trace(record)
+        return record
+
+    def _write_trace(self, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            try:
+                if self._trace is None:
+                    directory = os.path.dirname(self.trace_file)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    self._trace = open(self.trace_file, 'a', encoding='utf-8', buffering=1)
+                self._trace.write(line)
+            except OSError as e:
+                logger.error(f"写入发送耗时追踪文件失败: {e}")
+                self.trace_file = None
+
+    def summarize(self, last=None):
+        """按阶段统计最近last次发送的耗时分位数（毫秒）"""
+        records = list(self.records)
+        if last:
+            records = records[-last:]
+
+        samples = {name: [] for name in PHASES}
+        samples['total'] = []
+        outcomes = {}
+        for record in records:
+            outcomes[record['outcome']] = outcomes.get(record['outcome'], 0) + 1
+            samples['total'].append(record['total'])
+            for name, seconds in record['phases'].items():
+                samples.setdefault(name, []).append(seconds)
+
+        total_time = sum(samples['total']) or 1
+        phases = {}
+        for name, values in samples.items():
+            if not values:
+                continue
+            values.sort()
+            phases[name] = {
+                'count': len(values),
+                'mean_ms': round(sum(values) / len(values) * 1000, 3),
+                'p50_ms': round(percentile(values, 50) * 1000, 3),
+                'p90_ms': round(percentile(values, 90) * 1000, 3),
+                'p99_ms': round(percentile(values, 99) * 1000, 3),
+                'max_ms': round(values[-1] * 1000, 3),
+                # 该阶段在全部发送耗时中的占比
+                'share': round(sum(values) / total_time, 4)
+            }
+        return {'sends': len(records), 'outcomes': outcomes, 'phases': phases}
+
+
+# 最近秩法计算分位数，values须已排序
+def percentile(values, q):
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+# 进程内默认记录器
+RECORDER = TimingRecorder()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+多worker共享状态：一块命名共享内存，包含所有worker合计的计数器和已打开/已回复邮件ID的去重哈希表。
+启动器在启动worker之前创建（SharedState.create），通过环境变量把名字传给worker，worker导入时挂载（attach）。
+
+写入（计数、插入哈希表）在进程内锁和文件锁(flock)下进行，查询不加锁：哈希表的槽位只会从空变为完整的键，
+读到写了一半的槽位最多当作未命中，再由数据库的条件更新去重，不会出现误判为已存在。
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+logger = logging.getLogger('ingest_server')
+
+# worker通过该环境变量找到启动器创建的共享内存
+SHARED_STATE_ENV = 'INGEST_SHARED_STATE'
+
+# 去重哈希表的槽位数，每个槽位16字节；超过MAX_LOAD_FACTOR后不再插入，只影响过滤效果，不影响计数
+DEDUP_CAPACITY = int(os.getenv('INGEST_DEDUP_CAPACITY', str(1 << 20)))
+MAX_LOAD_FACTOR = 0.75
+
+COUNTERS = ('registered', 'opened', 'replied', 'duplicate_opens', 'duplicate_replies')
+
+MAGIC = b'MBXSHM01'
+HEADER = struct.Struct('<8sQQ')  # 标识、槽位数、已用槽位数
+COUNTERS_OFFSET = 64
+TABLE_OFFSET = COUNTERS_OFFSET + 8 * 16
+SLOT_SIZE = 16
+EMPTY_SLOT = bytes(SLOT_SIZE)
+
+
+# 挂载已有的共享内存。Python 3.13之前挂载方也会向resource_tracker登记，独立运行的worker退出时
+# 会把共享内存删除；与启动器共用resource_tracker的worker取消登记又会删掉创建方的登记。
+# 这里挂载时跳过登记，只由创建方负责删除
+def _attach_segment(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        from multiprocessing import resource_tracker
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+# 跨进程锁使用的锁文件
+def _lock_path(name):
+    return os.path.join(tempfile.gettempdir(), f'{name}.lock')
+
+
+# 哈希表中保存的键：事件类型和邮件ID的16字节摘要
+def _digest(kind, email_id):
+    return hashlib.blake2b(f'{kind}:{email_id}'.encode('utf-8'), digest_size=SLOT_SIZE).digest()
+
+
+class SharedState:
+    """所有worker共用的计数器和去重哈希表"""
+
+    def __init__(self, segment, owner=False):
+        self.segment = segment
+        self.name = segment.name
+        self.owner = owner
+        magic, self.capacity, _ = HEADER.unpack_from(segment.buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"共享内存 {self.name} 不是事件接收服务的共享状态")
+        self._thread_lock = threading.Lock()
+        self._lock_file = open(_lock_path(self.name), 'a+b')
+
+    @classmethod
+    def create(cls, capacity=DEDUP_CAPACITY):
+        """创建并初始化共享内存，返回的实例负责在unlink()时删除"""
+        # 新建的共享内存内容全为0，即计数器为0、所有槽位为空
+        segment = shared_memory.SharedMemory(create=True, size=TABLE_OFFSET + capacity * SLOT_SIZE)
+        HEADER.pack_into(segment.buf, 0, MAGIC, capacity, 0)
+        logger.info(f"已创建共享状态 {segment.name}，去重表 {capacity} 个槽位（{capacity * SLOT_SIZE // 1024 // 1024} MB）")
+        return cls(segment, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(_attach_segment(name))
+
+    @classmethod
+    def from_environ(cls):
+        """按环境变量挂载启动器创建的共享状态，没有启动器时返回None（单进程运行）"""
+        name = os.getenv(SHARED_STATE_ENV)
+        if not name:
+            return None
+        try:
+            return cls.attach(name)
+        except (FileNotFoundError, ValueError) as e:
+            logger.warning(f"挂载共享状态 {name} 失败，按单进程运行: {e}")
+            return None
+
+    def close(self):
+        self._lock_file.close()
+        self.segment.close()
+
+    # 创建方在所有worker退出后删除共享内存和锁文件
+    def unlink(self):
+        self.close()
+        if self.owner:
+            self.segment.unlink()
+            try:
+                os.remove(_lock_path(self.name))
+            except OSError:
+                pass
+
+    # flock按打开的文件区分持有者，同一进程的多个线程还需要进程内的锁
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def inc(self, counter, amount=1):
+        offset = COUNTERS_OFFSET + COUNTERS.index(counter) * 8
+        with self._locked():
+            value, = struct.unpack_from('<q', self.segment.buf, offset)
+            struct.pack_into('<q', self.segment.buf, offset, value + amount)
+
+    def value(self, counter):
+        return struct.unpack_from('<q', self.segment.buf, COUNTERS_OFFSET + COUNTERS.index(counter) * 8)[0]
+
+    def used(self):
+        return HEADER.unpack_from(self.segment.buf, 0)[2]
+
+    # 线性探测：返回键所在的槽位偏移，未找到时返回第一个空槽位的偏移（表满时为None）
+    def _probe(self, digest):
+        buf = self.segment.buf
+        index = int.from_bytes(digest[:8], 'little') % self.capacity
+        for _ in range(self.capacity):
+            offset = TABLE_OFFSET + index * SLOT_SIZE
+            slot = bytes(buf[offset:offset + SLOT_SIZE])
+            if slot == digest or slot == EMPTY_SLOT:
+                return offset, slot == digest
+            index = (index + 1) % self.capacity
+        return None, False
+
+    def contains(self, kind, email_id):
+        """邮件是否已记录过该事件（kind为'open'或'reply'），不加锁"""
+        return self._probe(_digest(kind, email_id))[1]
+
+    def add(self, kind, email_id):
+        """记录邮件的事件，新插入时返回True；已存在或表已满时返回False"""
+        digest = _digest(kind, email_id)
+        with self._locked():
+            used = self.used()
+            if used >= self.capacity * MAX_LOAD_FACTOR:
+                return False
+            offset, found = self._probe(digest)
+            if found or offset is None:
+                return False
+            self.segment.buf[offset:offset + SLOT_SIZE] = digest
+            HEADER.pack_into(self.segment.buf, 0, MAGIC, self.capacity, used + 1)
+            return True
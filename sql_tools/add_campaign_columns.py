@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+升级task_scheduler表以支持多个并发活动：添加max_concurrency列，并为task_name添加唯一索引
+"""
+import mysql.connector
+from mysql.connector import Error
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config_loader import get_db_config
+
+def connect_to_mysql():
+    """
+    连接到MySQL数据库
+    """
+    db_config = get_db_config()
+    try:
+        connection = mysql.connector.connect(
+            host=db_config['host'],
+            user=db_config['user'],
+            password=db_config['password'],
+            database=db_config['database']
+        )
+        if connection.is_connected():
+            print("成功连接到MySQL数据库")
+            return connection
+    except Error as e:
+        print(f"连接MySQL时出错: {e}")
+        return None
+
+def add_campaign_columns():
+    """
+    向task_scheduler表添加max_concurrency列和task_name唯一索引
+    """
+    connection = connect_to_mysql()
+    if connection is None:
+        return
+
+    try:
+        cursor = connection.cursor()
+
+        # 检查max_concurrency列是否已存在
+        cursor.execute("DESCRIBE task_scheduler")
+        columns = cursor.fetchall()
+        column_names = [column[0] for column in columns]
+
+        if 'max_concurrency' in column_names:
+            print("列'max_concurrency'已存在")
+        else:
+            cursor.execute("""
+            ALTER TABLE task_scheduler
+            ADD COLUMN max_concurrency INT DEFAULT 1 AFTER last_opened_count
+            """)
+            connection.commit()
+            print("成功添加'max_concurrency'列")
+
+        # 检查task_name是否已有唯一索引
+        cursor.execute("SHOW INDEX FROM task_scheduler WHERE Column_name = 'task_name' AND Non_unique = 0")
+        if cursor.fetchall():
+            print("task_name唯一索引已存在")
+        else:
+            cursor.execute("SELECT task_name FROM task_scheduler GROUP BY task_name HAVING COUNT(*) > 1")
+            duplicates = [row[0] for row in cursor.fetchall()]
+            if duplicates:
+                print(f"以下task_name存在重复记录，请先清理后再添加唯一索引: {', '.join(duplicates)}")
+            else:
+                cursor.execute("ALTER TABLE task_scheduler ADD UNIQUE INDEX uniq_task_name (task_name)")
+                connection.commit()
+                print("成功添加task_name唯一索引")
+
+        # 显示更新后的表结构
+        cursor.execute("DESCRIBE task_scheduler")
+        table_structure = cursor.fetchall()
+        print("\n更新后的表结构:")
+        for column in table_structure:
+            print(column)
+
+    except Error as e:
+        print(f"执行操作时出错: {e}")
+    finally:
+        if connection.is_connected():
+            cursor.close()
+            connection.close()
+            print("MySQL连接已关闭")
+
+if __name__ == "__main__":
+    add_campaign_columns()
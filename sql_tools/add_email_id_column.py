@@ -50,10 +50,11 @@ def add_email_id_column():
         if 'email_id' in column_names:
             print("列'email_id'已存在")
         else:
-            # 添加email_id列
+            # 添加email_id列（16字节的邮件ID，见email_ids.py）
             alter_query = """
             ALTER TABLE email_tracking 
-            ADD COLUMN email_id VARCHAR(255) AFTER email
+            ADD COLUMN email_id BINARY(16) AFTER email,
+            ADD INDEX idx_email_tracking_email_id (email_id)
             """
             cursor.execute(alter_query)
             connection.commit()
@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+创建邮件屏蔽表,用于记录退信和退订的邮箱地址
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sql_tools.mysql_connection import create_email_suppression_table
+
+if __name__ == "__main__":
+    create_email_suppression_table()
@@ -53,7 +53,7 @@ def create_task_scheduler_table():
             create_table_query = """
             CREATE TABLE task_scheduler (
                 id INT AUTO_INCREMENT PRIMARY KEY,
-                task_name VARCHAR(255) NOT NULL,
+                task_name VARCHAR(255) NOT NULL UNIQUE,
                 is_running BOOLEAN DEFAULT FALSE,
                 daily_count INT NOT NULL,
                 target_countries TEXT,
@@ -64,6 +64,7 @@ def create_task_scheduler_table():
                 last_run_date DATETIME,
                 last_sent_count INT DEFAULT 0,
                 last_opened_count INT DEFAULT 0,
+                max_concurrency INT DEFAULT 1,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                 updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
             )
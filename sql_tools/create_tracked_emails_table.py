@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+创建事件接收服务(ingest_server.py)使用的tracked_emails表
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sql_tools.mysql_connection import create_tracked_emails_table
+
+if __name__ == "__main__":
+    create_tracked_emails_table()
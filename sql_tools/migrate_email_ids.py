@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+将email_tracking.email_id从36个字符的UUID文本迁移为16字节二进制（见email_ids.py），并为其建索引。
+旧邮件追踪链接和Message-ID中的UUID文本仍可解码为相同的16字节，迁移后打开、回复和回复匹配照常工作。
+无法解码的email_id（非本系统生成的ID）迁移后为NULL，会打印数量和示例，可先用--dry-run查看。
+
+MySQL: 添加email_id_bin BINARY(16)列，按id分批转换，再删除旧列并改名、建索引（需要短暂锁表）
+SQLite: 按id分批把文本改写为BLOB（SQLite的列类型不限制保存的值）
+
+用法: python sql_tools/migrate_email_ids.py [--batch-size 5000] [--dry-run]
+"""
+
+import argparse
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config_loader import get_db_config
+from email_ids import id_bytes
+from sql_tools.storage import Error, backend, connect_db
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='email_tracking.email_id迁移为16字节二进制')
+    parser.add_argument('--batch-size', type=int, default=5000, help='每批转换的记录数')
+    parser.add_argument('--dry-run', action='store_true', help='只统计可转换和无法转换的记录数，不修改数据库')
+    return parser.parse_args()
+
+
+# MySQL中email_tracking.email_id的列类型，列不存在时返回None
+def mysql_column_type(cursor, column):
+    cursor.execute("SHOW COLUMNS FROM email_tracking LIKE %s", (column,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    column_type = row[1]
+    return (column_type.decode() if isinstance(column_type, (bytes, bytearray)) else column_type).lower()
+
+
+def convert_rows(connection, cursor, source, target, batch_size, dry_run):
+    """按id分批把source列的文本ID转换后写入target列，返回(转换数, 无法转换数, 示例)"""
+    converted = 0
+    failed = 0
+    samples = []
+    last_id = 0
+    while True:
+        cursor.execute(
+            f"SELECT id, {source} FROM email_tracking WHERE id > %s AND {source} IS NOT NULL ORDER BY id LIMIT %s",
+            (last_id, batch_size)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        updates = []
+        for row_id, email_id in rows:
+            if isinstance(email_id, (bytes, bytearray)) and len(email_id) == 16:
+                continue
+            raw = id_bytes(email_id.decode() if isinstance(email_id, (bytes, bytearray)) else email_id)
+            if raw is None:
+                failed += 1
+                if len(samples) < 5:
+                    samples.append(email_id)
+            else:
+                converted += 1
+            updates.append((raw, row_id))
+
+        if updates and not dry_run:
+            cursor.executemany(f"UPDATE email_tracking SET {target} = %s WHERE id = %s", updates)
+            connection.commit()
+        print(f"已处理到id {last_id}，转换 {converted} 条，无法转换 {failed} 条")
+    return converted, failed, samples
+
+
+def migrate_mysql(connection, cursor, args):
+    column_type = mysql_column_type(cursor, 'email_id')
+    if column_type is None:
+        print("email_tracking表没有email_id列，请先运行add_email_id_column.py")
+        return
+    if column_type == 'binary(16)':
+        print("email_tracking.email_id已是BINARY(16)，无需迁移")
+        return
+
+    if args.dry_run:
+        return convert_rows(connection, cursor, 'email_id', 'email_id', args.batch_size, True)
+
+    # 中断后重新运行时继续使用已添加的列
+    if mysql_column_type(cursor, 'email_id_bin') is None:
+        cursor.execute("ALTER TABLE email_tracking ADD COLUMN email_id_bin BINARY(16) AFTER email_id")
+        print("已添加email_id_bin列")
+    result = convert_rows(connection, cursor, 'email_id', 'email_id_bin', args.batch_size, False)
+
+    cursor.execute("ALTER TABLE email_tracking DROP COLUMN email_id")
+    cursor.execute(
+        "ALTER TABLE email_tracking CHANGE COLUMN email_id_bin email_id BINARY(16), "
+        "ADD INDEX idx_email_tracking_email_id (email_id)"
+    )
+    print("已将email_id替换为BINARY(16)列并建立索引")
+    return result
+
+
+def main():
+    args = parse_args()
+    db_config = get_db_config()
+
+    connection = None
+    try:
+        connection = connect_db(db_config)
+        cursor = connection.cursor()
+        if backend(db_config) == 'sqlite':
+            result = convert_rows(connection, cursor, 'email_id', 'email_id', args.batch_size, args.dry_run)
+        else:
+            result = migrate_mysql(connection, cursor, args)
+        cursor.close()
+    except Error as e:
+        print(f"迁移email_id时出错: {e}")
+        return
+    finally:
+        if connection is not None and connection.is_connected():
+            connection.close()
+
+    if result is None:
+        return
+    converted, failed, samples = result
+    print(f"\n{'预计' if args.dry_run else '已'}转换 {converted} 条记录")
+    if failed:
+        print(f"{failed} 条记录的email_id不是本系统生成的ID，迁移后为NULL，例如: {samples}")
+
+
+if __name__ == "__main__":
+    main()
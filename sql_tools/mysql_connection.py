@@ -1,8 +1,6 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import mysql.connector
-from mysql.connector import Error
 from datetime import datetime, timedelta
 import json
 
@@ -10,6 +8,11 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config_loader import get_db_config
+from lazy_import import lazy_module
+from sql_tools.storage import Error, backend, connect_db, create_tables
+
+# 只有MySQL专用的建表函数使用，api_server读写任务配置时不加载
+mysql_connector = lazy_module('mysql.connector')
 
 def connect_to_mysql():
     """
@@ -17,7 +20,7 @@ def connect_to_mysql():
     """
     db_config = get_db_config()
     try:
-        connection = mysql.connector.connect(
+        connection = mysql_connector.connect(
             host=db_config['host'],
             user=db_config['user'],
             password=db_config['password'],
@@ -26,10 +29,21 @@ def connect_to_mysql():
         if connection.is_connected():
             print("成功连接到MySQL数据库")
             return connection
-    except Error as e:
+    except Error + (ImportError,) as e:
         print(f"连接MySQL时出错: {e}")
         return None
 
+def connect_to_database():
+    """
+    按配置的存储后端（MySQL或SQLite）连接数据库，任务配置的读写使用该连接
+    """
+    db_config = get_db_config()
+    try:
+        return connect_db(db_config)
+    except Error as e:
+        print(f"连接数据库时出错: {e}")
+        return None
+
 def create_email_tracking_table():
     """
     创建一个新表用于存储已发送邮件的跟踪信息，包括公司名称、联系人、邮箱、
@@ -61,8 +75,10 @@ def create_email_tracking_table():
                 sent_time DATETIME NOT NULL,
                 open_time DATETIME,
                 reply_time DATETIME,
+                email_id BINARY(16),
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                INDEX idx_email_tracking_email_id (email_id)
             )
             """
             cursor.execute(create_table_query)
@@ -106,7 +122,7 @@ def create_task_scheduler_table():
             create_table_query = """
             CREATE TABLE task_scheduler (
                 id INT AUTO_INCREMENT PRIMARY KEY,
-                task_name VARCHAR(255) NOT NULL,
+                task_name VARCHAR(255) NOT NULL UNIQUE,
                 is_running BOOLEAN DEFAULT FALSE,
                 daily_count INT NOT NULL,
                 target_countries TEXT,
@@ -117,6 +133,7 @@ def create_task_scheduler_table():
                 last_run_date DATETIME,
                 last_sent_count INT DEFAULT 0,
                 last_opened_count INT DEFAULT 0,
+                max_concurrency INT DEFAULT 1,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                 updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
             )
@@ -140,34 +157,160 @@ def create_task_scheduler_table():
             connection.close()
             print("MySQL连接已关闭")
 
-def load_task_from_db():
-    """从数据库加载任务配置"""
+def create_email_suppression_table():
+    """
+    创建邮件屏蔽表，记录硬退信、软退信次数和退订的邮箱地址，被屏蔽的地址不再发送
+    """
+    connection = connect_to_mysql()
+    if connection is None:
+        return
+    
+    try:
+        cursor = connection.cursor()
+        
+        # 检查表是否已存在
+        cursor.execute("SHOW TABLES LIKE 'email_suppression'")
+        result = cursor.fetchone()
+        
+        if result:
+            print("表'email_suppression'已存在")
+        else:
+            # 创建新表
+            create_table_query = """
+            CREATE TABLE email_suppression (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                email VARCHAR(255) NOT NULL UNIQUE,
+                reason VARCHAR(50) NOT NULL,
+                is_suppressed BOOLEAN DEFAULT FALSE,
+                soft_bounce_count INT DEFAULT 0,
+                status_code VARCHAR(20),
+                diagnostic TEXT,
+                last_email_id VARCHAR(255),
+                last_bounce_time DATETIME,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            )
+            """
+            cursor.execute(create_table_query)
+            connection.commit()
+            print("成功创建'email_suppression'表")
+            
+        # 显示表结构
+        cursor.execute("DESCRIBE email_suppression")
+        table_structure = cursor.fetchall()
+        print("\n表结构:")
+        for column in table_structure:
+            print(column)
+            
+    except Error as e:
+        print(f"执行操作时出错: {e}")
+    finally:
+        if connection.is_connected():
+            cursor.close()
+            connection.close()
+            print("MySQL连接已关闭")
+
+def create_tracked_emails_table():
+    """
+    创建事件接收服务使用的邮件表，记录每封已注册邮件的收件人、首次打开和回复信息
+    """
+    connection = connect_to_mysql()
+    if connection is None:
+        return
+    
+    try:
+        cursor = connection.cursor()
+        
+        # 检查表是否已存在
+        cursor.execute("SHOW TABLES LIKE 'tracked_emails'")
+        result = cursor.fetchone()
+        
+        if result:
+            print("表'tracked_emails'已存在")
+        else:
+            # 创建新表
+            create_table_query = """
+            CREATE TABLE tracked_emails (
+                email_id VARCHAR(255) PRIMARY KEY,
+                recipient VARCHAR(255),
+                name VARCHAR(255),
+                sent_time DATETIME,
+                opened_time DATETIME,
+                reply_time DATETIME,
+                reply_from VARCHAR(255),
+                reply_content TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+            cursor.execute(create_table_query)
+            connection.commit()
+            print("成功创建'tracked_emails'表")
+            
+        # 显示表结构
+        cursor.execute("DESCRIBE tracked_emails")
+        table_structure = cursor.fetchall()
+        print("\n表结构:")
+        for column in table_structure:
+            print(column)
+            
+    except Error as e:
+        print(f"执行操作时出错: {e}")
+    finally:
+        if connection.is_connected():
+            cursor.close()
+            connection.close()
+            print("MySQL连接已关闭")
+
+def _normalize_task(task):
+    """将数据库中的任务记录转换为API使用的配置格式"""
+    # 处理JSON字符串
+    task['target_countries'] = json.loads(task['target_countries']) if task['target_countries'] else []
+    task['target_regions'] = json.loads(task['target_regions']) if task['target_regions'] else []
+    task['workdays'] = json.loads(task['workdays'])
+    
+    # 处理时间格式
+    # TIME类型转换为字符串格式
+    if isinstance(task['send_time'], timedelta):
+        total_seconds = int(task['send_time'].total_seconds())
+        hours = total_seconds // 3600
+        minutes = (total_seconds % 3600) // 60
+        task['send_time'] = f"{hours:02d}:{minutes:02d}"
+    
+    # 处理日期
+    task['last_run_date'] = task['last_run_date'].strftime('%Y-%m-%d') if task['last_run_date'] else None
+    
+    # 旧表结构没有并发配额字段时默认为1
+    task['max_concurrency'] = task.get('max_concurrency') or 1
+    return task
+
+def load_tasks_from_db():
+    """从数据库加载所有营销任务（活动）配置"""
+    connection = None
+    try:
+        connection = connect_to_database()
+        if connection and connection.is_connected():
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute("SELECT * FROM task_scheduler ORDER BY id")
+            return [_normalize_task(task) for task in cursor.fetchall()]
+    except Error as e:
+        print(f"从数据库加载任务配置失败: {e}")
+    finally:
+        if connection and connection.is_connected():
+            connection.close()
+    return []
+
+def load_task_from_db(task_name='default_task'):
+    """从数据库加载指定任务的配置"""
     connection = None
     try:
-        connection = connect_to_mysql()
+        connection = connect_to_database()
         if connection and connection.is_connected():
             cursor = connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM task_scheduler WHERE is_running = TRUE LIMIT 1")
+            cursor.execute("SELECT * FROM task_scheduler WHERE task_name = %s LIMIT 1", (task_name,))
             task = cursor.fetchone()
             
             if task:
-                # 处理JSON字符串
-                task['target_countries'] = json.loads(task['target_countries']) if task['target_countries'] else []
-                task['target_regions'] = json.loads(task['target_regions']) if task['target_regions'] else []
-                task['workdays'] = json.loads(task['workdays'])
-                
-                # 处理时间格式
-                # TIME类型转换为字符串格式
-                if isinstance(task['send_time'], timedelta):
-                    total_seconds = int(task['send_time'].total_seconds())
-                    hours = total_seconds // 3600
-                    minutes = (total_seconds % 3600) // 60
-                    task['send_time'] = f"{hours:02d}:{minutes:02d}"
-                
-                # 处理日期
-                task['last_run_date'] = task['last_run_date'].strftime('%Y-%m-%d') if task['last_run_date'] else None
-                
-                return task
+                return _normalize_task(task)
     except Error as e:
         print(f"从数据库加载任务配置失败: {e}")
     finally:
@@ -176,18 +319,16 @@ def load_task_from_db():
     return None
 
 def save_task_to_db(task_config):
-    """保存任务配置到数据库"""
+    """保存任务配置到数据库，按task_name区分不同的任务，互不影响"""
+    task_name = task_config.get('task_name') or 'default_task'
     connection = None
     try:
-        connection = connect_to_mysql()
+        connection = connect_to_database()
         if connection and connection.is_connected():
             cursor = connection.cursor()
             
-            # 停止所有任务
-            cursor.execute("UPDATE task_scheduler SET is_running = FALSE")
-            
             # 检查是否存在任务
-            cursor.execute("SELECT id FROM task_scheduler WHERE task_name = 'default_task'")
+            cursor.execute("SELECT id FROM task_scheduler WHERE task_name = %s", (task_name,))
             existing_task = cursor.fetchone()
             
             # 准备数据 - 处理datetime和字符串两种可能的类型
@@ -200,9 +341,23 @@ def save_task_to_db(task_config):
                 else:
                     print(f"警告: last_run_date 类型不支持: {type(task_config['last_run_date'])}")
             
+            values = (
+                task_config['is_running'],
+                task_config['daily_count'],
+                json.dumps(task_config['target_countries']),
+                json.dumps(task_config['target_regions']),
+                task_config['send_time'],
+                json.dumps(task_config['workdays']),
+                task_config['template_name'],
+                last_run_date,
+                task_config['last_sent_count'],
+                task_config['last_opened_count'],
+                task_config.get('max_concurrency', 1)
+            )
+            
             if existing_task:
                 # 更新现有任务
-                update_query = """
+                query = """
                 UPDATE task_scheduler SET
                     is_running = %s,
                     daily_count = %s,
@@ -213,45 +368,23 @@ def save_task_to_db(task_config):
                     template_name = %s,
                     last_run_date = %s,
                     last_sent_count = %s,
-                    last_opened_count = %s
-                WHERE task_name = 'default_task'
+                    last_opened_count = %s,
+                    max_concurrency = %s
+                WHERE task_name = %s
                 """
-                data = (
-                    task_config['is_running'],
-                    task_config['daily_count'],
-                    json.dumps(task_config['target_countries']),
-                    json.dumps(task_config['target_regions']),
-                    task_config['send_time'],
-                    json.dumps(task_config['workdays']),
-                    task_config['template_name'],
-                    last_run_date,
-                    task_config['last_sent_count'],
-                    task_config['last_opened_count']
-                )
+                data = values + (task_name,)
             else:
                 # 创建新任务
-                insert_query = """
+                query = """
                 INSERT INTO task_scheduler (
-                    task_name, is_running, daily_count, target_countries, target_regions,
+                    is_running, daily_count, target_countries, target_regions,
                     send_time, workdays, template_name, last_run_date, last_sent_count,
-                    last_opened_count
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    last_opened_count, max_concurrency, task_name
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 """
-                data = (
-                    'default_task',
-                    task_config['is_running'],
-                    task_config['daily_count'],
-                    json.dumps(task_config['target_countries']),
-                    json.dumps(task_config['target_regions']),
-                    task_config['send_time'],
-                    json.dumps(task_config['workdays']),
-                    task_config['template_name'],
-                    last_run_date,
-                    task_config['last_sent_count'],
-                    task_config['last_opened_count']
-                )
+                data = values + (task_name,)
             
-            cursor.execute(update_query if existing_task else insert_query, data)
+            cursor.execute(query, data)
             connection.commit()
             return True
             
@@ -262,6 +395,29 @@ def save_task_to_db(task_config):
             connection.close()
     return False
 
+def delete_task_from_db(task_name):
+    """从数据库删除任务，返回是否成功（任务不在数据库中也视为成功）"""
+    connection = None
+    try:
+        connection = connect_to_database()
+        if connection and connection.is_connected():
+            cursor = connection.cursor()
+            cursor.execute("DELETE FROM task_scheduler WHERE task_name = %s", (task_name,))
+            connection.commit()
+            return True
+    except Error as e:
+        print(f"从数据库删除任务失败: {e}")
+    finally:
+        if connection and connection.is_connected():
+            connection.close()
+    return False
+
 if __name__ == "__main__":
-    create_email_tracking_table()
-    create_task_scheduler_table()
+    if backend(get_db_config()) == 'sqlite':
+        create_tables(get_db_config())
+        print(f"已在SQLite数据库 {get_db_config()['sqlite_path']} 中创建所有表")
+    else:
+        create_email_tracking_table()
+        create_task_scheduler_table()
+        create_email_suppression_table()
+        create_tracked_emails_table()
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+存储后端：按DB_CONFIG['backend']选择MySQL或嵌入式SQLite（WAL模式），覆盖companies、email_tracking、
+email_suppression、task_scheduler和事件接收服务使用的tracked_emails表。各模块通过connect_db获取连接，继续使用原有的%s占位符SQL和
+cursor(dictionary=True)，不需要区分后端。
+
+SQLite适合单机部署、跟踪服务器和基准测试：没有网络往返，连接按线程复用，每个打开/回复事件只是一次本地写入。
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from functools import lru_cache
+
+from config_loader import DB_CONFIG
+
+
+class MySQLError(Exception):
+    pass
+
+
+# mysql-connector导入较慢，只在配置的后端为mysql时导入（Error要在导入时确定，不能推迟到连接时），
+# 使用SQLite后端的服务和脚本启动时不加载，也可以不安装
+mysql = None
+if (DB_CONFIG.get('backend') or 'mysql').lower() == 'mysql':
+    try:
+        import mysql.connector
+        from mysql.connector import Error as MySQLError
+    except ImportError:
+        mysql = None
+
+logger = logging.getLogger('storage')
+
+# 两种后端的数据库异常，调用方用except Error统一处理
+Error = (MySQLError, sqlite3.Error)
+
+BACKENDS = ('mysql', 'sqlite')
+
+# SQLite等待其他连接释放写锁的最长时间（毫秒）
+SQLITE_BUSY_TIMEOUT_MS = 5000
+
+# 与sql_tools中的建表脚本一致，生产表除主键、唯一键和email_tracking.email_id（16字节，打开/回复按它更新）外没有索引
+MYSQL_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS companies (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        company_name VARCHAR(255) NOT NULL,
+        company_country VARCHAR(100),
+        contact_name VARCHAR(255),
+        contact_email VARCHAR(255),
+        contact_position VARCHAR(255),
+        contact_email_sent BOOLEAN DEFAULT FALSE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS email_tracking (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        company_name VARCHAR(255) NOT NULL,
+        contact_name VARCHAR(255),
+        email VARCHAR(255) NOT NULL,
+        is_replied BOOLEAN DEFAULT FALSE,
+        is_opened BOOLEAN DEFAULT FALSE,
+        sent_time DATETIME NOT NULL,
+        open_time DATETIME,
+        reply_time DATETIME,
+        email_id BINARY(16),
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        INDEX idx_email_tracking_email_id (email_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS email_suppression (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        email VARCHAR(255) NOT NULL UNIQUE,
+        reason VARCHAR(50) NOT NULL,
+        is_suppressed BOOLEAN DEFAULT FALSE,
+        soft_bounce_count INT DEFAULT 0,
+        status_code VARCHAR(20),
+        diagnostic TEXT,
+        last_email_id VARCHAR(255),
+        last_bounce_time DATETIME,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS task_scheduler (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        task_name VARCHAR(255) NOT NULL UNIQUE,
+        is_running BOOLEAN DEFAULT FALSE,
+        daily_count INT NOT NULL,
+        target_countries TEXT,
+        target_regions TEXT,
+        send_time TIME NOT NULL,
+        workdays VARCHAR(50) NOT NULL,
+        template_name VARCHAR(255) NOT NULL,
+        last_run_date DATETIME,
+        last_sent_count INT DEFAULT 0,
+        last_opened_count INT DEFAULT 0,
+        max_concurrency INT DEFAULT 1,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS tracked_emails (
+        email_id VARCHAR(255) PRIMARY KEY,
+        recipient VARCHAR(255),
+        name VARCHAR(255),
+        sent_time DATETIME,
+        opened_time DATETIME,
+        reply_time DATETIME,
+        reply_from VARCHAR(255),
+        reply_content TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+# SQLite的等价表结构：时间使用本地时间（与MySQL的CURRENT_TIMESTAMP一致），updated_at由触发器维护；
+# AUTOINCREMENT保证id单调递增，回复和地址索引按id增量加载依赖这一点。
+# 打开/回复事件按email_id更新，SQLite没有服务器端缓冲池，这里为email_id建索引
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS companies (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    company_name VARCHAR(255) NOT NULL,
+    company_country VARCHAR(100),
+    contact_name VARCHAR(255),
+    contact_email VARCHAR(255),
+    contact_position VARCHAR(255),
+    contact_email_sent BOOLEAN DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS email_tracking (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    company_name VARCHAR(255) NOT NULL,
+    contact_name VARCHAR(255),
+    email VARCHAR(255) NOT NULL,
+    is_replied BOOLEAN DEFAULT FALSE,
+    is_opened BOOLEAN DEFAULT FALSE,
+    sent_time DATETIME NOT NULL,
+    open_time DATETIME,
+    reply_time DATETIME,
+    email_id BLOB,
+    created_at DATETIME DEFAULT (datetime('now', 'localtime')),
+    updated_at DATETIME DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_email_tracking_email_id ON email_tracking (email_id);
+
+CREATE TRIGGER IF NOT EXISTS email_tracking_updated_at AFTER UPDATE ON email_tracking
+FOR EACH ROW WHEN NEW.updated_at = OLD.updated_at
+BEGIN
+    UPDATE email_tracking SET updated_at = datetime('now', 'localtime') WHERE id = NEW.id;
+END;
+
+CREATE TABLE IF NOT EXISTS email_suppression (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email VARCHAR(255) NOT NULL UNIQUE,
+    reason VARCHAR(50) NOT NULL,
+    is_suppressed BOOLEAN DEFAULT FALSE,
+    soft_bounce_count INT DEFAULT 0,
+    status_code VARCHAR(20),
+    diagnostic TEXT,
+    last_email_id VARCHAR(255),
+    last_bounce_time DATETIME,
+    created_at DATETIME DEFAULT (datetime('now', 'localtime')),
+    updated_at DATETIME DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TRIGGER IF NOT EXISTS email_suppression_updated_at AFTER UPDATE ON email_suppression
+FOR EACH ROW WHEN NEW.updated_at = OLD.updated_at
+BEGIN
+    UPDATE email_suppression SET updated_at = datetime('now', 'localtime') WHERE id = NEW.id;
+END;
+
+CREATE TABLE IF NOT EXISTS task_scheduler (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_name VARCHAR(255) NOT NULL UNIQUE,
+    is_running BOOLEAN DEFAULT FALSE,
+    daily_count INT NOT NULL,
+    target_countries TEXT,
+    target_regions TEXT,
+    send_time TIME NOT NULL,
+    workdays VARCHAR(50) NOT NULL,
+    template_name VARCHAR(255) NOT NULL,
+    last_run_date DATETIME,
+    last_sent_count INT DEFAULT 0,
+    last_opened_count INT DEFAULT 0,
+    max_concurrency INT DEFAULT 1,
+    created_at DATETIME DEFAULT (datetime('now', 'localtime')),
+    updated_at DATETIME DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS tracked_emails (
+    email_id VARCHAR(255) PRIMARY KEY,
+    recipient VARCHAR(255),
+    name VARCHAR(255),
+    sent_time DATETIME,
+    opened_time DATETIME,
+    reply_time DATETIME,
+    reply_from VARCHAR(255),
+    reply_content TEXT,
+    created_at DATETIME DEFAULT (datetime('now', 'localtime'))
+);
+"""
+
+
+# 与MySQL的DATETIME一致：写入时精确到秒，读取DATETIME列时返回datetime对象
+sqlite3.register_adapter(datetime, lambda value: value.strftime('%Y-%m-%d %H:%M:%S'))
+sqlite3.register_converter('DATETIME', lambda value: datetime.fromisoformat(value.decode()))
+
+
+# 配置使用的后端，未配置时为mysql
+def backend(db_config):
+    name = (db_config.get('backend') or 'mysql').lower()
+    if name not in BACKENDS:
+        raise ValueError(f"不支持的数据库后端: {name}，可选 {', '.join(BACKENDS)}")
+    return name
+
+
+# 将MySQL风格的%s占位符转换为SQLite的?
+@lru_cache(maxsize=256)
+def _translate(query):
+    return query.replace('%s', '?')
+
+
+class SQLiteCursor:
+    """包装sqlite3游标，接受%s占位符，dictionary=True时返回字典行，与mysql.connector的游标用法一致"""
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        if dictionary:
+            cursor.row_factory = _dict_row
+
+    def execute(self, query, params=()):
+        self._cursor.execute(_translate(query), params)
+        return self
+
+    def executemany(self, query, seq_of_params):
+        self._cursor.executemany(_translate(query), seq_of_params)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class SQLiteConnection:
+    """
+    包装按线程复用的sqlite3连接。close()不关闭底层连接，只回滚未提交的事务，
+    下次connect_db在同一线程中直接复用，省去每个事件打开文件和设置PRAGMA的开销。
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def is_connected(self):
+        return True
+
+    def cursor(self, dictionary=False):
+        return SQLiteCursor(self._connection.cursor(), dictionary)
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def close(self):
+        if self._connection.in_transaction:
+            self._connection.rollback()
+
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+# 打开SQLite数据库：WAL模式允许读写并发，synchronous=NORMAL在WAL下只在检查点时fsync
+def _open_sqlite(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+                                 detect_types=sqlite3.PARSE_DECLTYPES)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+
+    # 每个进程第一次打开某个数据库文件时建表，单机部署不需要单独运行建表脚本
+    with _schema_lock:
+        if path not in _schema_ready:
+            connection.executescript(SQLITE_SCHEMA)
+            _schema_ready.add(path)
+            logger.info(f"已打开SQLite数据库 {path}（WAL模式）")
+    return connection
+
+
+def _sqlite_connection(path):
+    path = os.path.abspath(path)
+    # fork出的子进程不能使用父进程打开的连接
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.pid = os.getpid()
+        _local.connections = {}
+    connection = _local.connections.get(path)
+    if connection is None:
+        connection = _local.connections[path] = _open_sqlite(path)
+    return SQLiteConnection(connection)
+
+
+def connect_db(db_config):
+    """按db_config连接数据库，返回的连接和游标在两种后端下用法相同"""
+    if backend(db_config) == 'sqlite':
+        return _sqlite_connection(db_config['sqlite_path'])
+    if mysql is None:
+        raise MySQLError("未安装mysql-connector-python或DB_BACKEND不是mysql，无法连接MySQL")
+    return mysql.connector.connect(
+        host=db_config['host'],
+        user=db_config['user'],
+        password=db_config['password'],
+        database=db_config['database']
+    )
+
+
+def create_tables(db_config):
+    """按配置的后端创建所有表（已存在的表不变）"""
+    connection = connect_db(db_config)
+    try:
+        if backend(db_config) == 'mysql':
+            cursor = connection.cursor()
+            for statement in MYSQL_SCHEMA:
+                cursor.execute(statement)
+            connection.commit()
+            cursor.close()
+    finally:
+        connection.close()
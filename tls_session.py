@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+SMTP/IMAP连接的TLS会话复用：所有连接共用一个SSLContext，每个服务器(host, port)最近一次握手得到的
+TLS会话保存在TLSSessionCache中。重连时用它恢复会话，省去证书传输、验证和完整的密钥交换；
+IMAP检查回复的连接和IDLE监听连接也共用同一个缓存。服务器不接受缓存的会话时自动退回完整握手。
+
+TLS 1.3的会话票据在握手完成后才由服务器发送，因此在登录成功（已读取过服务器响应）后才保存会话。
+会话只能在创建它的SSLContext中使用，缓存按上下文区分。
+
+重连耗时见benchmarks/bench_reconnect.py和/metrics中的mailbox_mail_connect_seconds。
+"""
+
+import imaplib
+import smtplib
+import threading
+
+
+class TLSSessionCache:
+    """按(host, port)保存最近一次的TLS会话，并统计恢复会话和完整握手的次数"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.resumed = 0
+        self.full = 0
+
+    def get(self, context, host, port):
+        with self._lock:
+            entry = self._sessions.get((host, port))
+        if entry is None or entry[0] is not context:
+            return None
+        return entry[1]
+
+    def save(self, context, host, port, tls_socket, reused):
+        session = tls_socket.session
+        with self._lock:
+            if reused:
+                self.resumed += 1
+            else:
+                self.full += 1
+            if session is not None:
+                self._sessions[(host, port)] = (context, session)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+# 本进程所有SMTP/IMAP连接共用的会话缓存
+SESSION_CACHE = TLSSessionCache()
+
+
+class ResumableSMTP_SSL(smtplib.SMTP_SSL):
+    """SMTP_SSL：握手时使用缓存的TLS会话，登录后保存新的会话。session_reused表示本次握手是否恢复了会话"""
+
+    def __init__(self, host='', port=0, session_cache=None, **kwargs):
+        self.session_cache = SESSION_CACHE if session_cache is None else session_cache
+        self.session_reused = False
+        self._port = port
+        super().__init__(host, port, **kwargs)
+
+    def _get_socket(self, host, port, timeout):
+        self._port = port
+        new_socket = smtplib.SMTP._get_socket(self, host, port, timeout)
+        new_socket = self.context.wrap_socket(
+            new_socket,
+            server_hostname=self._host,
+            session=self.session_cache.get(self.context, self._host, port)
+        )
+        self.session_reused = new_socket.session_reused
+        return new_socket
+
+    def login(self, user, password, *, initial_response_ok=True):
+        result = super().login(user, password, initial_response_ok=initial_response_ok)
+        self.session_cache.save(self.context, self._host, self._port, self.sock, self.session_reused)
+        return result
+
+
+class ResumableIMAP4_SSL(imaplib.IMAP4_SSL):
+    """IMAP4_SSL：握手时使用缓存的TLS会话，登录后保存新的会话。session_reused含义同ResumableSMTP_SSL"""
+
+    def __init__(self, host='', port=imaplib.IMAP4_SSL_PORT, session_cache=None, **kwargs):
+        self.session_cache = SESSION_CACHE if session_cache is None else session_cache
+        self.session_reused = False
+        super().__init__(host, port, **kwargs)
+
+    def _create_socket(self, timeout):
+        sock = imaplib.IMAP4._create_socket(self, timeout)
+        sock = self.ssl_context.wrap_socket(
+            sock,
+            server_hostname=self.host,
+            session=self.session_cache.get(self.ssl_context, self.host, self.port)
+        )
+        self.session_reused = sock.session_reused
+        return sock
+
+    def login(self, user, password):
+        result = super().login(user, password)
+        self.session_cache.save(self.ssl_context, self.host, self.port, self.sock, self.session_reused)
+        return result
@@ -5,35 +5,40 @@
 邮件追踪服务器：用于监测邮件打开状态和接收回复
 """
 
-from flask import Flask, request, send_file
+from flask import Flask, request, send_file, Response
 import os
-import logging
 import json
 from datetime import datetime
 import threading
 import time
 
+from email_ids import is_legacy_id, is_mail_id
+from event_bus import EventForwarder
+from log_setup import PER_MAIL, setup_logging
+from metrics import CONTENT_TYPE, EMAILS_OPENED, EMAILS_REPLIED, PIXEL_REQUEST_SECONDS, REGISTRY
+from tracker_store import TrackerStore
+
 # 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/tracker.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger('email_tracker')
+logger = setup_logging('email_tracker', 'logs/tracker.log')
 
 # 创建Flask应用
 app = Flask(__name__)
 
-# 存储邮件状态的数据结构
-email_stats = {
-    'sent': 0,        # 发送的邮件数
-    'opened': set(),  # 打开的邮件ID集合
-    'replied': set(), # 回复的邮件ID集合
-    'details': {}     # 存储每封邮件的详细信息
-}
+# 发送的邮件数
+email_stats = {'sent': 0}
+
+# 每封邮件的打开、回复状态和详细信息（TrackerStore内部加锁）
+store = TrackerStore()
+
+# 多个请求线程同时保存时，避免交错写入同一个文件
+save_lock = threading.Lock()
+
+# 将打开和回复事件转发到API服务器的实时事件流，不阻塞请求
+event_forwarder = EventForwarder()
+
+REGISTRY.gauge('mailbox_event_forward_queue_depth', '等待转发到API服务器的事件数').set_function(
+    lambda: event_forwarder.queue.qsize())
+REGISTRY.gauge('mailbox_tracked_emails', '追踪服务器内存中记录的邮件数').set_function(lambda: len(store))
 
 # 确保日志目录存在
 os.makedirs('logs', exist_ok=True)
@@ -48,64 +53,100 @@ if not os.path.exists('static/tracker.png'):
 @app.route('/track/<email_id>')
 def track_open(email_id):
     """记录邮件打开事件"""
-    if email_id not in email_stats['opened']:
-        email_stats['opened'].add(email_id)
-        logger.info(f"邮件 {email_id} 已被打开")
-        
-        # 更新邮件详情
-        if email_id in email_stats['details']:
-            email_stats['details'][email_id]['opened'] = True
-            email_stats['details'][email_id]['opened_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    start = time.perf_counter()
+    if is_known(email_id) and store.mark_opened(email_id):
+        EMAILS_OPENED.inc()
+        logger.info(f"邮件 {email_id} 已被打开", extra=PER_MAIL)
+        event_forwarder.publish('open', {
+            'email_id': email_id,
+            'open_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
         
         # 保存统计数据
         save_stats()
     
     # 返回透明像素图
-    return send_file('static/tracker.png', mimetype='image/png')
+    response = send_file('static/tracker.png', mimetype='image/png')
+    PIXEL_REQUEST_SECONDS.observe(time.perf_counter() - start)
+    return response
 
 @app.route('/reply', methods=['POST'])
 def track_reply():
     """记录邮件回复事件"""
     data = request.json
-    email_id = data.get('email_id')
-    reply_content = data.get('content', '')
     
-    if email_id and email_id not in email_stats['replied']:
-        email_stats['replied'].add(email_id)
-        logger.info(f"邮件 {email_id} 已收到回复")
-        
-        # 更新邮件详情
-        if email_id in email_stats['details']:
-            email_stats['details'][email_id]['replied'] = True
-            email_stats['details'][email_id]['reply_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            email_stats['details'][email_id]['reply_content'] = reply_content
-        
+    if record_replies([data]):
         # 保存统计数据
         save_stats()
         
     return {'status': 'success'}
 
+@app.route('/reply/bulk', methods=['POST'])
+def track_replies_bulk():
+    """批量记录邮件回复事件，所有回复处理完后只保存一次统计数据"""
+    data = request.json
+    replies = data.get('replies') if isinstance(data, dict) else data
+    
+    if not isinstance(replies, list):
+        return {'error': 'Expected a list of replies'}, 400
+    
+    updated = record_replies([reply for reply in replies if isinstance(reply, dict)])
+    if updated:
+        save_stats()
+    
+    return {'status': 'success', 'received': len(replies), 'updated': updated}
+
+def is_known(email_id):
+    """已有记录或为新格式邮件ID时返回True；否则记入未知ID（有上限），最近第一次出现时记日志。
+    旧格式ID（36个字符的UUID）只在已有记录时才算已知，任意UUID都符合该格式，不能据此新建记录"""
+    if email_id in store or (not is_legacy_id(email_id) and is_mail_id(email_id)):
+        return True
+    if store.note_unknown(email_id):
+        logger.warning(f"忽略未知的邮件ID: {email_id}")
+    return False
+
+def record_replies(replies):
+    """更新内存中的回复状态，返回新记录的回复数量"""
+    updated = 0
+    for reply in replies:
+        email_id = reply.get('email_id')
+        reply_content = reply.get('content', '')
+        
+        if email_id and is_known(email_id) and store.mark_replied(email_id, reply.get('from'), reply_content):
+            EMAILS_REPLIED.inc()
+            logger.info(f"邮件 {email_id} 已收到回复", extra=PER_MAIL)
+            event_forwarder.publish('reply', {
+                'email_id': email_id,
+                'from': reply.get('from'),
+                'subject': reply.get('subject'),
+                'reply_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            })
+            
+            updated += 1
+    return updated
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus格式的指标"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
 @app.route('/stats')
 def get_stats():
     """获取当前统计数据"""
     return {
         'sent': email_stats['sent'],
-        'opened': len(email_stats['opened']),
-        'replied': len(email_stats['replied']),
-        'details': email_stats['details']
+        'opened': store.opened_count,
+        'replied': store.replied_count,
+        'details': store.details()
     }
 
 def save_stats():
     """保存统计数据到文件"""
-    stats_to_save = {
-        'sent': email_stats['sent'],
-        'opened': list(email_stats['opened']),
-        'replied': list(email_stats['replied']),
-        'details': email_stats['details']
-    }
-    
-    with open('logs/email_stats.json', 'w', encoding='utf-8') as f:
-        json.dump(stats_to_save, f, ensure_ascii=False, indent=2)
+    with save_lock:
+        stats_to_save = store.to_state(email_stats['sent'])
+        
+        with open('logs/email_stats.json', 'w', encoding='utf-8') as f:
+            json.dump(stats_to_save, f, ensure_ascii=False, indent=2)
 
 def load_stats():
     """从文件加载统计数据"""
@@ -113,17 +154,15 @@ def load_stats():
         with open('logs/email_stats.json', 'r', encoding='utf-8') as f:
             stats = json.load(f)
             email_stats['sent'] = stats['sent']
-            email_stats['opened'] = set(stats['opened'])
-            email_stats['replied'] = set(stats['replied'])
-            email_stats['details'] = stats['details']
+            store.from_state(stats)
             logger.info("已加载邮件统计数据")
 
 def print_stats_periodically():
     """定期打印统计信息"""
     while True:
         logger.info(f"当前统计: 已发送 {email_stats['sent']} 封, "
-                   f"已打开 {len(email_stats['opened'])} 封, "
-                   f"已回复 {len(email_stats['replied'])} 封")
+                   f"已打开 {store.opened_count} 封, "
+                   f"已回复 {store.replied_count} 封")
         time.sleep(3600)  # 每小时打印一次
 
 if __name__ == '__main__':
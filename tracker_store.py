@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+追踪服务器的紧凑内存状态：每封邮件一行，按列保存在array/bytearray中，不再为每封邮件创建字符串和字典。
+  - 邮件ID按16字节保存（email_ids格式的ID取其二进制值，其他格式取摘要并另存原文），用开放寻址哈希表查找行号
+  - 打开/回复状态为位标志，时间为Unix时间戳（秒），收件人和姓名以UTF-8连续保存
+  - 回复内容和旧状态文件中的其他字段只有少数邮件有，放在按行号索引的字典中
+格式不是邮件ID的打开请求不建行，只记入有上限的LRU，避免扫描器请求让状态无限增长。
+Flask多线程处理请求，公开方法都在同一把锁内执行（新建行、扩容哈希表和导出状态都需要多步完成）。
+
+内存对比见benchmarks/bench_tracker_memory.py。
+"""
+
+import hashlib
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+
+from email_ids import encode_id as encode_text_id, id_bytes, is_legacy_id, legacy_id_text
+
+# 最近出现的未知ID最多保留的个数
+UNKNOWN_ID_LIMIT = int(os.getenv('TRACKER_UNKNOWN_ID_LIMIT', '10000'))
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+ID_SIZE = 16
+OPENED = 1
+REPLIED = 2
+HAS_DETAILS = 4
+# 邮件ID为旧格式（UUID文本），输出时按旧格式还原
+LEGACY_ID = 8
+
+# 字符串列中表示None的起始位置
+NO_STRING = 0xFFFFFFFF
+
+# 哈希表已用槽位超过该比例时扩容
+MAX_LOAD_FACTOR = 0.7
+
+# 旧状态文件details中由列保存的字段，其余字段原样放入extra
+DETAIL_FIELDS = ('recipient', 'name', 'sent_time', 'opened', 'opened_time', 'replied', 'reply_time',
+                 'reply_from', 'reply_content')
+
+
+# 邮件ID转换为16字节的键，返回(键, 是否需要另存原文)
+def encode_id(email_id):
+    key = id_bytes(email_id)
+    if key is not None:
+        return key, False
+    return hashlib.blake2b(email_id.encode('utf-8'), digest_size=ID_SIZE).digest(), True
+
+
+# 时间字符串转换为时间戳，0表示没有时间
+def to_timestamp(value):
+    if not value:
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(datetime.strptime(value, TIME_FORMAT).timestamp())
+    except ValueError:
+        return 0
+
+
+def from_timestamp(value):
+    return datetime.fromtimestamp(value).strftime(TIME_FORMAT) if value else None
+
+
+class StringColumn:
+    """
+    按行保存可为None的字符串：UTF-8内容以\\0结尾连续追加到bytearray，每行只记录4字节的起始位置。
+    收件人和姓名中不会出现\\0，出现时截断到\\0之前。
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+        self.starts = array('I')
+
+    def append(self, value):
+        self.starts.append(NO_STRING)
+        if value is not None:
+            self.set(len(self.starts) - 1, value)
+
+    # 修改时追加新内容，旧内容不回收（收件人和姓名很少修改）
+    def set(self, row, value):
+        if value is None:
+            self.starts[row] = NO_STRING
+            return
+        self.starts[row] = len(self.data)
+        self.data += str(value).encode('utf-8').split(b'\0', 1)[0] + b'\0'
+
+    def get(self, row):
+        start = self.starts[row]
+        if start == NO_STRING:
+            return None
+        return self.data[start:self.data.index(0, start)].decode('utf-8')
+
+    def nbytes(self):
+        return len(self.data) + self.starts.itemsize * len(self.starts)
+
+
+class TrackerStore:
+    """
+    追踪状态。register/mark_opened/mark_replied按邮件ID更新，details()和to_state()生成与旧版
+    email_stats.json相同格式的数据，from_state()读取旧格式。
+    """
+
+    def __init__(self, unknown_limit=UNKNOWN_ID_LIMIT):
+        # 可重入：from_state和to_state在锁内调用其他公开方法
+        self._lock = threading.RLock()
+        self.opened_count = 0
+        self.replied_count = 0
+        self.unknown_limit = unknown_limit
+        self._unknown = OrderedDict()
+
+        # 开放寻址哈希表，槽位保存行号+1，0为空槽位
+        self._slots = array('I', bytes(4 * 1024))
+        self._mask = len(self._slots) - 1
+
+        # 按行保存的列
+        self._keys = bytearray()
+        self._flags = bytearray()
+        self._sent = array('I')
+        self._opened = array('I')
+        self._replied = array('I')
+        self._recipients = StringColumn()
+        self._names = StringColumn()
+
+        # 只有少数行才有的字段：行号 -> 值
+        self._raw_ids = {}
+        self._replies = {}
+        self._extra = {}
+
+    def __len__(self):
+        return len(self._flags)
+
+    def __contains__(self, email_id):
+        key = encode_id(email_id)[0]
+        with self._lock:
+            return self._find(key) is not None
+
+    # 线性探测查找键，返回(行号或None, 槽位下标)。负载不超过MAX_LOAD_FACTOR，最多探测全部槽位一次。
+    # 槽位取键的hash()：UUIDv7开头是时间戳，UUID的版本和变体位固定，直接取字节作下标会让ID挤在一起
+    def _probe(self, key):
+        slots = self._slots
+        mask = self._mask
+        index = hash(key) & mask
+        for _ in range(len(slots)):
+            row = slots[index] - 1
+            if row < 0:
+                return None, index
+            offset = row * ID_SIZE
+            if self._keys[offset:offset + ID_SIZE] == key:
+                return row, index
+            index = (index + 1) & mask
+        raise RuntimeError(f"哈希表已满（{len(slots)} 个槽位）")
+
+    def _find(self, key):
+        return self._probe(key)[0]
+
+    # 已用槽位超过MAX_LOAD_FACTOR时扩容为两倍并重新插入
+    def _grow(self):
+        self._slots = array('I', bytes(4 * len(self._slots) * 2))
+        self._mask = len(self._slots) - 1
+        for row in range(len(self)):
+            key = bytes(self._keys[row * ID_SIZE:(row + 1) * ID_SIZE])
+            self._slots[self._probe(key)[1]] = row + 1
+
+    # 找到邮件对应的行，没有时新建
+    def _row(self, email_id):
+        key, keep_raw = encode_id(email_id)
+        row, index = self._probe(key)
+        if row is not None:
+            return row
+
+        row = len(self)
+        self._keys += key
+        self._flags.append(0)
+        self._sent.append(0)
+        self._opened.append(0)
+        self._replied.append(0)
+        self._recipients.append(None)
+        self._names.append(None)
+        if keep_raw:
+            self._raw_ids[row] = email_id
+        elif is_legacy_id(email_id):
+            self._flags[row] |= LEGACY_ID
+        self._slots[index] = row + 1
+        if row + 1 > len(self._slots) * MAX_LOAD_FACTOR:
+            self._grow()
+        return row
+
+    def _email_id(self, row):
+        if row in self._raw_ids:
+            return self._raw_ids[row]
+        key = self._keys[row * ID_SIZE:(row + 1) * ID_SIZE]
+        return legacy_id_text(key) if self._flags[row] & LEGACY_ID else encode_text_id(key)
+
+    def register(self, email_id, recipient=None, name=None, sent_time=None):
+        """记录邮件详情（收件人、姓名、发送时间），details()中只包含记录过详情的邮件"""
+        with self._lock:
+            row = self._row(email_id)
+            self._flags[row] |= HAS_DETAILS
+            self._recipients.set(row, recipient)
+            self._names.set(row, name)
+            self._sent[row] = to_timestamp(sent_time)
+            return row
+
+    def mark_opened(self, email_id, open_time=None):
+        """记录打开，首次打开时返回True。open_time为None时取当前时间，0表示时间未知"""
+        with self._lock:
+            row = self._row(email_id)
+            if self._flags[row] & OPENED:
+                return False
+            self._flags[row] |= OPENED
+            self._opened[row] = int(datetime.now().timestamp()) if open_time is None else to_timestamp(open_time)
+            self.opened_count += 1
+            return True
+
+    def mark_replied(self, email_id, reply_from=None, reply_content='', reply_time=None):
+        """记录回复，首次回复时返回True。reply_time的含义与mark_opened的open_time相同"""
+        with self._lock:
+            row = self._row(email_id)
+            if self._flags[row] & REPLIED:
+                return False
+            self._flags[row] |= REPLIED
+            self._replied[row] = int(datetime.now().timestamp()) if reply_time is None else to_timestamp(reply_time)
+            # 回复内容只在details()中输出，没有详情的邮件不保存
+            if self._flags[row] & HAS_DETAILS:
+                self._replies[row] = (reply_from, reply_content)
+            self.replied_count += 1
+            return True
+
+    def note_unknown(self, email_id):
+        """记录一个未知ID的请求，最近未出现过时返回True（用于只记一次日志）"""
+        with self._lock:
+            if email_id in self._unknown:
+                self._unknown.move_to_end(email_id)
+                return False
+            self._unknown[email_id] = None
+            if len(self._unknown) > self.unknown_limit:
+                self._unknown.popitem(last=False)
+            return True
+
+    def _detail(self, row):
+        flags = self._flags[row]
+        detail = {
+            'recipient': self._recipients.get(row),
+            'name': self._names.get(row),
+            'sent_time': from_timestamp(self._sent[row]),
+            'opened': bool(flags & OPENED),
+            'replied': bool(flags & REPLIED)
+        }
+        if flags & OPENED:
+            detail['opened_time'] = from_timestamp(self._opened[row])
+        if flags & REPLIED:
+            reply_from, reply_content = self._replies.get(row, (None, ''))
+            detail['reply_time'] = from_timestamp(self._replied[row])
+            detail['reply_from'] = reply_from
+            detail['reply_content'] = reply_content
+        detail.update(self._extra.get(row, {}))
+        return detail
+
+    def details(self):
+        """每封记录过详情的邮件的状态，格式与旧版email_stats['details']一致"""
+        with self._lock:
+            return {self._email_id(row): self._detail(row)
+                    for row in range(len(self)) if self._flags[row] & HAS_DETAILS}
+
+    def _ids_with(self, flag):
+        return [self._email_id(row) for row in range(len(self)) if self._flags[row] & flag]
+
+    def to_state(self, sent):
+        """生成与旧版logs/email_stats.json相同格式的数据"""
+        with self._lock:
+            return {
+                'sent': sent,
+                'opened': self._ids_with(OPENED),
+                'replied': self._ids_with(REPLIED),
+                'details': self.details()
+            }
+
+    def from_state(self, state):
+        """读取旧版logs/email_stats.json的opened、replied和details"""
+        with self._lock:
+            for email_id, detail in state.get('details', {}).items():
+                row = self.register(email_id, detail.get('recipient'), detail.get('name'), detail.get('sent_time'))
+                if detail.get('opened'):
+                    self.mark_opened(email_id, detail.get('opened_time') or 0)
+                if detail.get('replied'):
+                    self.mark_replied(email_id, detail.get('reply_from'), detail.get('reply_content', ''),
+                                      detail.get('reply_time') or 0)
+                extra = {key: value for key, value in detail.items() if key not in DETAIL_FIELDS}
+                if extra:
+                    self._extra[row] = extra
+            for email_id in state.get('opened', []):
+                self.mark_opened(email_id, 0)
+            for email_id in state.get('replied', []):
+                self.mark_replied(email_id, reply_time=0)
+            return self
+
+    def nbytes(self):
+        """列和哈希表占用的字节数（不含稀疏字典）"""
+        with self._lock:
+            arrays = (self._slots, self._sent, self._opened, self._replied)
+            return (len(self._keys) + len(self._flags) + sum(a.itemsize * len(a) for a in arrays)
+                    + self._recipients.nbytes() + self._names.nbytes())